@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""Measures the broadcast path: server memory per connection and time to push
+one update to every connection.
+
+Clients run in a separate process so only server side allocations are
+traced. Run from the backend directory:
+
+    python -m benchmarks.fanout --connections 10000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+import tracemalloc
+
+import numpy as np
+import websockets
+
+from fanout import Broadcaster
+from protocol import BINARY_SUBPROTOCOL, DELTA, FULL, Update
+
+
+def run_clients(port: int, connections: int, subprotocol, ready, done) -> None:
+    """Open `connections` websocket clients and keep draining them until
+    `done` is set."""
+
+    async def client(opened):
+        subprotocols = [subprotocol] if subprotocol else None
+        async with websockets.connect(
+            f"ws://localhost:{port}/", subprotocols=subprotocols, compression=None
+        ) as websocket:
+            opened.append(websocket)
+            async for _message in websocket:
+                pass
+
+    async def main():
+        opened = []
+        tasks = [asyncio.create_task(client(opened)) for _ in range(connections)]
+        while len(opened) < connections:
+            await asyncio.sleep(0.1)
+        ready.set()
+        while not done.is_set():
+            await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+
+    asyncio.run(main())
+
+
+async def measure(connections: int, width: int, height: int, subprotocol, updates: int):
+    broadcaster = Broadcaster(lambda: None)
+
+    async def handler(websocket):
+        broadcaster.add(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            broadcaster.remove(websocket)
+
+    tracemalloc.start()
+    async with websockets.serve(handler, "localhost", 0, compression=None) as server:
+        port = server.sockets[0].getsockname()[1]
+        baseline = tracemalloc.take_snapshot()
+        ready, done = multiprocessing.Event(), multiprocessing.Event()
+        clients = multiprocessing.Process(
+            target=run_clients, args=(port, connections, subprotocol, ready, done)
+        )
+        clients.start()
+        while not ready.is_set() or len(broadcaster) < connections:
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(0.5)
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocated = sum(
+            stat.size_diff for stat in snapshot.compare_to(baseline, "filename")
+        )
+
+        frame = np.random.randint(0, 216, width * height).astype(np.uint8)
+        results = {}
+        for kind in (FULL, DELTA):
+            durations = []
+            for seq in range(updates):
+                if kind == FULL:
+                    update = Update(FULL, seq, (width, height), frame, {})
+                else:
+                    indices = np.random.choice(width * height, 16, replace=False)
+                    update = Update(
+                        DELTA, seq, (width, height), frame[indices], {}, indices=indices
+                    )
+                start = time.perf_counter()
+                broadcaster.broadcast(update)
+                durations.append(time.perf_counter() - start)
+                # Let the transports flush before the next update
+                await asyncio.sleep(0.05)
+            results[kind] = (np.median(durations), len(update.encode(subprotocol)))
+        done.set()
+        clients.join()
+
+    print(f"{connections} connections, {width}x{height}, subprotocol={subprotocol}")
+    print(f"  memory per connection: {allocated / connections / 1024:.1f} KiB")
+    for kind, (duration, size) in results.items():
+        print(
+            f"  {kind:5} {size:6} B: {duration * 1e3:8.3f} ms per broadcast, "
+            f"{duration / connections * 1e6:.2f} us per connection"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c", "--connections", type=int, help="Connected clients", default=1000
+    )
+    parser.add_argument("--width", type=int, help="Canvas width", default=64)
+    parser.add_argument("--height", type=int, help="Canvas height", default=64)
+    parser.add_argument(
+        "-b", "--binary", help="Use the binary subprotocol", action="store_true"
+    )
+    parser.add_argument(
+        "-u", "--updates", type=int, help="Updates broadcast per kind", default=20
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(
+        measure(
+            args.connections,
+            args.width,
+            args.height,
+            BINARY_SUBPROTOCOL if args.binary else None,
+            args.updates,
+        )
+    )
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""Times the hot paths of a server tick, to tell whether a change helps.
+
+Covers GameManager.game_frame, GameManager.owners, broadcast_game_state
+(encoding both protocols and publishing), PubSub.publish to 1 to 10k
+subscribers, and Game.update of every game that can be imported, at several
+canvas sizes. Results are saved as JSON and can be compared with a previous
+run, failing when a benchmark got slower than the threshold. Run from the
+backend directory:
+
+    python -m benchmarks.micro --save baseline.json
+    python -m benchmarks.micro --compare baseline.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+from collections import deque
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from commandlog import disable_clock
+from games.game_config import GAMES as GAME_CONFIG
+from utils import PubSub
+from wsserver import GameManager, get_game_class
+
+SIZES = ((32, 32), (64, 64), (128, 128))
+SUBSCRIBERS = (1, 100, 10000)
+
+
+class Benchmark(NamedTuple):
+    """`run` is timed, `prepare` (untimed) runs before each call and `close`
+    once done."""
+
+    name: str
+    run: Callable[[], object]
+    prepare: Callable[[], object] | None = None
+    close: Callable[[], object] | None = None
+
+
+def measure(benchmark: Benchmark, min_time: float = 0.2, min_calls: int = 5) -> dict:
+    """Call `benchmark` for at least `min_time` seconds and `min_calls`
+    times, timing each call. Durations in microseconds."""
+    durations = []
+    start = time.perf_counter()
+    while len(durations) < min_calls or time.perf_counter() - start < min_time:
+        if benchmark.prepare is not None:
+            benchmark.prepare()
+        call_start = time.perf_counter()
+        benchmark.run()
+        durations.append(time.perf_counter() - call_start)
+    durations = np.array(durations) * 1e6
+    return {
+        "calls": len(durations),
+        "median_us": float(np.median(durations)),
+        "min_us": float(durations.min()),
+        "mean_us": float(durations.mean()),
+    }
+
+
+def playing(game_name: str, width: int, height: int):
+    """A new game, and a function starting over once it's finished."""
+    game_class = get_game_class(game_name)
+    state = {"game": game_class(width=width, height=height, framerate=1000)}
+
+    def game():
+        if state["game"].finished:
+            state["game"] = game_class(width=width, height=height, framerate=1000)
+        return state["game"]
+
+    return game
+
+
+def game_benchmarks(game_name: str, width: int, height: int):
+    game = playing(game_name, width, height)
+    yield Benchmark(f"{game_name}.update[{width}x{height}]", lambda: game().update())
+
+    encoded = PubSub()
+
+    def publish(update, keyframe):
+        # As served: every update gets encoded for both protocols
+        update.json  # pylint:disable=pointless-statement
+        update.binary  # pylint:disable=pointless-statement
+        encoded.publish(update, keyframe)
+
+    manager = GameManager(game(), deque(), publish)
+    manager.broadcast_game_state()
+
+    def next_frame():
+        """Play until the frame changes, so there's a delta to broadcast."""
+        before = manager.game_frame().copy()
+        for _ in range(1000):
+            if manager.game is not game():
+                manager.game = game()
+            manager.game.update()
+            if not np.array_equal(manager.game_frame(), before):
+                return
+
+    yield Benchmark(f"{game_name}.game_frame[{width}x{height}]", manager.game_frame, next_frame)
+    yield Benchmark(f"{game_name}.owners[{width}x{height}]", manager.owners, next_frame)
+    yield Benchmark(
+        f"{game_name}.broadcast_delta[{width}x{height}]", manager.broadcast_game_state, next_frame
+    )
+
+    yield Benchmark(
+        f"{game_name}.broadcast_keyframe[{width}x{height}]",
+        manager.broadcast_game_state,
+        manager.request_keyframe,
+    )
+
+
+def pubsub_benchmark(subscribers: int) -> Benchmark:
+    """Publish one value and wait until every subscriber got it."""
+    loop = asyncio.new_event_loop()
+    pubsub = PubSub()
+    state = {"pending": 0, "done": None}
+
+    async def subscriber(subscription):
+        async for _value in subscription:
+            state["pending"] -= 1
+            if not state["pending"]:
+                state["done"].set_result(None)
+
+    async def subscribe():
+        return [
+            asyncio.create_task(subscriber(pubsub.subscribe(conflate=True)))
+            for _ in range(subscribers)
+        ]
+
+    tasks = loop.run_until_complete(subscribe())
+    loop.run_until_complete(asyncio.sleep(0))  # Let them all wait
+
+    async def deliver():
+        state["pending"], state["done"] = subscribers, loop.create_future()
+        pubsub.publish(None)
+        await state["done"]
+
+    def close():
+        # Also keeps the subscriber tasks alive until then, the loop only has weak references
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+
+    return Benchmark(
+        f"pubsub.publish[{subscribers}]", lambda: loop.run_until_complete(deliver()), close=close
+    )
+
+
+def benchmarks(sizes=SIZES, subscribers=SUBSCRIBERS):
+    """Every benchmark, games that can't be imported are skipped."""
+    for count in subscribers:
+        yield pubsub_benchmark(count)
+    for game_name in GAME_CONFIG:
+        try:
+            get_game_class(game_name)
+        except ImportError as exc:
+            print(f"Skipping {game_name}: {exc}", file=sys.stderr)
+            continue
+        for width, height in sizes:
+            yield from game_benchmarks(game_name, width, height)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Names of the benchmarks more than `threshold` (a fraction) slower
+    than in `baseline`, printing the comparison of each."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:45} {result['median_us']:12.1f} us (new)")
+            continue
+        before = baseline[name]["median_us"]
+        change = result["median_us"] / before - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:45} {result['median_us']:12.1f} us {before:12.1f} us {change:+8.1%}"
+            + (" REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+def run(pattern: str = "", min_time: float = 0.2, sizes=SIZES, subscribers=SUBSCRIBERS) -> dict:
+    """Run the benchmarks whose name contains `pattern`."""
+    disable_clock()
+    results = {}
+    for benchmark in benchmarks(sizes, subscribers):
+        if pattern in benchmark.name:
+            results[benchmark.name] = measure(benchmark, min_time)
+        if benchmark.close is not None:
+            benchmark.close()
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", "--filter", help="Only benchmarks whose name contains this", default="")
+    parser.add_argument(
+        "-t", "--min-time", type=float, help="Seconds spent timing each benchmark", default=0.2
+    )
+    parser.add_argument("-s", "--save", help="Save the results to this JSON file")
+    parser.add_argument("-c", "--compare", help="Compare with the results saved in this JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="Slowdown, as a fraction of the baseline, counted as a regression",
+        default=0.1,
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args.filter, args.min_time)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        regressions = []
+        for name, result in results.items():
+            print(f"{name:45} {result['median_us']:12.1f} us (min {result['min_us']:.1f}, {result['calls']} calls)")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as results_file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "machine": platform.machine(),
+                    "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "results": results,
+                },
+                results_file,
+                indent=2,
+            )
+    if regressions:
+        print(f"{len(regressions)} regressions over {args.threshold:.0%}")
+        sys.exit(1)
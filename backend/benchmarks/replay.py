@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""Replays games logged by the server, as fast as they go.
+
+The server logs the commands of deterministic games (see wsserver
+--command-log and commandlog). Replaying a log plays the same ticks again,
+with the same seed and commands, through GameManager (frame diffing and
+encoding both protocols included), without sleeping or sockets. It reports
+tick timings, and whether the game ended up where the server's did. Real
+traffic thus makes a repeatable benchmark, and slow ticks seen in
+production can be reproduced, and profiled, offline. Run from the backend
+directory:
+
+    python -m benchmarks.replay commands/tetris/*.log
+    python -m cProfile -o replay.prof -m benchmarks.replay commands/tetris/1700000000.log
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+import commandlog
+import snapshots
+from wsserver import GameManager, get_game_class
+
+
+def replay(path: str) -> dict:
+    """Play the game logged at `path` again."""
+    log = commandlog.read(path)
+    header = log.header
+    width, height = header["resolution"]
+    commands = deque()
+    published = {"updates": 0, "keyframes": 0, "bytes": 0}
+
+    def publish(update, keyframe):
+        published["updates"] += 1
+        published["keyframes"] += keyframe
+        published["bytes"] += len(update.json) + len(update.binary)
+
+    durations = []
+    seeded = commandlog.SeededRandom(header["seed"])
+    with seeded:
+        game = get_game_class(header["game"])(width=width, height=height, framerate=header["framerate"])
+        if header.get("snapshot"):
+            snapshot = os.path.join(os.path.dirname(path), header["snapshot"])
+            if not os.path.isdir(snapshot):
+                raise FileNotFoundError(f"The game starts from snapshot {snapshot}, it's missing")
+            snapshots.restore(game, snapshots.load(snapshot))
+        manager = GameManager(game, commands, publish, full_state_interval=header["keyframe_interval"])
+        start = time.perf_counter()
+        for tick_commands in log.ticks:
+            commands.extend(tick_commands)
+            tick_start = time.perf_counter()
+            manager.tick()
+            durations.append(time.perf_counter() - tick_start)
+        elapsed = time.perf_counter() - start
+
+    durations = np.array(durations or [0.0]) * 1e3
+    reached = commandlog.End(len(log.ticks), manager.sequence, commandlog.frame_checksum(manager.last_frame))
+    return {
+        "path": path,
+        "game": header["game"],
+        "ticks": len(log.ticks),
+        "commands": sum(map(len, log.ticks)),
+        "seconds": elapsed,
+        "tick_ms": {
+            "mean": float(durations.mean()),
+            "p50": float(np.percentile(durations, 50)),
+            "p99": float(np.percentile(durations, 99)),
+            "max": float(durations.max()),
+            "slowest": int(durations.argmax()),
+        },
+        **published,
+        # None when the log was cut short, there's nothing to compare with
+        "matches": None if log.end is None else reached == log.end,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("logs", nargs="+", help="Command logs to replay")
+    parser.add_argument(
+        "-n", "--repeat", type=int, help="Replay each log N times, reporting each run", default=1
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    commandlog.disable_clock()
+    failed = False
+    for log_path in args.logs:
+        for _ in range(args.repeat):
+            try:
+                result = replay(log_path)
+            except (OSError, ValueError) as exc:
+                print(f"{log_path}: can't replay: {exc}", file=sys.stderr)
+                failed = True
+                break
+            timings = result["tick_ms"]
+            outcome = {None: "cut short", True: "same end", False: "DIVERGED"}[result["matches"]]
+            failed |= result["matches"] is False
+            print(
+                f"{log_path}: {result['ticks']} ticks, {result['commands']} commands, "
+                f"{result['ticks'] / max(result['seconds'], 1e-9):.0f} ticks/s, "
+                f"tick p50 {timings['p50']:.3f} ms p99 {timings['p99']:.3f} ms "
+                f"max {timings['max']:.3f} ms (tick {timings['slowest']}), {outcome}"
+            )
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""Plays many seeded games headless, in parallel, as fast as they go.
+
+Each game is driven like the server does (GameManager ticks: queued clicks,
+game update, frame diffing and encoding) by a synthetic stream of random
+clicks, with the pygame clock disabled. Per game it reports tick timings and
+the outcome, and can save the final frames to look for pathological states.
+Runs are reproducible: the same seed plays the same game. Run from the
+backend directory:
+
+    python -m benchmarks.soak --game tetris --games 100 --output soak/
+"""
+import argparse
+import json
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+from PIL import Image
+
+from commandlog import disable_clock
+from commands import Command
+from games import palette
+from games.game_config import GAMES as GAME_CONFIG
+from wsserver import GameManager, get_game_class, get_game_config
+
+
+def play(game_name: str, seed: int, max_ticks: int, clicks_per_tick: float, users: int, framerate: float) -> dict:
+    """Play one game until it's over or `max_ticks`."""
+    random.seed(seed)
+    np.random.seed(seed)
+    rng = np.random.default_rng(seed)
+    config = get_game_config(game_name)
+    width, height = config["width"], config["height"]
+    game = get_game_class(game_name)(width=width, height=height, framerate=framerate)
+
+    commands = deque()
+    published = {"updates": 0, "keyframes": 0, "bytes": 0}
+
+    def publish(update, keyframe):
+        published["updates"] += 1
+        published["keyframes"] += keyframe
+        published["bytes"] += len(update.binary)
+
+    manager = GameManager(game, commands, publish)
+    durations = []
+    start = time.perf_counter()
+    while len(durations) < max_ticks and not manager.game_over():
+        clicks = rng.poisson(clicks_per_tick)
+        for x, y, user in zip(
+            rng.integers(0, width, clicks).tolist(),
+            rng.integers(0, height, clicks).tolist(),
+            rng.integers(0, users, clicks).tolist(),
+        ):
+            commands.append(Command(x, y, f"bot{user}"))
+        tick_start = time.perf_counter()
+        manager.tick()
+        durations.append(time.perf_counter() - tick_start)
+    elapsed = time.perf_counter() - start
+
+    durations = np.array(durations) * 1e3
+    return {
+        "game": game_name,
+        "seed": seed,
+        "ticks": len(durations),
+        "finished": manager.game_over(),
+        "score": getattr(game, "score", None),
+        "seconds": elapsed,
+        "tick_ms": {
+            "mean": float(durations.mean()),
+            "p50": float(np.percentile(durations, 50)),
+            "p99": float(np.percentile(durations, 99)),
+            "max": float(durations.max()),
+        },
+        **published,
+        "frame": manager.last_frame.reshape(height, width),
+    }
+
+
+def run(game_name: str, games: int, first_seed: int, jobs: int, output: str | None, **options) -> list[dict]:
+    """Play `games` games in `jobs` processes, print and save the results."""
+    with ProcessPoolExecutor(jobs, mp_context=get_context("spawn"), initializer=disable_clock) as pool:
+        futures = [
+            pool.submit(play, game_name, seed, **options)
+            for seed in range(first_seed, first_seed + games)
+        ]
+        results = [future.result() for future in futures]
+
+    for result in results:
+        print(
+            f"seed {result['seed']:5}: {result['ticks']:6} ticks, "
+            f"{'over' if result['finished'] else 'cut '}, score {result['score']}, "
+            f"tick p50 {result['tick_ms']['p50']:.3f} ms p99 {result['tick_ms']['p99']:.3f} ms "
+            f"max {result['tick_ms']['max']:.3f} ms"
+        )
+    ticks = sum(result["ticks"] for result in results)
+    busy = sum(result["seconds"] for result in results)
+    slowest = max(results, key=lambda result: result["tick_ms"]["max"])
+    print(
+        f"{games} games, {ticks} ticks, {ticks / busy:.0f} ticks/s per process, "
+        f"slowest tick {slowest['tick_ms']['max']:.3f} ms (seed {slowest['seed']})"
+    )
+
+    if output:
+        os.makedirs(output, exist_ok=True)
+        for result in results:
+            image = Image.fromarray(result["frame"], mode="P")
+            image.putpalette(palette.PALETTE.tobytes())
+            image.save(os.path.join(output, f"{game_name}-{result['seed']}.png"))
+        with open(os.path.join(output, f"{game_name}.json"), "w", encoding="utf-8") as summary:
+            json.dump([{k: v for k, v in r.items() if k != "frame"} for r in results], summary, indent=2)
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--game", choices=GAME_CONFIG, help="Game to play", default="tetris")
+    parser.add_argument("-n", "--games", type=int, help="Games to play", default=100)
+    parser.add_argument("-s", "--seed", type=int, help="Seed of the first game", default=0)
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="Worker processes", default=os.cpu_count()
+    )
+    parser.add_argument(
+        "-t", "--max-ticks", type=int, help="Stop games still running after N ticks", default=10000
+    )
+    parser.add_argument(
+        "-c", "--clicks-per-tick", type=float, help="Average clicks per tick", default=1.0
+    )
+    parser.add_argument("-u", "--users", type=int, help="Distinct clicking users", default=10)
+    parser.add_argument(
+        "-f", "--framerate", type=float, help="Framerate the games are created with", default=30
+    )
+    parser.add_argument(
+        "-o", "--output", help="Save final frames and a JSON summary in this directory"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run(
+        args.game,
+        args.games,
+        args.seed,
+        args.jobs,
+        args.output,
+        max_ticks=args.max_ticks,
+        clicks_per_tick=args.clicks_per_tick,
+        users=args.users,
+        framerate=args.framerate,
+    )
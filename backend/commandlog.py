@@ -0,0 +1,188 @@
+"""Deterministic games: seeded randomness and logs of the commands applied.
+
+Games draw from the global `random` and `np.random` generators and may pace
+themselves with pygame.time.Clock. In deterministic mode each game gets its
+own seeded generators (see SeededRandom), the clock is disabled, and the
+commands applied in each tick are appended to a binary log. Replaying the
+log (see benchmarks.replay) then plays the exact same game, as fast as it
+goes. A log holds one game:
+
+    MAGIC, header length (uint32), header (JSON: game, resolution, seed...)
+    b"T" commands (uint32), new users (uint32)  one record per tick
+         new users (uint16 length + UTF-8 name each)
+         x, y (int32 each) and user (uint32, in order of appearance)
+    b"E" ticks, last sequence, CRC-32 of the last frame (uint32 each)
+
+Every tick is logged, commands or not, as games change with every update.
+The end record is written when the log is closed. A log cut short (say the
+server crashed) replays up to its last whole tick.
+"""
+import json
+import os
+import random
+import struct
+import threading
+import zlib
+from typing import NamedTuple
+
+import numpy as np
+
+from commands import Command
+
+MAGIC = b"CANVASLOG2\n"
+HEADER = struct.Struct("<I")
+TICK = struct.Struct("<cII")
+NAME = struct.Struct("<H")
+END = struct.Struct("<cIII")
+
+
+class NoClock:
+    """Stands in for pygame.time.Clock: ticks return at once."""
+
+    def __init__(self) -> None:
+        self.time = 0
+
+    def tick(self, framerate: float = 0) -> int:
+        return 0
+
+    tick_busy_loop = tick
+
+    def get_time(self) -> int:
+        return 0
+
+    def get_fps(self) -> float:
+        return 0.0
+
+
+def disable_clock() -> None:
+    """Games can't pace themselves nor open a window. Also a worker
+    initializer."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    try:
+        import pygame  # pylint:disable=import-outside-toplevel
+    except ImportError:
+        return
+    pygame.time.Clock = NoClock
+
+
+class SeededRandom:
+    """The random generators of one game, seeded with `seed`. Swapped in for
+    the global ones inside `with` blocks, so games sharing a thread (see
+    InlineExecutor) don't draw from each other's sequence. The blocks of all
+    the games run one at a time, games in threads of their own (see
+    ThreadExecutor) would swap them under each other's feet otherwise."""
+
+    # The global generators are per process
+    _lock = threading.Lock()
+
+    def __init__(self, seed: int) -> None:
+        self.seed = seed
+        self._states = random.Random(seed).getstate(), np.random.RandomState(seed).get_state()
+        self._saved = None
+
+    def __enter__(self) -> "SeededRandom":
+        self._lock.acquire()  # pylint:disable=consider-using-with
+        self._saved = random.getstate(), np.random.get_state()
+        random.setstate(self._states[0])
+        np.random.set_state(self._states[1])
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self._states = random.getstate(), np.random.get_state()
+        random.setstate(self._saved[0])
+        np.random.set_state(self._saved[1])
+        self._saved = None
+        self._lock.release()
+
+
+def frame_checksum(frame: np.ndarray | None) -> int:
+    return zlib.crc32(b"" if frame is None else np.ascontiguousarray(frame).tobytes())
+
+
+class CommandLog:
+    """Appends the commands of each tick to a new log at `path`, see
+    GameManager.tick. `header` describes how to play the game again."""
+
+    def __init__(self, path: str, header: dict) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.ticks = 0
+        self._users = {}  # Name: id in this log
+        self._file = open(path, "xb")  # pylint:disable=consider-using-with
+        encoded = json.dumps(header).encode()
+        self._file.write(MAGIC + HEADER.pack(len(encoded)) + encoded)
+
+    def write(self, commands: list[Command]) -> None:
+        """Log the commands applied in a tick, in order."""
+        users = self._users
+        new_users = [user for user in dict.fromkeys(command.user for command in commands) if user not in users]
+        parts = [TICK.pack(b"T", len(commands), len(new_users))]
+        for user in new_users:
+            users[user] = len(users)
+            encoded = user.encode()
+            parts += (NAME.pack(len(encoded)), encoded)
+        if commands:
+            count = len(commands)
+            parts += (
+                np.fromiter((command.x for command in commands), "<i4", count).tobytes(),
+                np.fromiter((command.y for command in commands), "<i4", count).tobytes(),
+                np.fromiter((users[command.user] for command in commands), "<u4", count).tobytes(),
+            )
+        self._file.write(b"".join(parts))
+        # Handed to the OS every tick, so a crash loses nothing
+        self._file.flush()
+        self.ticks += 1
+
+    def close(self, sequence: int, frame: np.ndarray | None) -> None:
+        """End the log with the state the game reached, to check replays."""
+        if self._file.closed:
+            return
+        self._file.write(END.pack(b"E", self.ticks, sequence, frame_checksum(frame)))
+        self._file.close()
+
+
+class End(NamedTuple):
+    ticks: int
+    sequence: int
+    checksum: int
+
+
+class Log(NamedTuple):
+    header: dict
+    ticks: list[list[Command]]
+    end: End | None  # None if the log was cut short
+
+
+def read(path: str) -> Log:
+    """Read a whole log, see CommandLog."""
+    with open(path, "rb") as log_file:
+        data = log_file.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"Not a command log: {path}")
+    offset = len(MAGIC)
+    (length,) = HEADER.unpack_from(data, offset)
+    offset += HEADER.size
+    header = json.loads(data[offset : offset + length])
+    offset += length
+    ticks, users, end = [], [], None
+    try:
+        while offset < len(data):
+            kind = data[offset : offset + 1]
+            if kind == b"E":
+                end = End(*END.unpack_from(data, offset)[1:])
+                break
+            _kind, count, new_users = TICK.unpack_from(data, offset)
+            offset += TICK.size
+            for _ in range(new_users):
+                (length,) = NAME.unpack_from(data, offset)
+                offset += NAME.size
+                users.append(data[offset : offset + length].decode())
+                offset += length
+            xs = np.frombuffer(data, "<i4", count, offset)
+            ys = np.frombuffer(data, "<i4", count, offset + 4 * count)
+            ids = np.frombuffer(data, "<u4", count, offset + 8 * count)
+            offset += 12 * count
+            ticks.append([Command(x, y, users[user]) for x, y, user in zip(xs.tolist(), ys.tolist(), ids.tolist())])
+    except (struct.error, ValueError, IndexError):
+        pass  # Cut short in the middle of a tick
+    return Log(header, ticks, end)
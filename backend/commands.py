@@ -0,0 +1,76 @@
+"""User commands (clicks) received from clients.
+
+Messages are parsed and validated as they arrive, in the connection handlers,
+so the game tick only deals with well formed Command records.
+"""
+import itertools
+import json
+from typing import NamedTuple
+
+MAX_USER_LENGTH = 100
+# Message clients send to ask for a full state, e.g. after a sequence gap
+KEYFRAME_REQUEST = {"type": "keyframe"}
+
+
+class CommandError(ValueError):
+    """Message is not a valid command."""
+
+
+class Command(NamedTuple):
+    """A click on pixel (x, y) by `user`."""
+
+    x: int
+    y: int
+    user: str
+
+
+def parse_message(message: str | bytes, resolution: tuple[int, int] | None) -> Command | None:
+    """Parse a client message: a command like {"x": 1, "y": 2, "user":
+    "name"}, checking that the pixel lies within `resolution`, or None for a
+    keyframe request (see KEYFRAME_REQUEST), however it's formatted.
+    Commands can't be checked without `resolution`, they're rejected."""
+    try:
+        data = json.loads(message)
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise CommandError(f"Not JSON: {message!r:.100}") from exc
+    if isinstance(data, dict) and data.get("type") == KEYFRAME_REQUEST["type"]:
+        return None
+    if resolution is None:
+        raise CommandError("Commands before the first frame")
+    return _command(data, message, resolution)
+
+
+def _command(data, message: str | bytes, resolution: tuple[int, int]) -> Command:
+    if not isinstance(data, dict) or not data.keys() >= {"x", "y", "user"}:
+        raise CommandError(f"Missing x, y or user: {message!r:.100}")
+
+    x, y, user = data["x"], data["y"], data["user"]
+    # bool is an int subclass, but not a coordinate
+    if type(x) is not int or type(y) is not int:
+        raise CommandError(f"Coordinates must be integers: {x!r:.20}, {y!r:.20}")
+    width, height = resolution
+    if not (0 <= x < width and 0 <= y < height):
+        raise CommandError(f"Out of bounds: {x}, {y}")
+    if not isinstance(user, str) or len(user) > MAX_USER_LENGTH:
+        raise CommandError(f"Invalid user: {user!r:.100}")
+    return Command(x, y, user)
+
+
+def coalesce(commands: list[Command], per_user: int, limit: int | None = None) -> list[Command]:
+    """The commands of a tick worth applying: repeated clicks on a pixel are
+    dropped, each user keeps at most `per_user` clicks, and users take turns,
+    in order of their first click, up to `limit` commands in total."""
+    targets = set()
+    by_user: dict[str, list[Command]] = {}
+    for command in commands:
+        target = command.x, command.y
+        if target in targets:
+            continue
+        clicks = by_user.setdefault(command.user, [])
+        if len(clicks) < per_user:
+            targets.add(target)
+            clicks.append(command)
+    turns = itertools.zip_longest(*by_user.values())
+    return list(itertools.islice(
+        (command for turn in turns for command in turn if command is not None), limit
+    ))
@@ -0,0 +1,152 @@
+"""Where the game simulation runs.
+
+A simulation is a callable taking a command queue (a deque) and a
+`publish(update, keyframe)` callable. It returns an iterator that advances the
+game and yields the seconds to wait before the next tick.
+
+- InlineExecutor runs it on the event loop, between network I/O.
+- ThreadExecutor runs it in a worker thread.
+- ProcessExecutor runs it in a worker process.
+
+With workers, updates are encoded for every wire format before being handed
+to the event loop, so network I/O latency doesn't depend on how expensive a
+game frame is to produce. Either way commands are submitted, and updates
+published, on the event loop.
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterator
+
+Simulation = Callable[[deque, Callable], Iterator[float]]
+
+
+class InlineExecutor:
+    """Runs the simulation on the event loop."""
+
+    name = "inline"
+
+    def __init__(self, simulation: Simulation, publish: Callable) -> None:
+        self.simulation = simulation
+        self.publish = publish
+        self.commands = deque()
+
+    def submit(self, command) -> None:
+        self.commands.append(command)
+
+    async def run(self) -> None:
+        for delay in self.simulation(self.commands, self.publish):
+            # Yield even when late, so network I/O keeps flowing on overruns
+            await asyncio.sleep(delay)
+
+
+class ThreadExecutor(InlineExecutor):
+    """Runs the simulation in a daemon worker thread."""
+
+    name = "thread"
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        stop = threading.Event()
+
+        def publish(update, keyframe):
+            update.prepare()
+            loop.call_soon_threadsafe(self.publish, update, keyframe)
+
+        def run():
+            try:
+                for delay in self.simulation(self.commands, publish):
+                    if stop.wait(delay):
+                        return
+            except BaseException as exc:  # pylint:disable=broad-except
+                loop.call_soon_threadsafe(done.set_exception, exc)
+
+        threading.Thread(target=run, name="simulation", daemon=True).start()
+        try:
+            await done
+        finally:
+            stop.set()
+
+
+class ProcessExecutor:
+    """Runs the simulation in a worker process. Commands and updates are
+    pickled through a queue and a pipe, so `simulation` must be picklable."""
+
+    name = "process"
+
+    def __init__(self, simulation: Simulation, publish: Callable) -> None:
+        self.simulation = simulation
+        self.publish = publish
+        self.context = multiprocessing.get_context("spawn")
+        self.commands = self.context.Queue()
+
+    def submit(self, command) -> None:
+        self.commands.put(command)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=run_simulation_process,
+            args=(self.simulation, self.commands, sender),
+            name="simulation",
+            daemon=True,
+        )
+        process.start()
+        sender.close()
+        try:
+            while True:
+                try:
+                    update, keyframe = await loop.run_in_executor(None, receiver.recv)
+                except EOFError as exc:
+                    raise RuntimeError("Simulation process exited") from exc
+                self.publish(update, keyframe)
+        finally:
+            # Also unblocks a pending recv in the executor thread
+            process.terminate()
+            process.join()
+            receiver.close()
+
+
+class RelayExecutor:
+    """Stands in for a simulation running in another process, as seen from a
+    websocket worker: commands are forwarded to it tagged with the game name,
+    while its updates are fed to `publish` by whoever receives them."""
+
+    name = "relay"
+
+    def __init__(self, game_name: str, commands, publish: Callable) -> None:
+        self.game_name = game_name
+        self.commands = commands
+        self.publish = publish
+
+    def submit(self, command) -> None:
+        self.commands.put((self.game_name, command))
+
+    async def run(self) -> None:
+        await asyncio.get_running_loop().create_future()
+
+
+def run_simulation_process(simulation: Simulation, queue, sender) -> None:
+    """Worker process entry point."""
+    commands = deque()
+
+    def receive():
+        while True:
+            commands.append(queue.get())
+
+    def publish(update, keyframe):
+        sender.send((update.prepare(), keyframe))
+
+    threading.Thread(target=receive, name="commands", daemon=True).start()
+    for delay in simulation(commands, publish):
+        time.sleep(delay)
+
+
+EXECUTORS = {
+    executor.name: executor
+    for executor in (InlineExecutor, ThreadExecutor, ProcessExecutor)
+}
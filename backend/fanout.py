@@ -0,0 +1,105 @@
+"""Fan-out of game updates to websocket connections.
+
+Each update is encoded and framed once per wire format, then the very same
+bytes are written to every open connection from a single loop, like
+`websockets.broadcast` but without framing the message again for each
+connection. Connections don't get a sender task of their own, which keeps
+per-connection memory down to the websocket protocol object itself.
+
+Writes never wait for a slow client. A connection whose write buffer is
+above `max_buffer` skips updates (conflation) until it drains, then gets a
+fresh keyframe and follows the deltas again. One that skips more than
+`max_lag` updates in a row is dropped.
+
+Pre-framed writes only work for connections without per-message compression,
+serve with `compression=None`.
+"""
+import logging
+from typing import Callable
+
+from websockets.connection import State
+
+from protocol import Update
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Broadcaster:
+    """Set of connections, grouped by negotiated subprotocol, that receive
+    every published update. `keyframe` returns the current full state, sent
+    to new and resyncing connections."""
+
+    def __init__(
+        self,
+        keyframe: Callable[[], Update | None],
+        max_buffer: int = 2**16,
+        max_lag: int = 100,
+    ) -> None:
+        self.keyframe = keyframe
+        self.max_buffer = max_buffer
+        self.max_lag = max_lag
+        self.connections = {}
+        self.lagging = {}  # Connection -> consecutive skipped updates
+        self.dropped_updates = 0
+        self.dropped_connections = 0
+        self.messages_sent = 0
+        self.bytes_sent = 0
+
+    def __len__(self) -> int:
+        return sum(len(group) for group in self.connections.values())
+
+    def add(self, websocket) -> None:
+        """Send the current keyframe to `websocket`, then every update.
+        Nothing can be broadcast in between, so the client doesn't miss any
+        update following the keyframe."""
+        self.resync(websocket)
+        self.connections.setdefault(websocket.subprotocol, set()).add(websocket)
+
+    def remove(self, websocket) -> None:
+        self.lagging.pop(websocket, None)
+        group = self.connections.get(websocket.subprotocol)
+        if group is not None:
+            group.discard(websocket)
+            if not group:
+                del self.connections[websocket.subprotocol]
+
+    def resync(self, websocket) -> None:
+        """Send the current keyframe to a single connection."""
+        keyframe = self.keyframe()
+        if keyframe is not None and websocket.state is State.OPEN:
+            data = keyframe.websocket_frame(websocket.subprotocol)
+            websocket.transport.write(data)
+            self.messages_sent += 1
+            self.bytes_sent += len(data)
+
+    def broadcast(self, update: Update) -> None:
+        """Send one update to all connections."""
+        for subprotocol, group in self.connections.items():
+            data = update.websocket_frame(subprotocol)
+            sent = 0
+            for websocket in group:
+                if websocket.state is not State.OPEN:
+                    continue
+                if websocket.transport.get_write_buffer_size() > self.max_buffer:
+                    self._skip(websocket)
+                elif websocket in self.lagging and not update.keyframe:
+                    # Deltas don't apply to a client that missed updates
+                    del self.lagging[websocket]
+                    self.resync(websocket)
+                else:
+                    self.lagging.pop(websocket, None)
+                    websocket.transport.write(data)
+                    sent += 1
+            self.messages_sent += sent
+            self.bytes_sent += sent * len(data)
+
+    def _skip(self, websocket) -> None:
+        skipped = self.lagging.get(websocket, 0) + 1
+        self.dropped_updates += 1
+        if skipped <= self.max_lag:
+            self.lagging[websocket] = skipped
+            return
+        LOGGER.info("Dropping connection %s lagging behind", websocket.remote_address)
+        del self.lagging[websocket]
+        self.dropped_connections += 1
+        websocket.transport.abort()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""Ring buffer of the last frames of a game, in shared memory.
+
+The simulation writes every broadcast frame (palette indices) and its owner
+ids into one of `capacity` slots. Readers in any process attach to the
+segment by name and get numpy views of those slots, without copying or
+unpickling anything: late joiners, diffing, snapshots and recordings can all
+work from the same memory.
+
+Segment layout (native byte order):
+
+    header:  i64 latest seq, i64 width, i64 height, i64 capacity,
+             i64 names count, i64 names bytes, capacity i64 slot seqs
+    frames:  capacity * width * height u8 palette indices
+    owners:  capacity * width * height u16 owner ids (NO_OWNER if none)
+    names:   owner names, each a u16 byte length + utf-8, in id order
+
+There is a single writer. A slot's seq is set to -1 while it's written, a
+reader checks it is unchanged after reading (`valid`) to know the slot
+wasn't overwritten meanwhile. Seqs only ever increase, the games played one
+after the other carry on from the previous one's (see GameManager.record),
+and owner names are only ever appended, so a seq means the same frame and
+an id the same name for the whole life of the segment.
+
+Follow a running server from the backend directory with:
+
+    python framering.py canvas_tetris_<pid>
+"""
+import argparse
+import logging
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from protocol import NO_OWNER
+
+LOGGER = logging.getLogger(__name__)
+
+_FIELDS = 6  # Header fields before the slot seqs
+_LATEST, _WIDTH, _HEIGHT, _CAPACITY, _NAMES_COUNT, _NAMES_BYTES = range(_FIELDS)
+_WRITING = -1
+_NAME_LENGTH = np.dtype("<u2")
+
+
+class FrameRing:
+    """Last `capacity` frames of a `width` x `height` game. Use `create` in
+    the simulation and `attach` everywhere else."""
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool) -> None:
+        self.memory = memory
+        self.owner = owner  # Unlinks the segment on close
+        buffer = memory.buf
+        self._header = np.ndarray((_FIELDS,), np.int64, buffer)
+        width, height, capacity = (int(value) for value in self._header[_WIDTH:_NAMES_COUNT])
+        self.resolution = (width, height)
+        self.capacity = capacity
+        size = width * height
+        offset = 8 * (_FIELDS + capacity)
+        self._seqs = np.ndarray((capacity,), np.int64, buffer, offset=8 * _FIELDS)
+        self.frames = np.ndarray((capacity, size), np.uint8, buffer, offset=offset)
+        offset += capacity * size
+        offset += offset % 2
+        self.owners = np.ndarray((capacity, size), np.uint16, buffer, offset=offset)
+        offset += 2 * capacity * size
+        self._names = np.ndarray((memory.size - offset,), np.uint8, buffer, offset=offset)
+        self._name_ids = {}  # Writer only
+        self._table = None  # Names of the ids last written
+        self._translated = 0
+        self._lookup = None
+        self._name_list = []  # Names read so far
+        self._names_read = 0  # Bytes of names read so far
+
+    @classmethod
+    def create(
+        cls,
+        width: int,
+        height: int,
+        capacity: int = 16,
+        name: str | None = None,
+        names_size: int = 2**20,
+    ) -> "FrameRing":
+        """New segment, owned by the caller. `names_size` bytes are
+        reserved for owner names."""
+        size = width * height
+        memory_size = 8 * (_FIELDS + capacity) + 3 * capacity * size + 1 + names_size
+        memory = shared_memory.SharedMemory(name, create=True, size=memory_size)
+        header = np.ndarray((_FIELDS + capacity,), np.int64, memory.buf)
+        header[:] = _WRITING
+        header[_WIDTH], header[_HEIGHT], header[_CAPACITY] = width, height, capacity
+        header[_NAMES_COUNT] = header[_NAMES_BYTES] = 0
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "FrameRing":
+        """Existing segment, created by another process or object."""
+        memory = shared_memory.SharedMemory(name)
+        # Python < 3.13 tracks attached segments too, and would unlink the
+        # segment when this process exits
+        resource_tracker.unregister(memory._name, "shared_memory")  # pylint:disable=protected-access
+        return cls(memory, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def latest(self) -> int | None:
+        """Seq of the last frame written, None before the first."""
+        seq = int(self._header[_LATEST])
+        return None if seq == _WRITING else seq
+
+    def write(self, seq: int, frame: np.ndarray, owners: np.ndarray, names) -> None:
+        """Store `frame` (flat palette indices) and `owners` (flat owner ids,
+        indices into `names`) as `seq`, overwriting the oldest slot. Ids
+        are translated to the ring's own, which outlive games."""
+        slot = seq % self.capacity
+        self._seqs[slot] = _WRITING
+        self.frames[slot] = frame
+        self.owners[slot] = self._translate(names)[owners]
+        self._seqs[slot] = seq
+        self._header[_LATEST] = seq
+
+    def _translate(self, names) -> np.ndarray:
+        """Lookup table from ids in `names` (or no owner) to ring ids."""
+        if names is not self._table:
+            self._table = names
+            self._translated = 0
+            self._lookup = np.full(2**16, NO_OWNER, dtype=np.uint16)
+        for owner_id in range(self._translated, len(names)):
+            self._lookup[owner_id] = self.owner_id(names[owner_id])
+        self._translated = len(names)
+        return self._lookup
+
+    def owner_id(self, name) -> int:
+        """Id of owner `name`, interned in the segment on first use. Names
+        that no longer fit get NO_OWNER."""
+        owner_id = self._name_ids.get(name)
+        if owner_id is None:
+            encoded = str(name).encode()
+            used = int(self._header[_NAMES_BYTES])
+            end = used + _NAME_LENGTH.itemsize + len(encoded)
+            if end > len(self._names) or len(self._name_ids) >= NO_OWNER:
+                LOGGER.warning("No room left for owner names in %s", self.name)
+                return NO_OWNER
+            self._names[used:end] = np.frombuffer(
+                np.array(len(encoded), _NAME_LENGTH).tobytes() + encoded, np.uint8
+            )
+            owner_id = self._name_ids[name] = len(self._name_ids)
+            self._header[_NAMES_BYTES] = end
+            self._header[_NAMES_COUNT] = owner_id + 1
+        return owner_id
+
+    def names(self) -> list[str]:
+        """Owner names, indexed by owner id. Names appended since the last
+        call are decoded, the others are cached."""
+        count = int(self._header[_NAMES_COUNT])
+        while len(self._name_list) < count:
+            offset = self._names_read + _NAME_LENGTH.itemsize
+            length = int(self._names[self._names_read : offset].view(_NAME_LENGTH)[0])
+            self._name_list.append(self._names[offset : offset + length].tobytes().decode())
+            self._names_read = offset + length
+        return self._name_list
+
+    def view(self, seq: int) -> tuple[np.ndarray, np.ndarray] | None:
+        """Zero-copy (frame, owner ids) of `seq`, or None if it's no longer
+        (or not yet) in the ring. The views are overwritten `capacity` frames
+        later, check `valid(seq)` once done with them."""
+        slot = seq % self.capacity
+        if not self.valid(seq):
+            return None
+        return self.frames[slot], self.owners[slot]
+
+    def valid(self, seq: int) -> bool:
+        return int(self._seqs[seq % self.capacity]) == seq
+
+    def read(self, seq: int) -> tuple[np.ndarray, np.ndarray] | None:
+        """Copy of (frame, owner ids) of `seq`, or None if it's no longer in
+        the ring."""
+        views = self.view(seq)
+        if views is None:
+            return None
+        frame, owners = views[0].copy(), views[1].copy()
+        return (frame, owners) if self.valid(seq) else None
+
+    def close(self) -> None:
+        """Release this process' mapping, and the segment itself if this
+        object created it. Views must not be used afterwards."""
+        self.frames = self.owners = self._names = self._seqs = self._header = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def follow(name: str, interval: float) -> None:
+    """Print a line for every frame written to ring `name`."""
+    ring = FrameRing.attach(name)
+    print(f"{ring.name}: {ring.resolution[0]}x{ring.resolution[1]}, {ring.capacity} frames")
+    previous = None
+    try:
+        while True:
+            latest = ring.latest
+            if latest is not None and latest != previous:
+                start = latest if previous is None else max(previous + 1, latest - ring.capacity + 1)
+                for seq in range(start, latest + 1):
+                    views = ring.read(seq)
+                    if views is None:
+                        print(f"seq {seq}: overwritten")
+                        continue
+                    frame, owners = views
+                    owned = owners != NO_OWNER
+                    print(
+                        f"seq {seq}: {len(np.unique(frame))} colors, {np.count_nonzero(owned)} owned "
+                        f"pixels, {len(np.unique(owners[owned]))} owners of {len(ring.names())}"
+                    )
+                previous = latest
+            time.sleep(interval)
+    finally:
+        ring.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow the frames of a running game")
+    parser.add_argument("name", help="Shared memory name, as logged by the server")
+    parser.add_argument(
+        "-i", "--interval", type=float, help="Seconds between polls", default=0.01
+    )
+    args = parser.parse_args()
+    try:
+        follow(args.name, args.interval)
+    except KeyboardInterrupt:
+        pass
@@ -1,7 +1,8 @@
 # Game configuration for wsserver.py
-# Add new games here as needed.
+# Add new games here as needed. Games drawing on the pygame display need a
+# process of their own, pygame has a single display per process.
 GAMES = {
-    "invaders": {"module": "games.invaders.invaders", "width": 64, "height": 64},
-    "place": {"module": "games.place.place", "width": 100, "height": 100},
+    "invaders": {"module": "games.invaders.invaders", "width": 64, "height": 64, "pygame_display": True},
+    "place": {"module": "games.place.place", "width": 100, "height": 100, "pygame_display": True},
     "tetris": {"module": "games.tetris.tetris", "width": 64, "height": 64},
 }
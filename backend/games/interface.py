@@ -13,15 +13,57 @@ while True:
     A.update()
     print(A.owners_map) # Or do something with it
     A.click_at(10, 60, "Some_owner") # Add user inputs
+
+Owners can also be read as a grid of owner ids plus the table of their
+names, which is what the backend uses:
+
+    ids = A.owners_grid  # (height, width) uint16 array
+    owned = ids != NO_OWNER
+    print(A.owner_names[ids[owned][0]])
+
+Games only need to implement `owners_map`, `owners_grid` is built from it
+by default. Games keeping owners in arrays should override `owners_grid`
+(and build `owners_map` from it) instead.
 """
 from abc import ABC, abstractmethod
+
+import numpy as np
 from PIL.Image import Image
 
+from games import palette
+
+NO_OWNER = 0xFFFF  # Owner id of pixels without owner
+
 
 class InterfaceError(Exception):
     """Base class for exceptions in this module."""
 
 
+class OwnerNames:
+    """Interned owner names: each name gets the next id on first use, and
+    keeps it for the whole game. Once all ids are taken, new names get
+    NO_OWNER: their pixels show up without owner."""
+
+    def __init__(self) -> None:
+        self.names = []
+        self.ids = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, owner_id: int):
+        return self.names[owner_id]
+
+    def intern(self, name) -> int:
+        owner_id = self.ids.get(name)
+        if owner_id is None:
+            if len(self.names) >= NO_OWNER:
+                return NO_OWNER
+            owner_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return owner_id
+
+
 class CanvasApp(ABC):
     """Common interface for games to be run within Canvas."""
 
@@ -37,6 +79,16 @@ class CanvasApp(ABC):
         queue for later processing, and we store an identifier of who clicked
         it, for later retrieval/identification of who caused a certain effect."""
 
+    def click_batch(self, xs: np.ndarray, ys: np.ndarray, owners: np.ndarray, names: list) -> None:
+        """All the clicks of a tick at once, in arrival order: coordinates
+        and owners, as indices in `names` (the users clicking in this tick).
+        Names are only worth interning in `owner_names` once they own
+        pixels, anyone can click. Calls `click_at` for each click by default,
+        games can override it to handle the whole batch with array
+        operations."""
+        for x, y, owner in zip(xs.tolist(), ys.tolist(), owners.tolist()):
+            self.click_at(x, y, owner=names[owner])
+
     @property
     @abstractmethod
     def owners_map(self) -> dict[tuple[int, int], str]:
@@ -44,16 +96,64 @@ class CanvasApp(ABC):
         spaceship to shoot a rocket, the pixels composing the rocket will
         'belong' to that user."""
 
+    @property
+    def owner_names(self) -> OwnerNames:
+        """Names of the ids in `owners_grid`."""
+        names = getattr(self, "_owner_names", None)
+        if names is None:
+            names = self._owner_names = OwnerNames()
+        return names
+
+    @property
+    def owners_grid(self) -> np.ndarray:
+        """Owner id of each pixel, NO_OWNER for pixels without owner, as a
+        (height, width) uint16 array. Built from `owners_map` by default."""
+        width, height = self.resolution
+        grid = np.full((height, width), NO_OWNER, dtype=np.uint16)
+        owners = self.owners_map
+        if owners:
+            rows, columns = np.array(list(owners.keys())).T
+            grid[rows, columns] = [self.owner_names.intern(name) for name in owners.values()]
+        return grid
+
     @property
     @abstractmethod
     def frame(self) -> Image:
         """Returns current app frame"""
 
+    @property
+    def palette_frame(self) -> np.ndarray:
+        """Current frame as indices into games.palette, a (height, width)
+        uint8 array. Callers may keep it, so games must not modify it
+        afterwards. Built from `frame` by default, games that can paint
+        palette indices directly should override it."""
+        return palette.image_indices(self.frame)
+
+    def get_changed_pixels(self) -> np.ndarray | None:
+        """Flat indices of the pixels of `palette_frame` changed since the
+        last call (all of them on the first call), for games that track
+        them as they draw. None by default, the caller diffs frames then."""
+        return None
+
     @property
     @abstractmethod
     def resolution(self) -> tuple[int, int]:
         """Returns current app resolution in pixels"""
 
+    def snapshot_state(self) -> dict | None:
+        """Game specific state to save in snapshots (see snapshots), by name:
+        numpy arrays or JSON serializable values. Taken between updates, the
+        arrays are copied before being written. None by default, for games
+        that can't be restored."""
+        return None
+
+    def restore_state(self, state: dict, frame: np.ndarray, owners: np.ndarray) -> None:
+        """Continue from a snapshot_state, on a new game of the same
+        resolution whose owner_names are already those of the snapshot.
+        `frame` and `owners` (palette indices and owners grid, read-only) are
+        the snapshot's, for games whose state is the canvas itself."""
+        raise InterfaceError(f"{type(self).__name__} can't be restored from snapshots")
+
     @property
     @abstractmethod
     def finished(self) -> bool:
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""The palette frames are sent in: pixels are indices into it.
+
+It's the web-safe palette (the one PIL calls WEB): 10 blacks, the 6x6x6
+color cube with levels 0, 51, ..., 255 (red varying fastest), then black up
+to 256 entries. This module is its single definition, the frontend copy in
+src/components/WebSafeColors.js is generated from it:
+
+    python -m games.palette > ../src/components/WebSafeColors.js
+
+Colors are mapped to the nearest palette entry with lookup tables, per
+channel since the cube is separable, rather than letting PIL quantize (and
+dither) every frame. The same color always gets the same index.
+"""
+import numpy as np
+from PIL.Image import Image
+
+LEVELS = 6
+STEP = 255 // (LEVELS - 1)
+CUBE_OFFSET = 10  # Index of the first color of the cube
+SIZE = 256
+
+# (SIZE, 3) uint8 RGB entries
+PALETTE = np.zeros((SIZE, 3), dtype=np.uint8)
+_levels = np.arange(LEVELS, dtype=np.uint8) * STEP
+_b, _g, _r = np.meshgrid(_levels, _levels, _levels, indexing="ij")
+PALETTE[CUBE_OFFSET : CUBE_OFFSET + LEVELS**3] = np.stack(
+    [_r.ravel(), _g.ravel(), _b.ravel()], axis=1
+)
+
+# Contribution of each channel value to the index of the nearest color
+_NEAREST = np.rint(np.arange(256) / STEP).astype(np.intp)
+_CHANNEL_LUTS = (_NEAREST, _NEAREST * LEVELS, _NEAREST * LEVELS**2)
+
+
+def index(rgb) -> int:
+    """Index of the color closest to `rgb`. Black is 0."""
+    return int(quantize(np.array(rgb, dtype=np.uint8)))
+
+
+def quantize(rgb: np.ndarray) -> np.ndarray:
+    """Palette indices of an (..., 3) (or (..., 4), alpha is ignored) uint8
+    array of colors, as a (...) uint8 array."""
+    red, green, blue = _CHANNEL_LUTS
+    cube = red[rgb[..., 0]] + green[rgb[..., 1]] + blue[rgb[..., 2]]
+    # Black is the first entry, not the first color of the cube
+    return np.where(cube == 0, 0, cube + CUBE_OFFSET).astype(np.uint8)
+
+
+def image_indices(image: Image) -> np.ndarray:
+    """Palette indices of a PIL image, as a (height, width) uint8 array.
+    Palette images are remapped through their own palette, others are
+    quantized pixel by pixel."""
+    if image.mode == "P":
+        colors = np.zeros((SIZE, 3), dtype=np.uint8)
+        own = np.frombuffer(bytes(image.getpalette(rawmode="RGB")), dtype=np.uint8)
+        own = own.reshape(-1, 3)[:SIZE]
+        colors[: len(own)] = own
+        return quantize(colors)[np.asarray(image)]
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    return quantize(np.asarray(image))
+
+
+def javascript() -> str:
+    """The frontend's copy of the palette, as RGBA entries."""
+    entries = ",\n".join(f"    [{r},{g},{b},255]" for r, g, b in PALETTE.tolist())
+    return (
+        "// Generated by `python -m games.palette` in backend/, don't edit\n"
+        f"const webSafeColors = [\n{entries},\n];\n\nexport default webSafeColors;\n"
+    )
+
+
+if __name__ == "__main__":
+    print(javascript(), end="")
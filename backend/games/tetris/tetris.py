@@ -9,11 +9,15 @@ from collections import deque
 from datetime import datetime
 from enum import Enum, auto
 from itertools import product
+from typing import NamedTuple
 
 import numpy as np
 import pygame
 from PIL import Image, ImageOps
 
+from games import palette
+from games.interface import NO_OWNER, OwnerNames
+
 
 class Colors(Enum):
     """Colors for the game. Uses single integer values for compatibility."""
@@ -42,6 +46,55 @@ class TetrominoType(Enum):
     L = auto()
 
 
+class Rotation(NamedTuple):
+    """One rotation of a tetromino, relative to its top-left corner."""
+
+    shape: list  # Rows of 0/1 cells
+    width: int
+    masks: tuple  # Bitmask of each row, bit i is column i
+    columns: np.ndarray  # Column and row of each cell
+    rows: np.ndarray
+
+
+def rotations(shape):
+    """All the clockwise rotations of `shape`, starting with itself."""
+    result = []
+    for _ in range(4):
+        columns = [x for row in shape for x, cell in enumerate(row) if cell]
+        rows = [y for y, row in enumerate(shape) for cell in row if cell]
+        result.append(
+            Rotation(
+                shape=shape,
+                width=len(shape[0]),
+                masks=tuple(sum(1 << x for x, cell in enumerate(row) if cell) for row in shape),
+                columns=np.array(columns),
+                rows=np.array(rows),
+            )
+        )
+        shape = [list(row) for row in zip(*shape[::-1])]
+    return result
+
+
+COLOR_RGB = {
+    Colors.BLACK.value: (0, 0, 0),
+    Colors.WHITE.value: (255, 255, 255),
+    Colors.CYAN.value: (0, 255, 255),      # Light blue for L piece
+    Colors.BLUE.value: (0, 0, 255),        # Blue for I piece
+    Colors.ORANGE.value: (255, 165, 0),     # Orange for J piece
+    Colors.YELLOW.value: (255, 255, 0),     # Yellow for Square (O piece)
+    Colors.GREEN.value: (0, 255, 0),       # Green for T and Z pieces
+    Colors.RED.value: (255, 0, 0),         # Red for S piece
+    Colors.PURPLE.value: (255, 192, 203),   # Pink/purple for T piece
+    Colors.GRID.value: (50, 50, 50),
+}
+
+
+# Palette index of each Colors value
+PALETTE_INDEX = np.zeros(256, dtype=np.uint8)
+for color_value, color_rgb in COLOR_RGB.items():
+    PALETTE_INDEX[color_value] = palette.index(color_rgb)
+
+
 class Game:
     def __init__(
         self,
@@ -49,11 +102,15 @@ class Game:
         height: int = 64,
         framerate: float = 10,
         use_defaults=True,
+        display=False,
     ) -> None:
-        pygame.init()  # pylint:disable=no-member
-
         self._resolution = (width, height)
-        self.screen = pygame.display.set_mode((width, height))
+        # Frames are painted as palette indices with numpy, a pygame window
+        # (paced at `framerate`) is only opened to watch a game locally
+        self.screen = None
+        if display:
+            pygame.init()  # pylint:disable=no-member
+            self.screen = pygame.display.set_mode((width, height))
         self.framerate = framerate
         self.clock = pygame.time.Clock()
 
@@ -65,7 +122,10 @@ class Game:
         self.game_offset_y = (height - self.game_height * self.cell_size) // 2
 
         # Game state
-        self.board = [[Colors.BLACK.value for _ in range(self.game_width)] for _ in range(self.game_height)]
+        # Color of each cell, and occupied cells as one bitmask per row
+        self.board = np.full((self.game_height, self.game_width), Colors.BLACK.value, dtype=np.uint8)
+        self.rows = [0] * self.game_height
+        self.full_row = (1 << self.game_width) - 1
         self.current_piece = None
         self.next_piece_type = random.choice(list(TetrominoType))
         self.score = 0
@@ -74,16 +134,14 @@ class Game:
         self.drop_timer = 0
         self.drop_speed = 30  # frames between automatic drops
 
-        self.pixel_inputs = pygame.sprite.Group()
-        self.changed_pixels = set()  # Track which pixels changed
-        self.last_frame = None
-        
-        # For compatibility with wsserver
-        class PixelWrapper:
-            def __init__(self, value):
-                self.value = value
-        
-        self.pixels = [PixelWrapper(Colors.BLACK.value) for _ in range(width * height)]
+        # Clicks since the last update: coordinates and owner names
+        self._clicks_x, self._clicks_y, self._clicks_owner = [], [], []
+        self._owner_names = OwnerNames()
+        self._background = self._render_background()
+        self._cell_edges = self._render_cell_edges()
+        # Palette indices, a new array every frame
+        self.pixels = self._background.copy()
+        self._reported_pixels = None  # Frame as of the last get_changed_pixels
 
         if use_defaults:
             self._spawn_piece()
@@ -93,8 +151,7 @@ class Game:
         game at the game's framerate."""
         if self.game_over:
             self._draw()
-            pygame.display.flip()
-            self.clock.tick(self.framerate)
+            self._show()
             return
 
         self._handle_pixel_inputs()
@@ -111,40 +168,69 @@ class Game:
                     self.game_over = True
 
         self._draw()
-        pygame.display.flip()
-        self.clock.tick(self.framerate)
+        self._show()
 
     def click_at(self, x, y, owner=None):
         """User inputs are clicks to the grid pixels, we add these inputs to a
         queue for later processing, and we store an identifier of who clicked
         it, for later retrieval/identification of who caused a certain effect."""
-        click_sprite = Game.UserInput(x, y, owner)
-        self.pixel_inputs.add(click_sprite)
+        self._clicks_x.append(x)
+        self._clicks_y.append(y)
+        self._clicks_owner.append(owner)
+
+    def click_batch(self, xs, ys, owners, names):
+        """All the clicks of a tick at once, see CanvasApp.click_batch."""
+        self._clicks_x.extend(xs.tolist())
+        self._clicks_y.extend(ys.tolist())
+        self._clicks_owner.extend([names[owner] for owner in owners.tolist()])
 
     @property
     def owners_map(self):
         """Each pixel can have an owner, for example when a player clicks on the
         piece to rotate it, the pixels composing the piece will
         'belong' to that user."""
-        owners_map = {}
-        if self.current_piece and hasattr(self.current_piece, 'owner'):
-            for px, py in self.current_piece.get_pixels():
-                screen_x = self.game_offset_x + px * self.cell_size
-                screen_y = self.game_offset_y + py * self.cell_size
-                for dx in range(self.cell_size):
-                    for dy in range(self.cell_size):
-                        if (screen_y + dy < self.screen.get_height() and 
-                            screen_x + dx < self.screen.get_width()):
-                            owners_map[(screen_y + dy, screen_x + dx)] = self.current_piece.owner
-        return owners_map
+        grid = self.owners_grid
+        rows, columns = np.nonzero(grid != NO_OWNER)
+        names = self.owner_names
+        return {
+            (y, x): names[owner_id]
+            for y, x, owner_id in zip(rows.tolist(), columns.tolist(), grid[rows, columns].tolist())
+        }
+
+    @property
+    def owner_names(self):
+        """Names of the ids in `owners_grid`."""
+        return self._owner_names
+
+    @property
+    def owners_grid(self):
+        """Owner id of each pixel as a (height, width) array, the cells of
+        the current piece belong to the last player who moved it."""
+        width, height = self._resolution
+        grid = np.full((height, width), NO_OWNER, dtype=np.uint16)
+        piece = self.current_piece
+        if piece is not None and piece.owner is not None:
+            owner_id = self._owner_names.intern(piece.owner)
+            size = self.cell_size
+            for px, py in piece.get_pixels():
+                if 0 <= px < self.game_width and 0 <= py < self.game_height:
+                    x = self.game_offset_x + px * size
+                    y = self.game_offset_y + py * size
+                    grid[y : y + size, x : x + size] = owner_id
+        return grid
 
     @property
     def frame(self):
-        """Returns the current game frame as a numpy array."""
-        # Capture the actual pygame screen content like invaders does
-        return Image.fromarray(np.flipud(pygame.surfarray.array3d(self.screen))).rotate(
-            -90
-        )
+        """Returns the current game frame as a palette image."""
+        image = Image.fromarray(self.pixels, mode="P")
+        image.putpalette(palette.PALETTE.tobytes())
+        return image
+
+    @property
+    def palette_frame(self):
+        """Returns the current game frame as palette indices, without going
+        through PIL."""
+        return self.pixels
 
     @property
     def resolution(self) -> tuple[int, int]:
@@ -156,6 +242,42 @@ class Game:
         """Returns true if the game ended."""
         return self.game_over
 
+    def snapshot_state(self):
+        """Board, piece and score, see CanvasApp.snapshot_state."""
+        piece = self.current_piece
+        return {
+            "board": self.board,
+            "rows": self.rows,
+            "piece": None if piece is None else {
+                "type": piece.type.name,
+                "rotation": piece.rotation,
+                "x": piece.x,
+                "y": piece.y,
+                "owner": piece.owner,
+            },
+            "next_piece_type": self.next_piece_type.name,
+            "score": self.score,
+            "lines_cleared": self.lines_cleared,
+            "game_over": self.game_over,
+            "drop_timer": self.drop_timer,
+            "drop_speed": self.drop_speed,
+        }
+
+    def restore_state(self, state, frame, owners):
+        """Continue a game from its snapshot_state, the frame is redrawn."""
+        self.board = np.array(state["board"], dtype=np.uint8)
+        self.rows = list(state["rows"])
+        piece = state["piece"]
+        self.current_piece = None
+        if piece is not None:
+            self.current_piece = Game.Tetromino(TetrominoType[piece["type"]], piece["x"], piece["y"])
+            self.current_piece.rotation = piece["rotation"]
+            self.current_piece.owner = piece["owner"]
+        self.next_piece_type = TetrominoType[state["next_piece_type"]]
+        for name in ("score", "lines_cleared", "game_over", "drop_timer", "drop_speed"):
+            setattr(self, name, state[name])
+        self._draw()
+
     def _spawn_piece(self):
         """Spawn a new piece at the top of the board."""
         self.current_piece = Game.Tetromino(self.next_piece_type, self.game_width // 2, 0)
@@ -163,12 +285,13 @@ class Game:
 
     def _is_valid_position(self, piece, dx=0, dy=0):
         """Check if piece position is valid."""
-        for px, py in piece.get_pixels():
-            new_x = px + dx
-            new_y = py + dy
-            if (new_x < 0 or new_x >= self.game_width or 
-                new_y >= self.game_height or
-                (new_y >= 0 and self.board[new_y][new_x] != Colors.BLACK.value)):
+        rotation = piece.rotations[piece.rotation]
+        x = piece.x + dx
+        y = piece.y + dy
+        if x < 0 or x + rotation.width > self.game_width:
+            return False
+        for row, mask in enumerate(rotation.masks, y):
+            if row >= self.game_height or (row >= 0 and self.rows[row] & (mask << x)):
                 return False
         return True
 
@@ -182,222 +305,147 @@ class Game:
 
     def _rotate_piece(self):
         """Rotate piece if valid."""
-        original_shape = self.current_piece.shape
+        original_rotation = self.current_piece.rotation
         self.current_piece.rotate()
         if not self._is_valid_position(self.current_piece):
-            self.current_piece.shape = original_shape
+            self.current_piece.rotation = original_rotation
+            return False
+        return True
 
     def _lock_piece(self):
         """Lock piece in place on the board."""
-        for px, py in self.current_piece.get_pixels():
-            if 0 <= py < self.game_height and 0 <= px < self.game_width:
-                self.board[py][px] = self.current_piece.color.value
+        piece = self.current_piece
+        rotation = piece.rotations[piece.rotation]
+        for row, mask in enumerate(rotation.masks, piece.y):
+            if 0 <= row < self.game_height:
+                self.rows[row] |= mask << piece.x
+        self.board[self._piece_cells(piece)] = piece.color.value
+
+    def _piece_cells(self, piece):
+        """Rows and columns of the cells of `piece` that are on the board."""
+        rotation = piece.rotations[piece.rotation]
+        rows = rotation.rows + piece.y
+        columns = rotation.columns + piece.x
+        inside = (rows >= 0) & (rows < self.game_height)
+        return rows[inside], columns[inside]
 
     def _clear_lines(self):
         """Clear completed lines."""
-        lines_to_clear = []
-        for y in range(self.game_height):
-            if all(self.board[y][x] != Colors.BLACK.value for x in range(self.game_width)):
-                lines_to_clear.append(y)
-
-        for y in lines_to_clear:
-            del self.board[y]
-            self.board.insert(0, [Colors.BLACK.value for _ in range(self.game_width)])
+        kept = [y for y, row in enumerate(self.rows) if row != self.full_row]
+        cleared = self.game_height - len(kept)
+        if cleared:
+            self.rows = [0] * cleared + [self.rows[y] for y in kept]
+            self.board = np.concatenate(
+                [np.full((cleared, self.game_width), Colors.BLACK.value, dtype=np.uint8), self.board[kept]]
+            )
 
-        self.lines_cleared += len(lines_to_clear)
-        self.score += len(lines_to_clear) * 100
+        self.lines_cleared += cleared
+        self.score += cleared * 100
 
     def _handle_pixel_inputs(self):
-        """User inputs are invisible pixels drawn in the game. We check if
-        they collide with the current piece to determine action."""
-        if not self.current_piece:
-            self.pixel_inputs = pygame.sprite.Group()
+        """Clicks within the bounding box of the current piece rotate it,
+        the others move it one cell towards them. The piece then belongs to
+        the last player who clicked."""
+        xs = np.array(self._clicks_x, dtype=np.intp)
+        ys = np.array(self._clicks_y, dtype=np.intp)
+        owners = self._clicks_owner
+        self._clicks_x, self._clicks_y, self._clicks_owner = [], [], []
+        piece = self.current_piece
+        if not piece or not len(xs):
             return
-            
-        # Create a temporary sprite for the current piece for collision detection
-        piece_sprite = Game.TetrominoSprite(self.current_piece, self.game_offset_x, self.game_offset_y, self.cell_size)
-        
-        # Check if user clicked on current piece
-        for user_input in self.pixel_inputs:
-            piece_clicked = pygame.sprite.spritecollide(
-                user_input, [piece_sprite], dokill=False
-            )
-            if len(piece_clicked) > 0:
-                self.current_piece.owner = user_input.owner
-                self._rotate_piece()
-                self.pixel_inputs.remove(user_input)
-        
+
+        # Hit test against the piece as it is before any click is applied
+        shape = piece.shape
+        left = self.game_offset_x + piece.x * self.cell_size
+        top = self.game_offset_y + piece.y * self.cell_size
+        hits = (
+            (xs >= left)
+            & (xs < left + len(shape[0]) * self.cell_size)
+            & (ys >= top)
+            & (ys < top + len(shape) * self.cell_size)
+        )
+        hit_indices = np.flatnonzero(hits)
+        if len(hit_indices):
+            piece.owner = owners[hit_indices[-1]]
+            # Four successful rotations are a no-op, and once a rotation
+            # fails the following ones fail too
+            rotations = len(hit_indices)
+            for _ in range(rotations if rotations < 4 else 4 + rotations % 4):
+                if not self._rotate_piece():
+                    break
+
         # For remaining clicks, move piece one pixel towards click direction
-        for user_input in self.pixel_inputs:
-            self.current_piece.owner = user_input.owner
+        misses = ~hits
+        for x, y in zip(xs[misses].tolist(), ys[misses].tolist()):
             # Move based on click position relative to piece center
-            piece_center_x = self.game_offset_x + (self.current_piece.x + 1) * self.cell_size
-            if user_input.rect.x < piece_center_x:
+            piece_center_x = self.game_offset_x + (piece.x + 1) * self.cell_size
+            if x < piece_center_x:
                 self._move_piece(-1, 0)
-            elif user_input.rect.x > piece_center_x:
+            elif x > piece_center_x:
                 self._move_piece(1, 0)
             # Always move down if clicking below piece
-            if user_input.rect.y > self.game_offset_y + self.current_piece.y * self.cell_size:
+            if y > self.game_offset_y + piece.y * self.cell_size:
                 self._move_piece(0, 1)
-        
-        self.pixel_inputs = pygame.sprite.Group()
+        if misses.any():
+            piece.owner = owners[np.flatnonzero(misses)[-1]]
+
+    def _render_background(self):
+        """Black frame with the border around the game area."""
+        width, height = self._resolution
+        frame = np.full((height, width), PALETTE_INDEX[Colors.BLACK.value], dtype=np.uint8)
+        x0 = max(0, self.game_offset_x - 2)
+        y0 = max(0, self.game_offset_y - 2)
+        x1 = self.game_offset_x + self.game_width * self.cell_size + 2
+        y1 = self.game_offset_y + self.game_height * self.cell_size + 2
+        white = PALETTE_INDEX[Colors.WHITE.value]
+        frame[y0 : y0 + 2, x0:x1] = white
+        frame[max(y0, y1 - 2) : y1, x0:x1] = white
+        frame[y0:y1, x0 : x0 + 2] = white
+        frame[y0:y1, max(x0, x1 - 2) : x1] = white
+        return frame
+
+    def _render_cell_edges(self):
+        """Mask of the grid lines of every cell of the game area."""
+        edge = np.zeros(self.cell_size, dtype=bool)
+        edge[[0, -1]] = True
+        cell = edge[:, np.newaxis] | edge[np.newaxis, :]
+        return np.tile(cell, (self.game_height, self.game_width))
 
     def _draw(self):
-        """Draw the game."""
-        self.screen.fill(Colors.BLACK.value)
-        
-        # Draw board
-        for y in range(self.game_height):
-            for x in range(self.game_width):
-                if self.board[y][x] != Colors.BLACK.value:
-                    rect = pygame.Rect(
-                        self.game_offset_x + x * self.cell_size,
-                        self.game_offset_y + y * self.cell_size,
-                        self.cell_size,
-                        self.cell_size
-                    )
-                    # Convert single color value to RGB for pygame
-                    color_rgb = self._color_to_rgb(self.board[y][x])
-                    pygame.draw.rect(self.screen, color_rgb, rect)
-                    pygame.draw.rect(self.screen, self._color_to_rgb(Colors.GRID.value), rect, 1)
-        
-        # Draw current piece
+        """Draw the game into a new frame buffer: the board and current piece
+        cells are upscaled to `cell_size` blocks, then outlined with grid
+        lines."""
+        cells = self.board.copy()
         if self.current_piece:
-            for px, py in self.current_piece.get_pixels():
-                if 0 <= px < self.game_width and 0 <= py < self.game_height:
-                    rect = pygame.Rect(
-                        self.game_offset_x + px * self.cell_size,
-                        self.game_offset_y + py * self.cell_size,
-                        self.cell_size,
-                        self.cell_size
-                    )
-                    color_rgb = self._color_to_rgb(self.current_piece.color.value)
-                    pygame.draw.rect(self.screen, color_rgb, rect)
-                    pygame.draw.rect(self.screen, self._color_to_rgb(Colors.GRID.value), rect, 1)
-        
-        # Update pixels array for compatibility with wsserver
-        frame_data = self.frame
-        frame_array = np.array(frame_data).flatten()
-        for i in range(min(len(self.pixels), len(frame_array))):
-            self.pixels[i].value = int(frame_array[i])  # Ensure regular Python int
-        
-        # Detect changes from last frame
-        if hasattr(self, 'last_frame') and self.last_frame is not None:
-            changed_indices = np.where(frame_array != self.last_frame)[0]
-            self.changed_pixels.update(changed_indices)
-            
-            # Always mark at least one pixel as changed to ensure broadcasts
-            if len(changed_indices) == 0:
-                self.changed_pixels.add(0)  # Mark top-left pixel as changed
-        else:
-            # First frame, mark all pixels as changed
-            self.changed_pixels.update(range(len(frame_array)))
-        
-        self.last_frame = frame_array
-        
-        # Draw game border
-        border_rect = pygame.Rect(
-            self.game_offset_x - 2,
-            self.game_offset_y - 2,
-            self.game_width * self.cell_size + 4,
-            self.game_height * self.cell_size + 4
-        )
-        pygame.draw.rect(self.screen, Colors.WHITE.value, border_rect, 2)
-        
-        # Draw board
-        for y in range(self.game_height):
-            for x in range(self.game_width):
-                if self.board[y][x] != Colors.BLACK.value:
-                    rect = pygame.Rect(
-                        self.game_offset_x + x * self.cell_size,
-                        self.game_offset_y + y * self.cell_size,
-                        self.cell_size,
-                        self.cell_size
-                    )
-                    pygame.draw.rect(self.screen, self.board[y][x], rect)
-                    pygame.draw.rect(self.screen, Colors.GRID.value, rect, 1)
-        
-        # Draw current piece
-        if self.current_piece:
-            for px, py in self.current_piece.get_pixels():
-                if 0 <= px < self.game_width and 0 <= py < self.game_height:
-                    rect = pygame.Rect(
-                        self.game_offset_x + px * self.cell_size,
-                        self.game_offset_y + py * self.cell_size,
-                        self.cell_size,
-                        self.cell_size
-                    )
-                    pygame.draw.rect(self.screen, self.current_piece.color.value, rect)
-                    pygame.draw.rect(self.screen, Colors.GRID.value, rect, 1)
-        
-
-
-    class UserInput(pygame.sprite.Sprite):
-        """User inputs are 'clicked' pixels, here represented as a 1x1 pixel
-        transparent sprite. We can then leverage pygame collision detection to
-        determine later what did the player clicked."""
-
-        def __init__(self, x, y, owner=None) -> None:
-            super().__init__()
-            self.surf = pygame.Surface([1, 1])
-            self.surf.set_colorkey(Colors.COLOR_KEY.value)
-            self.surf.fill(Colors.COLOR_KEY.value)
-            self.rect = self.surf.get_rect()
-            self.rect.x = x
-            self.rect.y = y
-            self.owner = owner
-
-        def update(self):
-            super().update(self)
-
-    class TetrominoSprite(pygame.sprite.Sprite):
-        """Sprite representation of a tetromino for collision detection."""
-
-        def __init__(self, tetromino, offset_x, offset_y, cell_size) -> None:
-            super().__init__()
-            self.tetromino = tetromino
-            self.offset_x = offset_x
-            self.offset_y = offset_y
-            self.cell_size = cell_size
-            
-            # Create surface for the piece
-            max_width = max(len(row) for row in tetromino.shape)
-            max_height = len(tetromino.shape)
-            self.surf = pygame.Surface((max_width * cell_size, max_height * cell_size))
-            self.surf.set_colorkey(Colors.COLOR_KEY.value)
-            self.surf.fill(Colors.COLOR_KEY.value)
-            
-            # Draw the piece shape
-            for y, row in enumerate(tetromino.shape):
-                for x, cell in enumerate(row):
-                    if cell:
-                        rect = pygame.Rect(x * cell_size, y * cell_size, cell_size, cell_size)
-                        pygame.draw.rect(self.surf, tetromino.color.value, rect)
-            
-            self.rect = self.surf.get_rect()
-            self.rect.x = offset_x + tetromino.x * cell_size
-            self.rect.y = offset_y + tetromino.y * cell_size
-
-    def _color_to_rgb(self, color_value):
-        """Convert single color value to RGB tuple for pygame."""
-        color_map = {
-            Colors.BLACK.value: (0, 0, 0),
-            Colors.WHITE.value: (255, 255, 255),
-            Colors.CYAN.value: (0, 255, 255),      # Light blue for L piece
-            Colors.BLUE.value: (0, 0, 255),        # Blue for I piece
-            Colors.ORANGE.value: (255, 165, 0),     # Orange for J piece
-            Colors.YELLOW.value: (255, 255, 0),     # Yellow for Square (O piece)
-            Colors.GREEN.value: (0, 255, 0),       # Green for T and Z pieces
-            Colors.RED.value: (255, 0, 0),         # Red for S piece
-            Colors.PURPLE.value: (255, 192, 203),   # Pink/purple for T piece
-            Colors.GRID.value: (50, 50, 50),
-        }
-        return color_map.get(color_value, (0, 0, 0))
+            cells[self._piece_cells(self.current_piece)] = self.current_piece.color.value
+        blocks = cells.repeat(self.cell_size, axis=0).repeat(self.cell_size, axis=1)
+
+        frame = self._background.copy()
+        area = frame[
+            self.game_offset_y : self.game_offset_y + blocks.shape[0],
+            self.game_offset_x : self.game_offset_x + blocks.shape[1],
+        ]
+        area[:] = PALETTE_INDEX[blocks]
+        area[(blocks != Colors.BLACK.value) & self._cell_edges] = PALETTE_INDEX[Colors.GRID.value]
+        self.pixels = frame
+
+    def _show(self):
+        """Show the frame in the pygame window, if any, at `framerate`."""
+        if self.screen is None:
+            return
+        rgb = palette.PALETTE[self.pixels]
+        pygame.surfarray.blit_array(self.screen, rgb.transpose(1, 0, 2))
+        pygame.display.flip()
+        self.clock.tick(self.framerate)
 
     def get_changed_pixels(self):
-        """Get all changed pixel indices and clear the tracking"""
-        changed = self.changed_pixels.copy()
-        self.changed_pixels.clear()
+        """Flat indices of the pixels changed since the last call, all of
+        them on the first call."""
+        if self._reported_pixels is None:
+            changed = np.arange(self.pixels.size)
+        else:
+            changed = np.flatnonzero(self.pixels != self._reported_pixels)
+        self._reported_pixels = self.pixels
         return changed
 
     class Tetromino:
@@ -423,35 +471,39 @@ class Game:
             TetrominoType.L: Colors.CYAN,       # L is light blue
         }
         
+        ROTATIONS = {piece_type: rotations(shape) for piece_type, shape in SHAPES.items()}
+
         def __init__(self, piece_type, x, y):
             self.type = piece_type
-            self.shape = [row[:] for row in self.SHAPES[piece_type]]
+            self.rotations = self.ROTATIONS[piece_type]
+            self.rotation = 0
             self.color = self.COLORS[piece_type]
             self.x = x
             self.y = y
             self.owner = None
-        
+
+        @property
+        def shape(self):
+            return self.rotations[self.rotation].shape
+
         def rotate(self):
             """Rotate the piece 90 degrees clockwise."""
-            self.shape = [list(row) for row in zip(*self.shape[::-1])]
-        
+            self.rotation = (self.rotation + 1) % len(self.rotations)
+
         def get_pixels(self):
             """Get the pixel positions of the piece."""
-            pixels = []
-            for y, row in enumerate(self.shape):
-                for x, cell in enumerate(row):
-                    if cell:
-                        pixels.append((self.x + x, self.y + y))
-            return pixels
+            rotation = self.rotations[self.rotation]
+            return list(zip((rotation.columns + self.x).tolist(), (rotation.rows + self.y).tolist()))
 
 
-def run_random_game(framerate):
+def run_random_game(framerate, display=True):
     """
     Runs a game where the game is clicked at random intervals on random pixels.
 
     :param framerate: Set game framerate
+    :param display: Show the game in a window, otherwise run as fast as possible
     """
-    game = Game(framerate=framerate, use_defaults=True)
+    game = Game(framerate=framerate, use_defaults=True, display=display)
     t = 0
     game.update()
     while not game.game_over:
@@ -466,10 +518,8 @@ def run_random_game(framerate):
 
 def main(args):
     """Main function, runs forever one game after another"""
-    if args.dummy:
-        os.environ["SDL_VIDEODRIVER"] = "dummy"
     while True:
-        game_over, screenshot = run_random_game(args.framerate)
+        game_over, screenshot = run_random_game(args.framerate, display=not args.dummy)
         if args.screenshot:
             try:
                 os.mkdir("screenshots")
@@ -493,7 +543,7 @@ def parse_args():
     parser.add_argument(
         "-d",
         "--dummy",
-        help="Use dummy video device (use when no video device is available)",
+        help="Don't open a window (use when no video device is available), play as fast as possible",
         action="store_true",
     )
     parser.add_argument(
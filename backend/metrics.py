@@ -0,0 +1,148 @@
+"""Server telemetry, served in the Prometheus text format.
+
+The simulation side (ticks, command queue) is measured wherever the
+simulation runs, possibly another process: SimulationMetrics is attached to
+the updates it publishes (cumulative, so skipped updates lose nothing) and
+the room keeps the latest. Without updates to carry it (the frame isn't
+changing), it's published on its own every PUBLISH_INTERVAL seconds. The fan-out side (connections, bytes and
+messages sent, encoding) is measured by the room itself. `render` formats
+everything, `serve` answers scrapes on a side port:
+
+    curl localhost:9100/metrics
+"""
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+logger = logging.getLogger("WS Server")
+
+TICK_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+ENCODE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+PUBLISH_INTERVAL = 1.0
+
+# Name: (type, help), in the order they are rendered
+METRICS = {
+    "canvas_tick_seconds": ("histogram", "Time spent in a game tick"),
+    "canvas_tick_overruns_total": ("counter", "Ticks that started late"),
+    "canvas_ticks_skipped_total": ("counter", "Ticks skipped to catch up with the schedule"),
+    "canvas_commands_queued": ("gauge", "Commands waiting for the next tick"),
+    "canvas_commands_applied_total": ("counter", "Commands applied to the game"),
+    "canvas_commands_dropped_total": ("counter", "Commands dropped when coalescing a tick"),
+    "canvas_encode_seconds": ("histogram", "Time spent encoding an update for every wire format"),
+    "canvas_subscribers": ("gauge", "Connected clients"),
+    "canvas_messages_sent_total": ("counter", "Messages written to clients"),
+    "canvas_bytes_sent_total": ("counter", "Bytes written to clients"),
+    "canvas_updates_dropped_total": ("counter", "Updates not sent to clients lagging behind"),
+    "canvas_connections_dropped_total": ("counter", "Clients dropped for lagging behind too long"),
+}
+
+
+class Histogram:
+    """Counts of observed values per bucket, cumulated when rendered."""
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def copy(self) -> "Histogram":
+        histogram = Histogram(self.buckets)
+        histogram.counts, histogram.sum = list(self.counts), self.sum
+        return histogram
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class SimulationMetrics:
+    """Tick telemetry of a simulation, see `simulation` in wsserver."""
+
+    def __init__(self) -> None:
+        self.tick_seconds = Histogram(TICK_BUCKETS)
+        self.overruns = 0
+        self.skipped = 0
+        self.queued = 0
+        self.applied = 0
+        self.dropped = 0
+
+    def snapshot(self) -> "SimulationMetrics":
+        snapshot = SimulationMetrics()
+        snapshot.__dict__.update(self.__dict__)
+        snapshot.tick_seconds = self.tick_seconds.copy()
+        return snapshot
+
+    def prepare(self) -> "SimulationMetrics":
+        """Published as is, like an update there's nothing to encode."""
+        return self
+
+    def samples(self, labels: dict) -> Iterable[tuple[str, dict, object]]:
+        yield "canvas_tick_seconds", labels, self.tick_seconds
+        yield "canvas_tick_overruns_total", labels, self.overruns
+        yield "canvas_ticks_skipped_total", labels, self.skipped
+        yield "canvas_commands_queued", labels, self.queued
+        yield "canvas_commands_applied_total", labels, self.applied
+        yield "canvas_commands_dropped_total", labels, self.dropped
+
+
+def _labels(labels: dict, **extra) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def render(samples: Iterable[tuple[str, dict, object]]) -> str:
+    """Prometheus text format of (name, labels, value) samples, values being
+    numbers or Histograms. Names must be in METRICS."""
+    by_name = {}
+    for name, labels, value in samples:
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        if name not in by_name:
+            continue
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in by_name[name]:
+            if isinstance(value, Histogram):
+                cumulative = 0
+                for bound, count in zip((*value.buckets, "+Inf"), value.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {value.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+            else:
+                lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+async def serve(samples: Callable[[], Iterable], address: str, port: int):
+    """Serve `render(samples())` to HTTP GET /metrics requests."""
+
+    async def respond(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+            path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+            if request.startswith(b"GET ") and path.split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", render(samples()).encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(respond, address, port)
+    logger.info("Metrics served at http://%s:%s/metrics", address, port)
+    return server
@@ -0,0 +1,302 @@
+"""Where the time of a tick goes.
+
+A TickProfiler times each phase of the ticks it runs (see PHASES) into a
+ring buffer, and can capture a profile of the next N ticks: either stack
+samples (written in the folded format flamegraph.pl and speedscope read) or
+a cProfile dump. It's all off by default and switched on at runtime with
+signals to the process running the simulation:
+
+    kill -USR1 <pid>  # Start timing phases, or stop and write a report
+    kill -USR2 <pid>  # Capture the next ticks, then write the profile
+
+Files are written to the profiler's directory. While off, the simulation
+only checks `active` once per tick.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable
+
+import numpy as np
+
+logger = logging.getLogger("WS Server")
+
+# Phase: GameManager methods timed as part of it
+PHASES = {
+    "commands": ("read_user_commands", "execute_user_commands"),
+    "update": ("update_game_state",),
+    "frame": ("game_frame",),
+    "owners": ("owners",),
+    "diff": ("get_pixel_updates", "get_owner_updates"),
+    "encode": (),  # Updates are encoded for every wire format before publish
+    "publish": ("keyframe", "publish"),
+}
+_ENCODE = list(PHASES).index("encode")
+_PUBLISH = list(PHASES).index("publish")
+SAMPLE = "sample"
+CPROFILE = "cprofile"
+MODES = (SAMPLE, CPROFILE)
+
+# Profilers of this process, acted on by the signal handlers
+PROFILERS = []
+
+
+class TickProfiler:
+    """Times tick phases and captures profiles of `name`'s ticks, see
+    `tick`. `capacity` ticks are kept, `capture_ticks` are captured at a
+    time, in `mode` (SAMPLE or CPROFILE)."""
+
+    def __init__(
+        self,
+        name: str,
+        directory: str = "profiles",
+        capacity: int = 1024,
+        capture_ticks: int = 300,
+        mode: str = SAMPLE,
+        sample_interval: float = 0.0005,
+    ) -> None:
+        self.name = name
+        self.directory = directory
+        self.capture_ticks = capture_ticks
+        self.mode = mode
+        self.sample_interval = sample_interval
+        # Seconds per phase (and the whole tick, last) of the last ticks
+        self.timings = np.zeros((capacity, len(PHASES) + 1))
+        self.ticks = 0  # Timed so far, the newest is at (ticks - 1) % capacity
+        self.timing = False
+        self.active = False  # Timing or capturing
+        self._capture_requested = False
+        self._capture = None  # (ticks left, cProfile.Profile or Sampler)
+        self._current = np.zeros(len(PHASES))
+        self._in_tick = False
+
+    def toggle_timing(self) -> None:
+        """Start timing phases, or stop and write the report."""
+        self.timing = not self.timing
+        if self.timing:
+            self.ticks = 0
+        else:
+            self.write_report()
+        self._update_active()
+
+    def request_capture(self) -> None:
+        """Capture the next `capture_ticks` ticks."""
+        self._capture_requested = True
+        self._update_active()
+
+    def _update_active(self) -> None:
+        self.active = self.timing or self._capture_requested or self._capture is not None
+
+    def tick(self, tick: Callable, manager) -> None:
+        """Run `tick` (a GameManager tick), timing the phases of `manager`."""
+        if self._capture_requested:
+            self._capture_requested = False
+            self._start_capture()
+        self._current[:] = 0
+        # Instance attributes (like publish) to restore, the others are methods
+        originals = {}
+        for index, phase in enumerate(PHASES.values()):
+            for name in phase:
+                if name in vars(manager):
+                    originals[name] = vars(manager)[name]
+                method = getattr(manager, name)
+                if name == "publish":
+                    method = self._encoding(method)
+                setattr(manager, name, self._timed(method, index))
+        start = time.perf_counter()
+        self._in_tick = True
+        try:
+            tick()
+        finally:
+            self._in_tick = False
+            duration = time.perf_counter() - start
+            for phase in PHASES.values():
+                for name in phase:
+                    if name in originals:
+                        setattr(manager, name, originals[name])
+                    else:
+                        delattr(manager, name)
+        row = self.timings[self.ticks % len(self.timings)]
+        row[:-1], row[-1] = self._current, duration
+        self.ticks += 1
+        if self._capture is not None:
+            self._count_captured_tick()
+
+    def _timed(self, method: Callable, index: int) -> Callable:
+        current = self._current
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                current[index] += time.perf_counter() - start
+
+        return timed
+
+    def _encoding(self, publish: Callable) -> Callable:
+        """`publish`, encoding updates first (it would happen later anyway),
+        timed apart."""
+        current = self._current
+
+        def encoding(update, keyframe):
+            start = time.perf_counter()
+            update.prepare()
+            encoded = time.perf_counter() - start
+            current[_ENCODE] += encoded
+            current[_PUBLISH] -= encoded
+            publish(update, keyframe)
+
+        return encoding
+
+    def _start_capture(self) -> None:
+        if self._capture is not None:
+            return
+        if self.mode == CPROFILE:
+            recorder = cProfile.Profile()
+            recorder.enable()
+        else:
+            recorder = Sampler(lambda: self._in_tick, self.sample_interval)
+            recorder.start()
+        self._capture = [self.capture_ticks, recorder]
+        logger.info("Profiling %s ticks of %s (%s)", self.capture_ticks, self.name, self.mode)
+
+    def _count_captured_tick(self) -> None:
+        self._capture[0] -= 1
+        if self._capture[0] > 0:
+            return
+        recorder = self._capture[1]
+        self._capture = None
+        self._update_active()
+        if isinstance(recorder, cProfile.Profile):
+            recorder.disable()
+            path = self._path("prof")
+            recorder.dump_stats(path)
+            with open(self._path("txt"), "w", encoding="utf-8") as report:
+                stats = pstats.Stats(recorder, stream=report)
+                stats.sort_stats("cumulative").print_stats(40)
+        else:
+            recorder.stop()
+            path = self._path("folded")
+            recorder.write(path)
+        logger.info("Profile of %s written to %s", self.name, path)
+        if not self.timing:
+            self.write_report()
+
+    def _path(self, extension: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.directory, f"{self.name}-{os.getpid()}-{stamp}.{extension}")
+
+    def last_timings(self) -> np.ndarray:
+        """(ticks, phases + 1) seconds of the ticks kept, oldest first."""
+        capacity = len(self.timings)
+        if self.ticks <= capacity:
+            return self.timings[: self.ticks]
+        return np.roll(self.timings, -(self.ticks % capacity), axis=0)
+
+    def report(self) -> str:
+        timings = self.last_timings() * 1e3
+        lines = [f"{self.name}: {len(timings)} ticks, ms per tick"]
+        if not len(timings):
+            return lines[0] + "\n"
+        total = timings[:, -1].sum()
+        lines.append(f"{'phase':10} {'mean':>9} {'p50':>9} {'p99':>9} {'max':>9} {'share':>6}")
+        for name, column in zip((*PHASES, "tick"), timings.T):
+            p50, p99 = np.percentile(column, (50, 99))
+            lines.append(
+                f"{name:10} {column.mean():9.3f} {p50:9.3f} {p99:9.3f} {column.max():9.3f} "
+                f"{column.sum() / total if total else 0:6.1%}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_report(self) -> None:
+        path = self._path("phases.txt")
+        with open(path, "w", encoding="utf-8") as report:
+            report.write(self.report())
+        logger.info("Tick phases of %s written to %s", self.name, path)
+
+
+class Sampler:
+    """Samples the stack of the calling thread every `interval` seconds of
+    CPU time while `sampling()`, counting each distinct stack. From the main
+    thread the samples are taken by a SIGPROF handler, right where the
+    thread is. From other threads a sampling thread takes them, but only
+    when it gets the GIL, which biases the samples towards code releasing
+    it."""
+
+    def __init__(self, sampling: Callable[[], bool], interval: float) -> None:
+        self.sampling = sampling
+        self.interval = interval
+        self.stacks = Counter()
+        self.target = threading.get_ident()
+        self._with_signal = threading.current_thread() is threading.main_thread() and hasattr(
+            signal, "setitimer"
+        )
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._previous = None
+
+    def start(self) -> None:
+        if self._with_signal:
+            self._previous = signal.signal(signal.SIGPROF, lambda _signum, frame: self._sample(frame))
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            # Or the sampled thread keeps the GIL through whole ticks
+            self._previous = sys.getswitchinterval()
+            sys.setswitchinterval(self.interval)
+            self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self._sample(sys._current_frames().get(self.target))  # pylint:disable=protected-access
+
+    def _sample(self, frame) -> None:
+        if not self.sampling():
+            return
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        if self._with_signal:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self._previous)
+        else:
+            self._stop_event.set()
+            self._thread.join()
+            sys.setswitchinterval(self._previous)
+
+    def write(self, path: str) -> None:
+        """Folded stacks, one "frame;frame;frame count" per line."""
+        with open(path, "w", encoding="utf-8") as folded:
+            for stack, count in self.stacks.most_common():
+                folded.write(f"{stack} {count}\n")
+
+
+def _on_signal(signum, _frame) -> None:
+    for profiler in PROFILERS:
+        if signum == signal.SIGUSR1:
+            profiler.toggle_timing()
+        else:
+            profiler.request_capture()
+
+
+def install_signal_handlers() -> None:
+    """Act on SIGUSR1 and SIGUSR2 for the PROFILERS of this process. Only
+    possible from the main thread, elsewhere it's left to the caller."""
+    if threading.current_thread() is not threading.main_thread() or not hasattr(signal, "SIGUSR1"):
+        return
+    signal.signal(signal.SIGUSR1, _on_signal)
+    signal.signal(signal.SIGUSR2, _on_signal)
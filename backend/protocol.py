@@ -0,0 +1,264 @@
+"""Wire formats for the game state messages sent to clients.
+
+Clients that don't negotiate a subprotocol get JSON text messages:
+
+    {"type": "full", "seq": 1, "pixels": [...], "names": {id: name},
+     "owners": {idx: id}, "meta": {...}}
+    {"type": "delta", "seq": 2, "pixels": {idx: value}, "names": {id: name},
+     "owners": {idx: id}}
+
+Owners are sent as ids into a table of owner names. Keyframes carry the
+names of the current owners, deltas those of the owners new to the frame,
+so a client following the stream can name every owner it shows. Ids
+needn't be consecutive.
+Owner ids are None (NO_OWNER in binary) for pixels that lost their owner.
+
+Clients that negotiate BINARY_SUBPROTOCOL get binary messages instead, all
+integers little-endian:
+
+    header:  u8 type (0 full, 1 delta), u8 version, u16 width, u16 height,
+             u32 seq
+    full:    width * height u8 palette indices
+    delta:   u32 n, n u32 pixel indices, n u8 palette indices
+    names:   u16 m, m u16 owner ids, m names (u16 byte length + utf-8)
+    owners:  u32 k, k u32 pixel indices, k u16 owner ids (NO_OWNER if removed)
+"""
+import json
+import struct
+import time
+
+import numpy as np
+from websockets.frames import Frame, Opcode
+
+BINARY_SUBPROTOCOL = "canvas.binary.v1"
+SUBPROTOCOLS = [BINARY_SUBPROTOCOL]
+
+FULL = "full"
+DELTA = "delta"
+
+VERSION = 3
+NO_OWNER = 0xFFFF
+_TYPES = {FULL: 0, DELTA: 1}
+_HEADER = struct.Struct("<BBHHI")
+_COUNT = struct.Struct("<I")
+_LENGTH = struct.Struct("<H")
+
+
+class Update:
+    """A game state message. It's encoded at most once per wire format, no
+    matter how many clients it is sent to.
+
+    For keyframes `values` is the whole flat palette frame and `indices` is
+    None, for deltas `values` are the new palette indices of the pixels at
+    `indices`. `owners` maps pixel index to owner id (None if removed),
+    `names` maps owner ids to names: the current owners' in keyframes, the
+    owners new to the frame in deltas.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        seq: int,
+        resolution: tuple[int, int],
+        values: np.ndarray,
+        owners: dict,
+        indices: np.ndarray | None = None,
+        names: dict | None = None,
+    ) -> None:
+        self.kind = kind
+        self.seq = seq
+        self.resolution = resolution
+        self.values = values
+        self.owners = owners
+        self.indices = indices
+        self.names = names if names is not None else {}
+        self._json = None
+        self._binary = None
+        self._websocket_frames = {}
+        self.encode_seconds = 0.0  # Spent encoding and framing so far
+        self.metrics = None  # Telemetry of the simulation, see metrics
+
+    @property
+    def keyframe(self) -> bool:
+        return self.kind == FULL
+
+    def encode(self, subprotocol: str | None = None) -> str | bytes:
+        """Message for a connection that negotiated `subprotocol`."""
+        if subprotocol == BINARY_SUBPROTOCOL:
+            return self.binary
+        return self.json
+
+    def prepare(self, subprotocols=(None, *SUBPROTOCOLS)) -> "Update":
+        """Encode and frame the message for all `subprotocols` right away, so
+        it can be handed over ready to send (e.g. from a worker)."""
+        for subprotocol in subprotocols:
+            self.websocket_frame(subprotocol)
+        return self
+
+    def websocket_frame(self, subprotocol: str | None = None) -> bytes:
+        """The encoded message wrapped in a ready to write, unmasked and
+        uncompressed websocket frame, so it can be written as-is to every
+        server connection that negotiated `subprotocol`."""
+        websocket_frame = self._websocket_frames.get(subprotocol)
+        if websocket_frame is None:
+            start = time.perf_counter()
+            message = self.encode(subprotocol)
+            if isinstance(message, str):
+                websocket_frame = Frame(Opcode.TEXT, message.encode())
+            else:
+                websocket_frame = Frame(Opcode.BINARY, message)
+            websocket_frame = websocket_frame.serialize(mask=False)
+            self._websocket_frames[subprotocol] = websocket_frame
+            self.encode_seconds += time.perf_counter() - start
+        return websocket_frame
+
+    @property
+    def json(self) -> str:
+        if self._json is None:
+            message = {"type": self.kind, "seq": self.seq}
+            if self.keyframe:
+                message["pixels"] = self.values.tolist()
+            else:
+                message["pixels"] = dict(
+                    zip(self.indices.tolist(), self.values.tolist())
+                )
+            message["names"] = self.names
+            message["owners"] = self.owners
+            if self.keyframe:
+                message["meta"] = {
+                    "width": self.resolution[0],
+                    "height": self.resolution[1],
+                }
+            self._json = json.dumps(message)
+        return self._json
+
+    @property
+    def binary(self) -> bytes:
+        if self._binary is None:
+            width, height = self.resolution
+            parts = [
+                _HEADER.pack(_TYPES[self.kind], VERSION, width, height, self.seq)
+            ]
+            if not self.keyframe:
+                parts.append(_COUNT.pack(len(self.indices)))
+                parts.append(np.asarray(self.indices, dtype="<u4").tobytes())
+            parts.append(np.asarray(self.values, dtype=np.uint8).tobytes())
+            parts.extend(_encode_names(self.names))
+            parts.extend(_encode_owners(self.owners))
+            self._binary = b"".join(parts)
+        return self._binary
+
+
+class GameState:
+    """Game state rebuilt from the stream of updates, like a client does.
+    Serves keyframes of the current state wherever the simulation runs."""
+
+    def __init__(self) -> None:
+        self.seq = None
+        self.resolution = None
+        self.frame = None
+        self.owners = {}
+        self.names = {}
+        self._keyframe = None
+
+    def apply(self, update: Update) -> None:
+        if update.keyframe:
+            self.frame, self.owners = update.values, update.owners
+            self.names = update.names
+            self._keyframe = update
+        else:
+            if self._keyframe is not None and self._keyframe.values is self.frame:
+                # Don't modify the arrays shared with the cached keyframe
+                self.frame, self.owners = self.frame.copy(), dict(self.owners)
+                self.names = dict(self.names)
+            self.frame[update.indices] = update.values
+            self.names.update(update.names)
+            for index, owner in update.owners.items():
+                if owner is None:
+                    self.owners.pop(index, None)
+                else:
+                    self.owners[index] = owner
+        self.seq = update.seq
+        self.resolution = update.resolution
+
+    def keyframe(self) -> Update | None:
+        """Full state as of the last applied update, None before the first.
+        It's built (and encoded) at most once per update."""
+        if self.seq is None:
+            return None
+        if self._keyframe is None or self._keyframe.seq != self.seq:
+            # Only the current owners, deltas name the owners they add
+            owner_ids = set(self.owners.values())
+            self.names = {owner_id: name for owner_id, name in self.names.items() if owner_id in owner_ids}
+            self._keyframe = Update(
+                FULL, self.seq, self.resolution, self.frame, self.owners, names=self.names
+            )
+        return self._keyframe
+
+
+def _encode_names(names: dict) -> list[bytes]:
+    parts = [
+        _LENGTH.pack(len(names)),
+        np.fromiter(names.keys(), dtype="<u2", count=len(names)).tobytes(),
+    ]
+    for name in names.values():
+        encoded = str(name).encode()
+        parts.append(_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+    return parts
+
+
+def _encode_owners(owners: dict) -> list[bytes]:
+    ids = np.fromiter(
+        (NO_OWNER if owner_id is None else owner_id for owner_id in owners.values()),
+        dtype="<u2",
+        count=len(owners),
+    )
+    return [
+        _COUNT.pack(len(owners)),
+        np.fromiter(owners.keys(), dtype="<u4", count=len(owners)).tobytes(),
+        ids.tobytes(),
+    ]
+
+
+def decode_binary(data: bytes) -> dict:
+    """Decode a binary message into the same structure as its JSON
+    counterpart. Meant for tools and tests, clients decode on their own."""
+    kind, _version, width, height, seq = _HEADER.unpack_from(data)
+    offset = _HEADER.size
+    message = {"type": FULL if kind == _TYPES[FULL] else DELTA, "seq": seq}
+    if message["type"] == FULL:
+        pixels = np.frombuffer(data, np.uint8, width * height, offset)
+        offset += width * height
+        message["pixels"] = pixels.tolist()
+    else:
+        (count,) = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        indices = np.frombuffer(data, "<u4", count, offset)
+        offset += 4 * count
+        values = np.frombuffer(data, np.uint8, count, offset)
+        offset += count
+        message["pixels"] = dict(zip(indices.tolist(), values.tolist()))
+
+    (name_count,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    owner_ids = np.frombuffer(data, "<u2", name_count, offset)
+    offset += 2 * name_count
+    message["names"] = {}
+    for owner_id in owner_ids.tolist():
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        message["names"][owner_id] = data[offset : offset + length].decode()
+        offset += length
+    (count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    indices = np.frombuffer(data, "<u4", count, offset)
+    offset += 4 * count
+    ids = np.frombuffer(data, "<u2", count, offset)
+    message["owners"] = {
+        index: None if owner_id == NO_OWNER else owner_id
+        for index, owner_id in zip(indices.tolist(), ids.tolist())
+    }
+    if message["type"] == FULL:
+        message["meta"] = {"width": width, "height": height}
+    return message
@@ -0,0 +1,168 @@
+"""Snapshots of running games on disk, to continue them after a restart.
+
+A snapshot is a directory holding the frame (palette indices) and owners
+grid as .npy files, the arrays of the game's snapshot_state as more .npy
+files, and everything else (owner names, sequence number, the other state
+values) in meta.json:
+
+    snapshots/<game>/<time>-<seq>/frame.npy
+                                  owners.npy
+                                  state.board.npy
+                                  meta.json
+
+Taking a snapshot in the tick only copies the game's state arrays, the
+frame and owners are the ones just broadcast. Everything is written by a
+background thread, to a temporary directory renamed once complete, so the
+latest snapshot is always whole. Loading memory-maps the arrays.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from games.interface import CanvasApp
+
+logger = logging.getLogger("WS Server")
+
+META = "meta.json"
+
+
+class Snapshot(NamedTuple):
+    seq: int
+    frame: np.ndarray  # (height, width) uint8
+    owners: np.ndarray  # (height, width) uint16
+    names: list
+    state: dict
+
+
+def capture(game: CanvasApp, seq: int, frame: np.ndarray, owners: np.ndarray) -> Snapshot | None:
+    """Snapshot of `game` as of now, None if it can't be restored. `frame`
+    and `owners` are its current palette frame and owners grid, as last
+    broadcast: they're not copied, the caller must not modify them."""
+    state = game.snapshot_state()
+    if state is None:
+        return None
+    state = {
+        key: value.copy() if isinstance(value, np.ndarray) else value
+        for key, value in state.items()
+    }
+    names = list(game.owner_names.names)
+    width, height = game.resolution
+    return Snapshot(seq, frame.reshape(height, width), owners.reshape(height, width), names, state)
+
+
+def write(directory: str, snapshot: Snapshot) -> str:
+    """Write `snapshot` in a new directory under `directory`, return it."""
+    name = f"{time.time_ns()}-{snapshot.seq}"
+    temporary = os.path.join(directory, f".{name}")
+    os.makedirs(temporary)
+    np.save(os.path.join(temporary, "frame.npy"), snapshot.frame)
+    np.save(os.path.join(temporary, "owners.npy"), snapshot.owners)
+    values = {}
+    for key, value in snapshot.state.items():
+        if isinstance(value, np.ndarray):
+            np.save(os.path.join(temporary, f"state.{key}.npy"), value)
+        else:
+            values[key] = value
+    with open(os.path.join(temporary, META), "w", encoding="utf-8") as meta:
+        json.dump({"seq": snapshot.seq, "names": snapshot.names, "state": values}, meta)
+    path = os.path.join(directory, name)
+    os.rename(temporary, path)
+    return path
+
+
+def saved(directory: str) -> list[str]:
+    """Complete snapshots in `directory`, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if not name.startswith(".")]
+    names.sort(key=lambda name: int(name.split("-")[0]))
+    return [os.path.join(directory, name) for name in names]
+
+
+def load(path: str) -> Snapshot:
+    """Read a snapshot, its arrays memory-mapped read-only."""
+    with open(os.path.join(path, META), encoding="utf-8") as meta_file:
+        meta = json.load(meta_file)
+    state = meta["state"]
+    for name in os.listdir(path):
+        if name.startswith("state.") and name.endswith(".npy"):
+            state[name[len("state.") : -len(".npy")]] = np.load(os.path.join(path, name), mmap_mode="r")
+    return Snapshot(
+        meta["seq"],
+        np.load(os.path.join(path, "frame.npy"), mmap_mode="r"),
+        np.load(os.path.join(path, "owners.npy"), mmap_mode="r"),
+        meta["names"],
+        state,
+    )
+
+
+def copy(path: str, destination: str) -> str:
+    """Copy the snapshot at `path` to `destination`, out of reach of the
+    Snapshotter's pruning. Files are hard-linked where possible, they're
+    never modified."""
+
+    def link(source, target):
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    shutil.copytree(path, destination, copy_function=link)
+    return destination
+
+
+def restore(game: CanvasApp, snapshot: Snapshot) -> None:
+    """Continue `snapshot` on `game`, a new game of the same resolution."""
+    width, height = game.resolution
+    if snapshot.frame.shape != (height, width):
+        raise ValueError(f"Snapshot is {snapshot.frame.shape[::-1]}, the game {width}x{height}")
+    for name in snapshot.names:
+        game.owner_names.intern(name)
+    game.restore_state(snapshot.state, snapshot.frame, snapshot.owners)
+
+
+class Snapshotter:
+    """Snapshots a game every `interval` seconds into `directory`, keeping
+    the last `keep`. Writes happen in a background thread, one at a time: a
+    snapshot due while the previous one is still being written is skipped."""
+
+    def __init__(self, directory: str, interval: float = 60, keep: int = 3) -> None:
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self._last = time.monotonic()
+        self._writer = None
+
+    def update(self, game: CanvasApp, seq: int, frame: np.ndarray, owners: np.ndarray) -> None:
+        """Snapshot `game` if one is due, call it between ticks, see capture."""
+        if time.monotonic() - self._last < self.interval:
+            return
+        self._last = time.monotonic()
+        if self._writer is not None and self._writer.is_alive():
+            logger.warning("Skipping snapshot, the previous one is still being written")
+            return
+        snapshot = capture(game, seq, frame, owners)
+        if snapshot is None:
+            return
+        self._writer = threading.Thread(target=self._write, args=(snapshot,), name="snapshot", daemon=True)
+        self._writer.start()
+
+    def _write(self, snapshot: Snapshot) -> None:
+        try:
+            path = write(self.directory, snapshot)
+            for old in saved(self.directory)[: -self.keep]:
+                shutil.rmtree(old, ignore_errors=True)
+            logger.debug("Snapshot written to %s", path)
+        except OSError as exc:
+            logger.error("Snapshot failed: %s", exc)
+
+    def close(self) -> None:
+        """Wait for the snapshot being written, if any."""
+        if self._writer is not None:
+            self._writer.join()
@@ -0,0 +1,157 @@
+import random
+import sys
+import threading
+from collections import deque
+
+import numpy as np
+import pytest
+
+import commandlog
+from protocol import Update
+from commands import Command
+
+
+def test_log_round_trip(tmp_path):
+    path = str(tmp_path / "game.log")
+    log = commandlog.CommandLog(path, {"game": "tetris", "seed": 7})
+    ticks = [[Command(1, 2, "alice"), Command(3, 4, "bób")], [], [Command(5, 6, "alice")]]
+    for commands in ticks:
+        log.write(commands)
+    log.close(3, np.arange(4, dtype=np.uint8))
+    read = commandlog.read(path)
+    assert read.header == {"game": "tetris", "seed": 7}
+    assert read.ticks == ticks
+    assert read.end == commandlog.End(3, 3, commandlog.frame_checksum(np.arange(4, dtype=np.uint8)))
+
+
+def test_log_of_countless_users(tmp_path):
+    path = str(tmp_path / "game.log")
+    log = commandlog.CommandLog(path, {})
+    ticks = [[Command(tick, click % 64, f"user{tick}-{click}") for click in range(1000)] for tick in range(70)]
+    for commands in ticks:
+        log.write(commands)
+    log.close(0, None)
+    assert commandlog.read(path).ticks == ticks
+
+
+def test_log_cut_short_keeps_whole_ticks(tmp_path):
+    path = str(tmp_path / "game.log")
+    log = commandlog.CommandLog(path, {})
+    log.write([Command(1, 2, "alice")])
+    log.write([Command(3, 4, "bob"), Command(5, 6, "bob")])
+    log.close(2, None)
+    with open(path, "rb") as log_file:
+        data = log_file.read()
+    with open(path, "wb") as log_file:
+        log_file.write(data[: -commandlog.END.size - 3])
+    read = commandlog.read(path)
+    assert read.ticks == [[Command(1, 2, "alice")]]
+    assert read.end is None
+
+
+def test_seeded_random_is_kept_apart():
+    first, second = commandlog.SeededRandom(1), commandlog.SeededRandom(1)
+    random.seed(0)
+    expected = random.random()
+    random.seed(0)
+    with first:
+        drawn = [random.random(), np.random.random()]
+    with second:
+        assert random.random() == drawn[0]
+    with first:
+        assert random.random() != drawn[0]
+    with second:
+        assert np.random.random() == drawn[1]
+    assert random.random() == expected
+
+
+def test_seeded_random_across_threads():
+    def draw(seed, results):
+        seeded = commandlog.SeededRandom(seed)
+        for _ in range(300):
+            with seeded:
+                results.append(random.random())
+
+    results = {seed: [] for seed in range(4)}
+    threads = [threading.Thread(target=draw, args=item) for item in results.items()]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Threads switch in the middle of the swaps
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    for seed, drawn in results.items():
+        expected = random.Random(seed)
+        assert drawn == [expected.random() for _ in range(300)]
+
+
+def test_logged_game_replays_the_same(tmp_path):
+    pytest.importorskip("pygame")
+    import wsserver  # pylint:disable=import-outside-toplevel
+    from benchmarks.replay import replay  # pylint:disable=import-outside-toplevel
+
+    commands, published = deque(), []
+    ticks = wsserver.simulation(
+        commands,
+        lambda update, keyframe: published.append(update),
+        "tetris",
+        framerate=1000,
+        clicks_per_user=2,
+        log_dir=str(tmp_path),
+    )
+    next(ticks)
+    for tick in range(300):
+        if tick % 3 == 0:
+            # Each click twice, coalescing drops the repeats before they're logged
+            commands.extend(Command(20 + tick % 25, 30 + user, f"user{user}") for user in (0, 1, 2) * 2)
+        next(ticks)
+    ticks.close()
+    (log_path,) = (tmp_path / "tetris").iterdir()
+    result = replay(str(log_path))
+    assert result["ticks"] == 300
+    assert result["commands"] == 300
+    assert result["updates"] == sum(isinstance(update, Update) for update in published)
+    assert result["matches"] is True
+
+
+def test_restored_game_replays_without_the_snapshots(tmp_path):
+    pytest.importorskip("pygame")
+    import shutil  # pylint:disable=import-outside-toplevel
+
+    import snapshots  # pylint:disable=import-outside-toplevel
+    import wsserver  # pylint:disable=import-outside-toplevel
+    from benchmarks.replay import replay  # pylint:disable=import-outside-toplevel
+    from games.tetris import tetris  # pylint:disable=import-outside-toplevel
+
+    game = tetris.Game()
+    for tick in range(100):
+        game.click_at(20 + tick % 20, 30, owner="alice")
+        game.update()
+    snapshot = snapshots.capture(game, 1, game.palette_frame, game.owners_grid)
+    snapshots.write(str(tmp_path / "snapshots" / "tetris"), snapshot)
+    commands = deque()
+    ticks = wsserver.simulation(
+        commands,
+        lambda update, keyframe: None,
+        "tetris",
+        framerate=1000,
+        snapshot_dir=str(tmp_path / "snapshots"),
+        snapshot_interval=0,
+        restore=True,
+        seed=1,
+        log_dir=str(tmp_path / "logs"),
+    )
+    for tick in range(50):
+        commands.append(Command(30, 20 + tick % 10, "bob"))
+        next(ticks)
+    ticks.close()
+    shutil.rmtree(tmp_path / "snapshots")  # Pruned since
+    (log_path,) = (tmp_path / "logs" / "tetris").glob("*.log")
+    assert replay(str(log_path))["matches"] is True
+
+    shutil.rmtree(log_path.with_suffix(".snapshot"))
+    with pytest.raises(FileNotFoundError):
+        replay(str(log_path))
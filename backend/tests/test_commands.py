@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from commands import Command, CommandError, coalesce, parse_message
+
+RESOLUTION = (64, 32)
+
+
+def test_valid_command():
+    message = json.dumps({"x": 63, "y": 31, "user": "alice", "extra": 1})
+    assert parse_message(message, RESOLUTION) == Command(63, 31, "alice")
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "not json",
+        b"\xff\xfe",
+        json.dumps([1, 2]),
+        json.dumps({"x": 1, "y": 2}),
+        json.dumps({"x": 1.5, "y": 2, "user": "a"}),
+        json.dumps({"x": True, "y": 2, "user": "a"}),
+        json.dumps({"x": "1", "y": 2, "user": "a"}),
+        json.dumps({"x": 64, "y": 2, "user": "a"}),
+        json.dumps({"x": 1, "y": -1, "user": "a"}),
+        json.dumps({"x": 1, "y": 2, "user": None}),
+        json.dumps({"x": 1, "y": 2, "user": "a" * 1000}),
+    ],
+)
+def test_invalid_command(message):
+    with pytest.raises(CommandError):
+        parse_message(message, RESOLUTION)
+
+
+@pytest.mark.parametrize("message", ['{"type":"keyframe"}', '{"type": "keyframe"}', b'{ "type" : "keyframe" }'])
+def test_keyframe_request_in_any_format(message):
+    # JSON.stringify, as the frontend sends it, is compact
+    assert parse_message(message, RESOLUTION) is None
+    assert parse_message(message, None) is None
+
+
+def test_messages_are_commands_otherwise():
+    message = json.dumps({"x": 1, "y": 2, "user": "alice"})
+    assert parse_message(message, RESOLUTION) == Command(1, 2, "alice")
+    with pytest.raises(CommandError):
+        parse_message(message, None)
+    with pytest.raises(CommandError):
+        parse_message(json.dumps({"type": "other"}), RESOLUTION)
+
+
+def test_coalesce_dedupes_caps_and_takes_turns():
+    commands = [
+        Command(0, 0, "heavy"),
+        Command(1, 0, "heavy"),
+        Command(0, 0, "light"),  # Already clicked this tick
+        Command(2, 0, "heavy"),
+        Command(3, 0, "heavy"),  # Over the cap
+        Command(4, 0, "light"),
+        Command(5, 0, "other"),
+    ]
+    coalesced = coalesce(commands, per_user=3)
+    assert [(c.x, c.user) for c in coalesced] == [
+        (0, "heavy"), (4, "light"), (5, "other"), (1, "heavy"), (2, "heavy")
+    ]
+    assert coalesce(commands, per_user=3, limit=2) == coalesced[:2]
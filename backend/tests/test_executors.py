@@ -0,0 +1,38 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from executors import EXECUTORS
+from protocol import FULL, Update
+
+
+def echo_simulation(commands, publish):
+    """Publishes every command it receives as the seq of a keyframe."""
+    while True:
+        while commands:
+            seq = commands.popleft()
+            publish(Update(FULL, seq, (1, 1), np.zeros(1, np.uint8), {}), True)
+        yield 0.001
+
+
+@pytest.mark.parametrize("name", list(EXECUTORS))
+def test_commands_in_updates_out(name):
+    async def main():
+        published = asyncio.Queue()
+        executor = EXECUTORS[name](
+            echo_simulation, lambda update, keyframe: published.put_nowait(update)
+        )
+        task = asyncio.create_task(executor.run())
+        for seq in (1, 2, 3):
+            executor.submit(seq)
+        received = [await asyncio.wait_for(published.get(), 10) for _ in range(3)]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return received
+
+    received = asyncio.run(main())
+    assert [update.seq for update in received] == [1, 2, 3]
+    if name != "inline":
+        # Encoded by the worker, ready to send
+        assert all(update._websocket_frames for update in received)
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from websockets.connection import State
+
+from fanout import Broadcaster
+from protocol import BINARY_SUBPROTOCOL, DELTA, FULL, Update
+
+
+class FakeTransport:
+    def __init__(self) -> None:
+        self.written = []
+        self.buffered = 0
+        self.aborted = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+    def abort(self):
+        self.aborted = True
+
+
+class FakeConnection:
+    remote_address = ("127.0.0.1", 0)
+
+    def __init__(self, subprotocol=None) -> None:
+        self.subprotocol = subprotocol
+        self.state = State.OPEN
+        self.transport = FakeTransport()
+
+
+@pytest.fixture
+def keyframe():
+    yield Update(FULL, 1, (2, 2), np.zeros(4, dtype=np.uint8), {})
+
+
+@pytest.fixture
+def delta():
+    yield Update(
+        DELTA, 2, (2, 2), np.ones(1, dtype=np.uint8), {}, indices=np.array([3])
+    )
+
+
+def test_keyframe_sent_on_add(keyframe):
+    broadcaster = Broadcaster(lambda: keyframe)
+    connection = FakeConnection()
+    broadcaster.add(connection)
+    assert connection.transport.written == [keyframe.websocket_frame()]
+    assert len(broadcaster) == 1
+
+
+def test_same_bytes_to_every_connection(delta):
+    broadcaster = Broadcaster(lambda: None)
+    json_connections = [FakeConnection() for _ in range(3)]
+    binary_connections = [FakeConnection(BINARY_SUBPROTOCOL) for _ in range(2)]
+    for connection in json_connections + binary_connections:
+        broadcaster.add(connection)
+    broadcaster.broadcast(delta)
+    json_frames = {id(c.transport.written[0]) for c in json_connections}
+    binary_frames = {id(c.transport.written[0]) for c in binary_connections}
+    assert len(json_frames) == 1
+    assert len(binary_frames) == 1
+    assert binary_connections[0].transport.written[0].endswith(delta.binary)
+    assert broadcaster.messages_sent == 5
+    assert broadcaster.bytes_sent == 3 * len(delta.websocket_frame()) + 2 * len(
+        delta.websocket_frame(BINARY_SUBPROTOCOL)
+    )
+
+
+def test_closed_and_removed_connections_are_skipped(delta):
+    broadcaster = Broadcaster(lambda: None)
+    closing, removed = FakeConnection(), FakeConnection()
+    broadcaster.add(closing)
+    broadcaster.add(removed)
+    closing.state = State.CLOSING
+    broadcaster.remove(removed)
+    broadcaster.broadcast(delta)
+    assert closing.transport.written == []
+    assert removed.transport.written == []
+    assert len(broadcaster) == 1
+
+
+def test_lagging_connection_resyncs_with_keyframe(keyframe, delta):
+    broadcaster = Broadcaster(lambda: keyframe, max_buffer=10)
+    connection = FakeConnection()
+    broadcaster.add(connection)
+    connection.transport.buffered = 11
+    broadcaster.broadcast(delta)
+    assert connection.transport.written == [keyframe.websocket_frame()]
+    connection.transport.buffered = 0
+    broadcaster.broadcast(delta)
+    assert connection.transport.written == [keyframe.websocket_frame()] * 2
+    broadcaster.broadcast(delta)
+    assert connection.transport.written[-1] == delta.websocket_frame()
+    assert broadcaster.dropped_updates == 1
+
+
+def test_connection_dropped_after_max_lag(delta):
+    broadcaster = Broadcaster(lambda: None, max_buffer=10, max_lag=3)
+    connection = FakeConnection()
+    broadcaster.add(connection)
+    connection.transport.buffered = 11
+    for _ in range(3):
+        broadcaster.broadcast(delta)
+    assert not connection.transport.aborted
+    broadcaster.broadcast(delta)
+    assert connection.transport.aborted
+    assert broadcaster.dropped_connections == 1
@@ -0,0 +1,75 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from framering import FrameRing
+from games.interface import OwnerNames
+from protocol import NO_OWNER
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing.create(4, 2, capacity=3)
+    yield ring
+    ring.close()
+
+
+def owner_ids(names, owners, size=8):
+    """Flat owner ids from a pixel index to name dict."""
+    ids = np.full(size, NO_OWNER, dtype=np.uint16)
+    for index, name in owners.items():
+        ids[index] = names.intern(name)
+    return ids
+
+
+def read_from_other_process(name, seq, results):
+    ring = FrameRing.attach(name)
+    frame, owners = ring.read(seq)
+    results.put((frame.tolist(), owners.tolist(), ring.names()))
+    ring.close()
+
+
+def test_write_and_view(ring):
+    assert ring.latest is None
+    frame = np.arange(8, dtype=np.uint8)
+    names = OwnerNames()
+    ring.write(1, frame, owner_ids(names, {0: "alice", 5: "bob", 6: "alice"}), names)
+    assert ring.latest == 1
+    view_frame, view_owners = ring.view(1)
+    assert view_frame.tolist() == frame.tolist()
+    assert view_owners.tolist() == [0, NO_OWNER, NO_OWNER, NO_OWNER, NO_OWNER, 1, 0, NO_OWNER]
+    assert ring.names() == ["alice", "bob"]
+    assert np.shares_memory(view_frame, ring.frames)
+
+
+def test_old_frames_are_overwritten(ring):
+    for seq in range(1, 6):
+        ring.write(seq, np.full(8, seq, dtype=np.uint8), owner_ids(OwnerNames(), {}), [])
+    assert ring.read(2) is None
+    assert ring.view(6) is None
+    assert [ring.read(seq)[0][0] for seq in (3, 4, 5)] == [3, 4, 5]
+
+
+def test_owner_ids_outlive_games(ring):
+    names = OwnerNames()
+    ring.write(1, np.zeros(8, dtype=np.uint8), owner_ids(names, {0: "alice"}), names)
+    # Next game, with its own ids
+    names = OwnerNames()
+    ring.write(2, np.zeros(8, dtype=np.uint8), owner_ids(names, {1: "bob", 2: "alice"}), names)
+    assert ring.read(2)[1][1:3].tolist() == [1, 0]
+    assert ring.names() == ["alice", "bob"]
+
+
+def test_attach_from_other_process(ring):
+    names = OwnerNames()
+    ring.write(7, np.full(8, 3, dtype=np.uint8), owner_ids(names, {2: "carol"}), names)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=read_from_other_process, args=(ring.name, 7, results))
+    process.start()
+    frame, owners, names = results.get(timeout=10)
+    process.join()
+    assert frame == [3] * 8
+    assert owners[2] == 0
+    assert names == ["carol"]
@@ -0,0 +1,51 @@
+import asyncio
+
+from metrics import TICK_BUCKETS, Histogram, SimulationMetrics, render, serve
+
+
+def test_render_histogram_and_counters():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+    text = render([
+        ("canvas_subscribers", {"game": "tetris"}, 3),
+        ("canvas_tick_seconds", {"game": "tetris"}, histogram),
+    ])
+    lines = text.splitlines()
+    # Rendered in METRICS order, whatever the order of the samples
+    assert lines[:2] == [
+        "# HELP canvas_tick_seconds Time spent in a game tick",
+        "# TYPE canvas_tick_seconds histogram",
+    ]
+    assert 'canvas_tick_seconds_bucket{game="tetris",le="0.1"} 1' in lines
+    assert 'canvas_tick_seconds_bucket{game="tetris",le="1.0"} 3' in lines
+    assert 'canvas_tick_seconds_bucket{game="tetris",le="+Inf"} 4' in lines
+    assert 'canvas_tick_seconds_count{game="tetris"} 4' in lines
+    assert 'canvas_subscribers{game="tetris"} 3' in lines
+
+
+def test_snapshots_are_independent():
+    telemetry = SimulationMetrics()
+    telemetry.tick_seconds.observe(0.002)
+    snapshot = telemetry.snapshot()
+    telemetry.tick_seconds.observe(0.002)
+    telemetry.applied += 4
+    assert snapshot.tick_seconds.count == 1 and snapshot.applied == 0
+    assert len(snapshot.tick_seconds.counts) == len(TICK_BUCKETS) + 1
+
+
+def test_serve():
+    async def scrape(path):
+        server = await serve(lambda: [("canvas_subscribers", {}, 7)], "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        server.close()
+        return response.decode()
+
+    response = asyncio.run(scrape("/metrics"))
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert response.endswith("canvas_subscribers 7\n")
+    assert asyncio.run(scrape("/")).startswith("HTTP/1.1 404")
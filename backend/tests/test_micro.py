@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("pygame")
+
+from benchmarks.micro import benchmarks, compare, measure
+
+
+def test_every_benchmark_runs():
+    names = []
+    for benchmark in benchmarks(sizes=[(32, 32)], subscribers=[3]):
+        result = measure(benchmark, min_time=0, min_calls=2)
+        assert result["calls"] == 2 and result["median_us"] > 0
+        if benchmark.close is not None:
+            benchmark.close()
+        names.append(benchmark.name)
+    assert "pubsub.publish[3]" in names
+    assert "tetris.broadcast_delta[32x32]" in names
+
+
+def test_compare_flags_regressions(capsys):
+    baseline = {"fast": {"median_us": 10.0}, "slow": {"median_us": 10.0}}
+    results = {"fast": {"median_us": 10.5}, "slow": {"median_us": 12.0}, "new": {"median_us": 1.0}}
+    assert compare(results, baseline, threshold=0.1) == ["slow"]
+    assert "(new)" in capsys.readouterr().out
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from games import palette
+
+FRONTEND_PALETTE = os.path.join(
+    os.path.dirname(__file__), "..", "..", "src", "components", "WebSafeColors.js"
+)
+
+
+def test_matches_pil_web_palette():
+    web = np.array(Image.new("RGB", (1, 1)).convert("P").getpalette(), dtype=np.uint8)
+    web = web.reshape(-1, 3)
+    assert (palette.PALETTE[: len(web)] == web).all()
+
+
+def test_palette_colors_map_to_themselves():
+    indices = palette.quantize(palette.PALETTE)
+    cube = slice(palette.CUBE_OFFSET + 1, palette.CUBE_OFFSET + palette.LEVELS**3)
+    assert (indices[cube] == np.arange(256)[cube]).all()
+    # All the blacks
+    assert not indices[: palette.CUBE_OFFSET + 1].any()
+
+
+def test_nearest_color():
+    assert palette.index((0, 0, 0)) == 0
+    assert palette.index((250, 5, 30)) == palette.index((255, 0, 51))
+    rgba = np.array([[[255, 255, 255, 0], [0, 0, 255, 255]]], dtype=np.uint8)
+    assert palette.quantize(rgba).tolist() == [[225, 190]]
+
+
+def test_image_indices():
+    rgb = np.random.default_rng(0).integers(0, 256, (4, 5, 3), dtype=np.uint8)
+    expected = palette.quantize(rgb)
+    image = Image.fromarray(rgb)
+    assert (palette.image_indices(image) == expected).all()
+    # Palette images are remapped, whatever their own palette
+    indexed = Image.fromarray(np.arange(20, dtype=np.uint8).reshape(4, 5), mode="P")
+    indexed.putpalette(rgb.reshape(-1).tobytes())
+    assert (palette.image_indices(indexed) == expected).all()
+
+
+@pytest.mark.skipif(not os.path.exists(FRONTEND_PALETTE), reason="No frontend")
+def test_frontend_copy_is_up_to_date():
+    with open(FRONTEND_PALETTE, encoding="utf-8") as palette_file:
+        assert palette_file.read() == palette.javascript()
@@ -0,0 +1,61 @@
+import functools
+import os
+from collections import deque
+
+import numpy as np
+
+from commands import Command
+from profiler import CPROFILE, PHASES, SAMPLE, TickProfiler
+from tests.test_wsserver import FakeGame
+from wsserver import GameManager
+
+
+def make_manager(published):
+    return GameManager(FakeGame(), deque(), lambda update, keyframe: published.append(update))
+
+
+def run_ticks(profiler, manager, count):
+    for tick in range(count):
+        manager.commands.append(Command(tick % 8, 0, "alice"))
+        manager.game.pixels[0, tick % 8] += 1
+        profiler.tick(functools.partial(manager.tick, None), manager)
+
+
+def test_phases_are_timed(tmp_path):
+    published = []
+    manager = make_manager(published)
+    publish = manager.publish
+    profiler = TickProfiler("fake", str(tmp_path), capacity=4)
+    assert not profiler.active
+    profiler.toggle_timing()
+    assert profiler.active
+    run_ticks(profiler, manager, 6)
+    timings = profiler.last_timings()
+    assert timings.shape == (4, len(PHASES) + 1)
+    assert (timings[:, list(PHASES).index("update")] > 0).all()
+    # Phases add up to at most the whole tick
+    assert (timings[:, :-1].sum(axis=1) <= timings[:, -1]).all()
+    assert len(published) == 6 and published[-1].encode_seconds > 0
+    # The manager is left as it was
+    assert manager.publish is publish
+    assert "tick" not in vars(manager) and "game_frame" not in vars(manager)
+
+    profiler.toggle_timing()
+    assert not profiler.active
+    (report,) = os.listdir(tmp_path)
+    assert report.endswith(".phases.txt")
+    assert "4 ticks" in (tmp_path / report).read_text()
+
+
+def test_capture(tmp_path):
+    for mode, extension in ((CPROFILE, ".prof"), (SAMPLE, ".folded")):
+        directory = tmp_path / mode
+        manager = make_manager([])
+        profiler = TickProfiler("fake", str(directory), capture_ticks=3, mode=mode)
+        profiler.request_capture()
+        run_ticks(profiler, manager, 3)
+        assert not profiler.active
+        files = os.listdir(directory)
+        assert any(name.endswith(extension) for name in files)
+        assert any(name.endswith(".phases.txt") for name in files)
+        assert np.count_nonzero(profiler.last_timings()[:, -1]) == 3
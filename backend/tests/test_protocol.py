@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pytest
+
+from protocol import BINARY_SUBPROTOCOL, DELTA, FULL, GameState, Update, decode_binary
+
+
+@pytest.fixture
+def keyframe():
+    values = np.arange(6 * 4, dtype=np.uint8)
+    yield Update(
+        FULL, 7, (6, 4), values, {3: 0, 5: 1, 9: 0}, names={0: "alice", 1: "bob"}
+    )
+
+
+@pytest.fixture
+def delta():
+    indices = np.array([2, 17], dtype=np.intp)
+    values = np.array([200, 4], dtype=np.uint8)
+    yield Update(
+        DELTA, 8, (6, 4), values, {2: 2, 3: None}, indices=indices, names={2: "carol"}
+    )
+
+
+def test_binary_matches_json(keyframe, delta):
+    for update in (keyframe, delta):
+        decoded = decode_binary(update.binary)
+        expected = json.loads(update.json)
+        expected["owners"] = {int(k): v for k, v in expected["owners"].items()}
+        expected["names"] = {int(k): v for k, v in expected["names"].items()}
+        if update.kind == DELTA:
+            expected["pixels"] = {int(k): v for k, v in expected["pixels"].items()}
+        assert decoded == expected
+
+
+def test_binary_keyframe_size(keyframe):
+    # Header, one byte per pixel, two names and three owned pixels
+    assert len(keyframe.binary) == 10 + 24 + (2 + 2 * 2 + 2 + 5 + 2 + 3) + (4 + 3 * 6)
+
+
+def test_names_are_sent_once(delta):
+    # Only the name first used in this delta
+    assert len(delta.binary) == 10 + (4 + 2 * 4 + 2) + (2 + 2 + 2 + 5) + (4 + 2 * 6)
+    assert decode_binary(delta.binary)["names"] == {2: "carol"}
+
+
+def test_names_with_sparse_ids():
+    values = np.zeros(6 * 4, dtype=np.uint8)
+    names = {0: "alice", 2: "carol", 40000: "zed"}
+    keyframe = Update(FULL, 1, (6, 4), values, {1: 0, 2: 2, 3: 40000}, names=names)
+    decoded = decode_binary(keyframe.binary)
+    assert decoded["names"] == names
+    assert decoded["owners"] == {1: 0, 2: 2, 3: 40000}
+
+
+def test_encoded_once(delta):
+    assert delta.encode() is delta.encode()
+    assert delta.encode(BINARY_SUBPROTOCOL) is delta.encode(BINARY_SUBPROTOCOL)
+    assert isinstance(delta.encode(), str)
+    assert isinstance(delta.encode(BINARY_SUBPROTOCOL), bytes)
+
+
+def test_game_state_follows_updates(keyframe, delta):
+    state = GameState()
+    assert state.keyframe() is None
+    state.apply(keyframe)
+    assert state.keyframe() is keyframe
+    state.apply(delta)
+    current = state.keyframe()
+    assert current.seq == 8
+    assert current.values[2] == 200 and current.values[17] == 4
+    assert current.owners == {2: 2, 5: 1, 9: 0}
+    assert current.names == {0: "alice", 1: "bob", 2: "carol"}
+    # The keyframe it was built from is left untouched
+    assert keyframe.values[2] == 2
+    assert 3 in keyframe.owners
+    assert 2 not in keyframe.names
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pygame")
+
+import snapshots
+from games.interface import InterfaceError
+from games.tetris import tetris
+from tests.test_wsserver import FakeGame
+
+
+def play(game, ticks):
+    for tick in range(ticks):
+        game.click_at(20 + tick % 20, 30, owner=f"user{tick % 3}")
+        game.update()
+
+
+def test_tetris_continues_from_snapshot(tmp_path):
+    game = tetris.Game()
+    play(game, 200)
+    captured = snapshots.capture(game, 42, game.palette_frame, game.owners_grid)
+    assert not np.shares_memory(captured.state["board"], game.board)
+    path = snapshots.write(str(tmp_path), captured)
+
+    restored = tetris.Game()
+    snapshot = snapshots.load(path)
+    assert snapshot.seq == 42
+    snapshots.restore(restored, snapshot)
+    assert restored.owner_names.names == game.owner_names.names
+    assert restored.current_piece.owner == game.current_piece.owner is not None
+    assert restored.score == game.score
+    assert restored.board.flags.writeable
+
+
+def test_restored_game_plays_the_same(tmp_path):
+    game = tetris.Game()
+    play(game, 150)
+    path = snapshots.write(str(tmp_path), snapshots.capture(game, 1, game.palette_frame, game.owners_grid))
+    restored = tetris.Game()
+    snapshots.restore(restored, snapshots.load(path))
+    assert (restored.palette_frame == game.palette_frame).all()
+    play(game, 100)
+    play(restored, 100)
+    assert (restored.palette_frame == game.palette_frame).all()
+    assert (restored.owners_grid == game.owners_grid).all()
+
+
+def test_games_without_state_are_not_snapshotted():
+    game = FakeGame()
+    assert snapshots.capture(game, 1, game.palette_frame, game.owners_grid) is None
+    snapshot = snapshots.Snapshot(1, np.zeros((4, 8), np.uint8), np.zeros((4, 8), np.uint16), [], {})
+    with pytest.raises(InterfaceError):
+        snapshots.restore(game, snapshot)
+    with pytest.raises(ValueError):
+        snapshots.restore(game, snapshot._replace(frame=np.zeros((2, 2), np.uint8)))
+
+
+def test_snapshotter_keeps_the_last_ones(tmp_path):
+    game = tetris.Game()
+    snapshotter = snapshots.Snapshotter(str(tmp_path), interval=0, keep=2)
+    for seq in range(4):
+        snapshotter.update(game, seq, game.palette_frame, game.owners_grid)
+        snapshotter.close()
+    paths = snapshots.saved(str(tmp_path))
+    assert len(paths) == 2
+    assert snapshots.load(paths[-1]).seq == 3
@@ -0,0 +1,15 @@
+import pytest
+
+pytest.importorskip("pygame")
+
+from benchmarks.soak import play
+
+
+def test_seeded_games_are_reproducible():
+    first = play("tetris", 3, max_ticks=200, clicks_per_tick=2, users=3, framerate=30)
+    second = play("tetris", 3, max_ticks=200, clicks_per_tick=2, users=3, framerate=30)
+    assert first["ticks"] == second["ticks"] == 200
+    assert not first["finished"]
+    assert (first["frame"] == second["frame"]).all()
+    assert first["frame"].shape == (64, 64)
+    assert first["updates"] == second["updates"] > 0
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+tetris = pytest.importorskip("games.tetris.tetris")
+
+from games.interface import NO_OWNER
+
+
+@pytest.fixture
+def game():
+    return tetris.Game(width=64, height=64)
+
+
+def test_unowned_piece(game):
+    assert (game.owners_grid == NO_OWNER).all()
+    assert game.owners_map == {}
+
+
+def test_owned_piece_cells(game):
+    game.current_piece.owner = "alice"
+    grid = game.owners_grid
+    cells = [cell for cell in game.current_piece.get_pixels() if cell[1] >= 0]
+    assert (grid != NO_OWNER).sum() == len(cells) * game.cell_size**2
+    px, py = cells[0]
+    y = game.game_offset_y + py * game.cell_size
+    x = game.game_offset_x + px * game.cell_size
+    assert game.owner_names[grid[y, x]] == "alice"
+    assert game.owners_map[(y, x)] == "alice"
+    assert len(game.owners_map) == (grid != NO_OWNER).sum()
+
+
+def test_palette_frame_matches_pil(game):
+    game.current_piece.owner = "alice"
+    for _ in range(40):
+        game.update()
+    frame = game.palette_frame
+    assert frame.shape == (64, 64) and frame.dtype == np.uint8
+    # Same indices as quantizing the RGB frame with PIL's web palette
+    assert (np.asarray(game.frame.convert("RGB").convert("P")) == frame).all()
+    # Piece cells are outlined with grid lines, the border is white
+    colors = set(np.unique(frame).tolist())
+    assert {tetris.PALETTE_INDEX[tetris.Colors.GRID.value], tetris.PALETTE_INDEX[tetris.Colors.WHITE.value]} <= colors
+
+
+def test_no_display_needed(game):
+    assert game.screen is None
+
+
+def test_changed_pixels(game):
+    game.update()
+    assert len(game.get_changed_pixels()) == 64 * 64
+    before = game.pixels
+    game.current_piece.owner = "alice"
+    game._move_piece(1, 0)
+    game.update()
+    changed = game.get_changed_pixels()
+    assert (changed == np.flatnonzero(game.pixels != before)).all()
+    assert len(changed)
+    game.update()
+    assert not len(game.get_changed_pixels())
+
+
+def test_rotations_are_precomputed():
+    rotations = tetris.Game.Tetromino.ROTATIONS[tetris.TetrominoType.T]
+    assert [rotation.shape for rotation in rotations[:2]] == [
+        [[0, 1, 0], [1, 1, 1]],
+        [[1, 0], [1, 1], [1, 0]],
+    ]
+    assert rotations[1].masks == (0b01, 0b11, 0b01)
+
+
+def test_collisions(game):
+    piece = tetris.Game.Tetromino(tetris.TetrominoType.I, 0, game.game_height - 1)
+    assert game._is_valid_position(piece)
+    assert not game._is_valid_position(piece, dx=-1)
+    assert not game._is_valid_position(piece, dx=game.game_width - 3)
+    assert not game._is_valid_position(piece, dy=1)
+    game.rows[-1] = 1 << 3
+    assert not game._is_valid_position(piece)
+    assert game._is_valid_position(piece, dx=4)
+
+
+def test_lock_and_clear_lines(game):
+    game.rows[-1] = game.full_row & ~0b1111
+    game.rows[-2] = 1
+    game.board[-2, 0] = tetris.Colors.RED.value
+    game.current_piece = tetris.Game.Tetromino(tetris.TetrominoType.I, 0, game.game_height - 1)
+    game._lock_piece()
+    assert game.rows[-1] == game.full_row
+    game._clear_lines()
+    assert game.lines_cleared == 1 and game.score == 100
+    assert game.rows[-1] == 1 and game.board[-1, 0] == tetris.Colors.RED.value
+    assert game.rows[0] == 0 and not game.board[0].any()
+
+
+def test_click_batch(game):
+    piece = game.current_piece
+    left = game.game_offset_x + piece.x * game.cell_size
+    top = game.game_offset_y + piece.y * game.cell_size
+    # Two clicks on the piece, one far left
+    game.click_batch(
+        np.array([left, left + 1, 0]), np.array([top, top, top]), np.array([0, 1, 0]), ["alice", "bob"]
+    )
+    x, rotation = piece.x, piece.rotation
+    game.update()
+    assert piece.rotation == (rotation + 2) % len(piece.rotations) or piece.type == tetris.TetrominoType.O
+    assert piece.x == x - 1
+    assert piece.owner == "alice"
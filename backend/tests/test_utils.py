@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from utils import PubSub, SlowConsumer, TickScheduler
+
+
+def test_subscriber_gets_values_published_after_subscribing():
+    async def main():
+        pubsub = PubSub()
+        pubsub.publish("before")
+        subscription = pubsub.subscribe()
+        pubsub.publish(1)
+        pubsub.publish(2)
+        return [await anext(subscription), await anext(subscription)]
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_subscriber_waits_for_publish():
+    async def main():
+        pubsub = PubSub()
+        subscription = pubsub.subscribe()
+        received = asyncio.ensure_future(anext(subscription))
+        await asyncio.sleep(0)
+        assert not received.done()
+        pubsub.publish("value")
+        return await received
+
+    assert asyncio.run(main()) == "value"
+
+
+def test_history_is_bounded():
+    pubsub = PubSub(history=4)
+    for value in range(100):
+        pubsub.publish(value)
+    assert len(pubsub.history) == 4
+
+
+def test_slow_subscriber_is_dropped():
+    async def main():
+        pubsub = PubSub(history=4)
+        subscription = pubsub.subscribe()
+        for value in range(5):
+            pubsub.publish(value)
+        await anext(subscription)
+
+    with pytest.raises(SlowConsumer):
+        asyncio.run(main())
+
+
+def test_max_lag():
+    async def main():
+        pubsub = PubSub()
+        subscription = pubsub.subscribe(max_lag=2)
+        pubsub.publish(1)
+        pubsub.publish(2)
+        assert await anext(subscription) == 1
+        pubsub.publish(3)
+        pubsub.publish(4)
+        await anext(subscription)
+
+    with pytest.raises(SlowConsumer):
+        asyncio.run(main())
+
+
+def test_conflating_subscriber_skips_to_newest_keyframe():
+    async def main():
+        pubsub = PubSub(history=4)
+        subscription = pubsub.subscribe(conflate=True, max_lag=3)
+        for value in range(10):
+            pubsub.publish(value, keyframe=value == 7)
+        received = [await anext(subscription) for _ in range(3)]
+        return received, subscription.dropped
+
+    received, dropped = asyncio.run(main())
+    assert received == [7, 8, 9]
+    assert dropped == 7
+
+
+def test_conflating_subscriber_without_keyframe_is_dropped():
+    async def main():
+        pubsub = PubSub(history=4)
+        subscription = pubsub.subscribe(conflate=True)
+        for value in range(10):
+            pubsub.publish(value, keyframe=False)
+        await anext(subscription)
+
+    with pytest.raises(SlowConsumer):
+        asyncio.run(main())
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ticks_follow_absolute_deadlines():
+    clock = FakeClock()
+    scheduler = TickScheduler(10, clock=clock)
+    assert scheduler.next_delay() == 0
+    scheduler.start_tick()
+    clock.now = 0.03  # Work done in the tick doesn't shift the schedule
+    assert scheduler.next_delay() == pytest.approx(0.07)
+    clock.now = 0.101
+    scheduler.start_tick()
+    assert scheduler.next_delay() == pytest.approx(0.099)
+    assert scheduler.stats()["jitter_max_ms"] == pytest.approx(1)
+    assert scheduler.overruns == 0
+
+
+def test_late_ticks_are_skipped():
+    clock = FakeClock()
+    scheduler = TickScheduler(10, clock=clock)
+    scheduler.next_delay()
+    scheduler.start_tick()
+    clock.now = 0.35
+    scheduler.start_tick()
+    assert scheduler.overruns == 1
+    assert scheduler.skipped == 2
+    assert scheduler.next_delay() == pytest.approx(0.05)
+
+
+def test_late_ticks_catch_up():
+    clock = FakeClock()
+    scheduler = TickScheduler(10, policy=TickScheduler.CATCH_UP, max_catch_up=1, clock=clock)
+    scheduler.next_delay()
+    scheduler.start_tick()
+    clock.now = 0.35
+    scheduler.start_tick()
+    assert scheduler.skipped == 1
+    # One missed tick is due right away, then the schedule is back on track
+    assert scheduler.next_delay() < 0
+    scheduler.start_tick()
+    assert scheduler.next_delay() == pytest.approx(0.05)
@@ -0,0 +1,376 @@
+import asyncio
+import functools
+import json
+from collections import deque
+
+import numpy as np
+import pytest
+import websockets
+from PIL import Image
+
+import metrics
+import wsserver
+from commands import Command
+from executors import RelayExecutor
+from protocol import DELTA, FULL, Update
+from framering import FrameRing
+from games.interface import NO_OWNER, CanvasApp, OwnerNames
+
+
+class FakeGame(CanvasApp):
+    """Minimal game with a directly editable palette frame."""
+
+    def __init__(self, width=8, height=4) -> None:
+        self.pixels = np.zeros((height, width), dtype=np.uint8)
+        self.owners = {}
+        self.clicks = []
+
+    def update(self) -> None:
+        pass
+
+    def click_at(self, x: int, y: int, owner=None) -> None:
+        self.clicks.append((x, y, owner))
+
+    @property
+    def owners_map(self):
+        return dict(self.owners)
+
+    @property
+    def frame(self):
+        return Image.fromarray(self.pixels, mode="P")
+
+    @property
+    def palette_frame(self):
+        return self.pixels.copy()
+
+    @property
+    def resolution(self):
+        return self.pixels.shape[1], self.pixels.shape[0]
+
+    @property
+    def finished(self) -> bool:
+        return False
+
+
+@pytest.fixture
+def manager():
+    published = []
+    manager = wsserver.GameManager(
+        FakeGame(),
+        deque(),
+        lambda update, keyframe: published.append(update),
+        full_state_interval=3,
+    )
+    yield manager, published
+
+
+def test_first_broadcast_is_keyframe(manager):
+    game_manager, published = manager
+    game_manager.game.pixels[1, 2] = 7
+    game_manager.broadcast_game_state()
+    message = json.loads(published[-1].json)
+    assert message["type"] == "full"
+    assert message["seq"] == 1
+    assert message["pixels"][1 * 8 + 2] == 7
+    assert message["meta"] == {"width": 8, "height": 4}
+
+
+def test_delta_only_carries_changes(manager):
+    game_manager, published = manager
+    game = game_manager.game
+    game.owners[(0, 1)] = "alice"
+    game_manager.broadcast_game_state()
+    game.pixels[2, 3] = 5
+    del game.owners[(0, 1)]
+    game.owners[(3, 3)] = "bob"
+    game_manager.broadcast_game_state()
+    message = json.loads(published[-1].json)
+    assert message == {
+        "type": "delta",
+        "seq": 2,
+        "pixels": {"19": 5},
+        "names": {"1": "bob"},
+        "owners": {"27": 1, "1": None},
+    }
+
+
+def test_keyframe_carries_owner_names(manager):
+    game_manager, published = manager
+    game = game_manager.game
+    game.owners[(0, 1)] = "alice"
+    game_manager.broadcast_game_state()
+    game.owners[(0, 2)] = "bob"
+    game_manager.broadcast_game_state()
+    game.owners[(0, 3)] = "bob"
+    game_manager.broadcast_game_state()
+    assert [update.names for update in published] == [{0: "alice"}, {1: "bob"}, {}]
+    keyframe = game_manager.keyframe()
+    assert keyframe.names == {0: "alice", 1: "bob"}
+    assert keyframe.owners == {1: 0, 2: 1, 3: 1}
+
+
+def test_names_of_current_owners_only(manager):
+    game_manager, published = manager
+    game = game_manager.game
+    game.owners[(0, 1)] = "alice"
+    game.owners[(0, 2)] = "bob"
+    game_manager.broadcast_game_state()
+    del game.owners[(0, 1)]
+    game_manager.broadcast_game_state()
+    assert game_manager.keyframe().names == {1: "bob"}
+    # Whoever started from that keyframe learns alice's name when she's back
+    game.owners[(1, 1)] = "alice"
+    game_manager.broadcast_game_state()
+    assert published[-1].names == {0: "alice"}
+    game.owners[(1, 2)] = "bob"
+    game_manager.broadcast_game_state()  # The periodic keyframe
+    assert published[-1].keyframe and published[-1].names == {0: "alice", 1: "bob"}
+
+
+def test_unchanged_frame_is_not_broadcast(manager):
+    game_manager, published = manager
+    game_manager.broadcast_game_state()
+    game_manager.broadcast_game_state()
+    assert len(published) == 1
+
+
+def test_keyframe_interval(manager):
+    game_manager, published = manager
+    for value in range(1, 6):
+        game_manager.game.pixels[0, 0] = value
+        game_manager.broadcast_game_state()
+    types = [message.kind for message in published]
+    assert types == ["full", "delta", "delta", "full", "delta"]
+
+
+def test_keyframe_on_demand(manager):
+    game_manager, published = manager
+    game_manager.broadcast_game_state()
+    game_manager.game.pixels[0, 0] = 1
+    game_manager.broadcast_game_state()
+    keyframe = json.loads(game_manager.keyframe().json)
+    assert keyframe["type"] == "full"
+    assert keyframe["seq"] == 2
+    assert keyframe["pixels"][0] == 1
+    assert game_manager.keyframe() is game_manager.keyframe()
+    game_manager.request_keyframe()
+    game_manager.broadcast_game_state()
+    assert json.loads(published[-1].json)["type"] == "full"
+
+
+def test_commands_drained_in_bulk(manager):
+    game_manager, _published = manager
+    game_manager.commands.extend([Command(1, 2, "alice"), Command(3, 0, "bob")])
+    game_manager.tick()
+    assert game_manager.game.clicks == [(1, 2, "alice"), (3, 0, "bob")]
+    assert not game_manager.commands
+
+
+def test_commands_per_tick_are_capped(manager):
+    game_manager, _published = manager
+    game_manager.commands.extend(Command(x, 0, "alice") for x in range(5))
+    assert [c.x for c in game_manager.read_user_commands(3)] == [0, 1, 2]
+    assert [c.x for c in game_manager.read_user_commands(3)] == [3, 4]
+
+
+def test_pygame_display_games_get_a_process_each():
+    assert wsserver.choose_executor(["invaders", "place"], "inline") == "process"
+    assert wsserver.choose_executor(["invaders", "place"], "thread") == "process"
+    assert wsserver.choose_executor(["invaders", "tetris"], "inline") == "inline"
+    assert wsserver.choose_executor(["place"], "thread") == "thread"
+
+
+def test_route(monkeypatch):
+    place, tetris = object(), object()
+    monkeypatch.setattr(wsserver, "ROOMS", {"place": place, "tetris": tetris})
+    assert wsserver.route("/") is place
+    assert wsserver.route("/tetris") is tetris
+    assert wsserver.route("/tetris/?user=1") is tetris
+    assert wsserver.route("/invaders") is None
+
+
+def test_broadcast_frames_are_recorded(manager):
+    game_manager, published = manager
+    game_manager.ring = FrameRing.create(8, 4, capacity=4)
+    try:
+        game_manager.game.owners[(0, 1)] = "alice"
+        game_manager.broadcast_game_state()
+        game_manager.game.pixels[0, 0] = 9
+        game_manager.broadcast_game_state()
+        frame, owners = game_manager.ring.read(published[-1].seq)
+        assert frame[0] == 9
+        assert owners[1] == 0
+        assert game_manager.ring.names() == ["alice"]
+    finally:
+        game_manager.ring.close()
+
+
+def test_ring_seqs_carry_on_across_games():
+    ring = FrameRing.create(8, 4, capacity=4)
+    try:
+        first = wsserver.GameManager(FakeGame(), deque(), lambda update, keyframe: None, ring=ring)
+        for color in (1, 2):
+            first.game.pixels[0, 0] = color
+            first.broadcast_game_state()
+        latest = ring.latest
+        # The next game starts its sequence over
+        second = wsserver.GameManager(FakeGame(), deque(), lambda update, keyframe: None, ring=ring)
+        second.game.pixels[0, 0] = 7
+        second.broadcast_game_state()
+        assert second.sequence <= latest
+        assert ring.latest == latest + 1
+        assert ring.read(latest + 1)[0][0] == 7
+        assert ring.read(latest)[0][0] == 2
+    finally:
+        ring.close()
+
+
+def test_changes_tracked_by_game(manager):
+    game_manager, published = manager
+    game = game_manager.game
+    reported = []
+    game.get_changed_pixels = lambda: reported.pop() if reported else np.array([], dtype=np.intp)
+    game_manager.broadcast_game_state()
+    game.pixels[0, 5] = 3
+    reported.append(np.array([5]))
+    game_manager.broadcast_game_state()
+    assert published[-1].indices.tolist() == [5]
+    assert published[-1].values.tolist() == [3]
+
+
+def test_commands_applied_as_a_batch(manager):
+    game_manager, _published = manager
+    game_manager.commands.extend([Command(1, 2, "alice"), Command(3, 0, "bob"), Command(0, 0, "alice")])
+    game_manager.tick()
+    # Through the default adapter, one click_at per command
+    assert game_manager.game.clicks == [(1, 2, "alice"), (3, 0, "bob"), (0, 0, "alice")]
+    # Clicking doesn't make an owner
+    assert not game_manager.game.owner_names
+
+
+def test_clicks_from_countless_users():
+    pytest.importorskip("pygame")
+    from games.tetris import tetris  # pylint:disable=import-outside-toplevel
+
+    game_manager = wsserver.GameManager(tetris.Game(), deque(), lambda update, keyframe: None)
+    for tick in range(100):
+        game_manager.commands.extend(Command(tick % 64, 40, f"user{tick}-{click}") for click in range(1000))
+        game_manager.tick()
+    # Only the owners of the piece were interned
+    assert len(game_manager.game.owner_names) <= 100
+
+
+def test_owner_ids_run_out():
+    names = OwnerNames()
+    for owner_id in range(NO_OWNER):
+        names.intern(owner_id)
+    assert names.intern("one too many") == NO_OWNER
+    assert names.intern(0) == 0
+
+
+def test_commands_coalesced_per_tick(manager):
+    game_manager, _published = manager
+    game_manager.clicks_per_user = 1
+    game_manager.commands.extend([Command(1, 2, "alice"), Command(3, 0, "alice"), Command(1, 2, "bob")])
+    game_manager.tick(10)
+    assert game_manager.game.clicks == [(1, 2, "alice")]
+    assert not game_manager.commands
+    assert game_manager.dropped_commands == 2
+
+
+def test_coalesced_commands_past_the_limit_stay_queued(manager):
+    game_manager, _published = manager
+    game_manager.clicks_per_user = 2
+    game_manager.commands.extend(
+        [Command(0, 0, "alice"), Command(1, 0, "alice"), Command(2, 0, "bob"), Command(3, 0, "bob")]
+    )
+    game_manager.tick(3)
+    assert game_manager.game.clicks == [(0, 0, "alice"), (2, 0, "bob"), (1, 0, "alice")]
+    assert list(game_manager.commands) == [Command(3, 0, "bob")]
+    game_manager.commands.append(Command(4, 0, "carol"))
+    game_manager.tick(3)
+    assert game_manager.game.clicks[3:] == [(3, 0, "bob"), (4, 0, "carol")]
+    assert game_manager.dropped_commands == 0
+
+
+def test_updates_carry_simulation_metrics():
+    pytest.importorskip("pygame")
+    commands, published = deque([Command(1, 1, "alice"), Command(2, 1, "bob")]), []
+
+    def publish(update, keyframe):
+        if isinstance(update, Update):
+            published.append(update)
+
+    ticks = wsserver.simulation(commands, publish, "tetris", framerate=1000)
+    next(ticks)
+    while len(published) < 2:
+        next(ticks)
+    ticks.close()
+    first, last = published[0].metrics, published[-1].metrics
+    # Snapshots as of the end of the previous tick
+    assert first.tick_seconds.count == 0 and first.queued == 2
+    assert last.tick_seconds.count >= 1
+    assert last.applied == 2 and last.queued == 0
+
+
+def test_simulation_metrics_published_without_updates(monkeypatch):
+    pytest.importorskip("pygame")
+    monkeypatch.setattr(metrics, "PUBLISH_INTERVAL", 0)
+    published = []
+    ticks = wsserver.simulation(deque(), lambda update, keyframe: published.append(update), "tetris", framerate=1000)
+    for _ in range(10):
+        next(ticks)
+    ticks.close()
+    alone = [update for update in published if isinstance(update, metrics.SimulationMetrics)]
+    # One per tick, even those without a frame to publish
+    assert [snapshot.tick_seconds.count for snapshot in alone] == list(range(1, 10))
+
+    room = wsserver.GameRoom("fake", functools.partial(RelayExecutor, "fake", None))
+    room.publish(alone[-1], False)
+    assert room.simulation_metrics is alone[-1]
+    assert room.pubsub.sequence == 0
+
+
+def test_dropped_connections_are_removed_quietly():
+    class DroppedConnection:
+        subprotocol = None
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            raise websockets.ConnectionClosedError(None, None)
+
+    room = wsserver.GameRoom("fake", functools.partial(RelayExecutor, "fake", None))
+    asyncio.run(room.handler(DroppedConnection()))
+    assert len(room.broadcaster) == 0
+
+
+def test_broadcast_loop_survives_falling_behind():
+    async def main():
+        room = wsserver.GameRoom("fake", functools.partial(RelayExecutor, "fake", None), keyframe_interval=10)
+        task = asyncio.create_task(room.broadcast_loop())
+
+        def update(kind, seq):
+            indices = np.array([seq % 4]) if kind == DELTA else None
+            values = np.full(1 if kind == DELTA else 4, seq, np.uint8)
+            room.publish(Update(kind, seq, (4, 1), values, {}, indices=indices), kind == FULL)
+
+        update(FULL, 1)
+        await asyncio.sleep(0)
+        # More deltas than the history holds, without a keyframe
+        for seq in range(2, 102):
+            update(DELTA, seq)
+        await asyncio.sleep(0)
+        update(DELTA, 102)  # Can't be applied, some are missing
+        update(FULL, 103)
+        update(DELTA, 104)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert not task.done()
+        task.cancel()
+        return room.state
+
+    state = asyncio.run(main())
+    assert state.seq == 104
+    assert state.frame.tolist() == [104, 103, 103, 103]
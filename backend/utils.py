@@ -1,4 +1,5 @@
 import time
+from collections import deque
 from typing import Callable
 import asyncio
 import logging
@@ -20,21 +21,166 @@ class TimedCall:
         return False
 
 
+class TickScheduler:
+    """Fixed timestep scheduler. Ticks are due at absolute deadlines, one
+    `1 / framerate` after the other, so the frame rate doesn't drift with the
+    time spent in each tick.
+
+    When ticks run late (overruns) the missed ones are either skipped, to
+    realign with the schedule, or run back to back to catch up, at most
+    `max_catch_up` of them.
+    """
+
+    SKIP = "skip"
+    CATCH_UP = "catch-up"
+    POLICIES = (SKIP, CATCH_UP)
+
+    def __init__(
+        self,
+        framerate: float,
+        policy: str = SKIP,
+        max_catch_up: int = 5,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown policy: {policy}")
+        self.interval = 1 / framerate
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self._clock = clock
+        self._deadline = None
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter = deque(maxlen=1000)  # Tick start - deadline, in seconds
+
+    def next_delay(self) -> float:
+        """Seconds until the next tick is due, negative if it's late."""
+        if self._deadline is None:
+            self._deadline = self._clock()
+        return self._deadline - self._clock()
+
+    def start_tick(self):
+        """Account for the tick starting now and schedule the next one."""
+        lateness = self._clock() - self._deadline
+        self.jitter.append(lateness)
+        self.ticks += 1
+        missed = int(lateness / self.interval)
+        if missed > 0:
+            self.overruns += 1
+            if self.policy == self.SKIP:
+                skip = missed
+            else:
+                skip = max(0, missed - self.max_catch_up)
+            self.skipped += skip
+            self._deadline += skip * self.interval
+        self._deadline += self.interval
+
+    def stats(self) -> dict:
+        """Tick counters and jitter percentiles, in milliseconds."""
+        jitter = sorted(self.jitter) or [0.0]
+
+        def percentile(p):
+            return round(1000 * jitter[min(len(jitter) - 1, int(p * len(jitter)))], 3)
+
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "jitter_p50_ms": percentile(0.5),
+            "jitter_p99_ms": percentile(0.99),
+            "jitter_max_ms": round(1000 * jitter[-1], 3),
+        }
+
+
+class SlowConsumer(Exception):
+    """A subscriber fell further behind the publisher than allowed."""
+
+
 class PubSub:
-    def __init__(self):
-        self.waiter = asyncio.Future()
-
-    def publish(self, value):
-        waiter, self.waiter = self.waiter, asyncio.Future()
-        try:
-            waiter.set_result((value, self.waiter))
-        except asyncio.exceptions.InvalidStateError as exc:
-            pass  # Ignore. Most likely due to client disconnection
-
-    async def subscribe(self):
-        waiter = self.waiter
-        while True:
-            value, waiter = await waiter
-            yield value
+    """Publishes values to any number of async subscribers.
+
+    Only the last `history` values are kept, so a subscriber that can't keep
+    up doesn't make memory grow: it either skips ahead (conflating
+    subscribers) or gets a SlowConsumer error once it lags too far behind.
+    Values are keyframes unless published with `keyframe=False`, in which
+    case they only make sense on top of the values published before them.
+    """
+
+    def __init__(self, history: int = 64):
+        self.history = deque(maxlen=history)  # (sequence, value, keyframe)
+        self.sequence = 0  # Sequence number of the next published value
+        # Created on first use, so it belongs to the loop that runs the server
+        # rather than to whatever loop is current at import time
+        self._waiter = None
+
+    def publish(self, value, keyframe: bool = True):
+        self.history.append((self.sequence, value, keyframe))
+        self.sequence += 1
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            waiter.set_result(None)
+
+    async def wait(self):
+        """Wait for the next published value."""
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        # Shielded, cancelling one subscriber must not cancel the others
+        await asyncio.shield(self._waiter)
+
+    def subscribe(self, conflate: bool = False, max_lag: int | None = None):
+        """Subscribe to values published from now on.
+
+        A conflating subscriber that falls behind skips straight to the
+        newest keyframe (and the values following it). Subscribers lagging
+        more than `max_lag` values behind, after conflation, are dropped with
+        SlowConsumer. Without `max_lag` the limit is the history length.
+        """
+        return Subscription(self, conflate, max_lag)
 
     __aiter__ = subscribe
+
+
+class Subscription:
+    """Async iterator over the values of a PubSub, see PubSub.subscribe."""
+
+    def __init__(self, pubsub: PubSub, conflate: bool, max_lag: int | None):
+        self.pubsub = pubsub
+        self.conflate = conflate
+        self.max_lag = max_lag
+        self.cursor = pubsub.sequence  # Sequence number of the next value
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def lag(self) -> int:
+        """Values published but not consumed yet."""
+        return self.pubsub.sequence - self.cursor
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self.cursor == self.pubsub.sequence:
+            await self.pubsub.wait()
+        return self._next()
+
+    def _next(self):
+        history = self.pubsub.history
+        oldest = history[0][0]
+        if self.conflate and self.lag > 1:
+            for sequence, _value, keyframe in reversed(history):
+                if sequence <= self.cursor:
+                    break
+                if keyframe:
+                    self.dropped += sequence - self.cursor
+                    self.cursor = sequence
+                    break
+        if self.cursor < oldest or (
+            self.max_lag is not None and self.lag > self.max_lag
+        ):
+            raise SlowConsumer(f"Subscriber is {self.lag} values behind")
+        _sequence, value, _keyframe = history[self.cursor - oldest]
+        self.cursor += 1
+        self.delivered += 1
+        return value
@@ -1,24 +1,39 @@
 #!/usr/bin/env python
 import argparse
 import asyncio
-import json
+import contextlib
 import logging
+import functools
+import itertools
+import multiprocessing
+import os
+import pickle
+import random
 import ssl
+import threading
+import time
+from collections import deque
+from http import HTTPStatus
+from typing import Callable
 
 import numpy as np
 import websockets
 import importlib
-from games.interface import CanvasApp
-from utils import PubSub
+import commandlog
+from commands import Command, CommandError, coalesce, parse_message
+from executors import EXECUTORS, InlineExecutor, ProcessExecutor, RelayExecutor
+from games.interface import NO_OWNER, CanvasApp, InterfaceError
+from protocol import DELTA, FULL, SUBPROTOCOLS, GameState, Update
+from fanout import Broadcaster
+from framering import FrameRing
+import metrics
+import profiler
+import snapshots
+from utils import PubSub, SlowConsumer, TickScheduler, TimedCall
 
 from games.game_config import GAMES as GAME_CONFIG
 
 
-class InternalError(Exception):
-    pass
-
-
-
 def get_game_class(game_name):
     if game_name not in GAME_CONFIG:
         raise ValueError(f"Unknown game: {game_name}")
@@ -43,167 +58,682 @@ def get_game_config(game_name):
 logger = logging.getLogger("WS Server")
 ch = logging.StreamHandler()
 ch.setLevel(logging.DEBUG)
-formatter = logging.Formatter("%asctime)s | %(name)s | [%(levelname)s]: %(message)s")
+formatter = logging.Formatter("%(asctime)s | %(name)s | [%(levelname)s]: %(message)s")
 ch.setFormatter(formatter)
 logger.addHandler(ch)
-
-# Commands (clicks) received
-COMMANDS = asyncio.Queue()
-# Game state updates
-PUBSUB = PubSub()
-# Current game state for new clients
-CURRENT_GAME_STATE = None
-# Last full state for new client connections
-LAST_FULL_STATE = None
+# Set by --log-level, processes spawned for games and workers inherit it
+logger.setLevel(os.environ.get("CANVAS_LOG_LEVEL", "INFO"))
+
+class GameRoom:
+    """One game and everything needed to broadcast it: its simulation, the
+    pubsub of its updates, its state as broadcast so far (used to serve
+    keyframes to new clients) and its connections. Several rooms can share
+    one server, each reached through its own path.
+
+    `executor` builds the executor of the simulation given the function its
+    updates are published with, see `local_executor`. Updates are kept for
+    `keyframe_interval`, so the broadcast loop always finds a keyframe to
+    skip to when it falls behind."""
+
+    def __init__(self, game_name: str, executor: Callable, max_lag: int = 100, keyframe_interval: int = 60):
+        self.name = game_name
+        # Game state updates
+        self.pubsub = PubSub(history=max(64, keyframe_interval + 1))
+        self.state = GameState()
+        # Open connections, all fed by one broadcast loop
+        self.broadcaster = Broadcaster(self.state.keyframe, max_lag=max_lag)
+        # Telemetry, see metrics
+        self.simulation_metrics = None
+        self.encode_seconds = metrics.Histogram(metrics.ENCODE_BUCKETS)
+        self.executor = executor(self.publish)
+
+    def publish(self, update: Update | metrics.SimulationMetrics, keyframe: bool) -> None:
+        if isinstance(update, metrics.SimulationMetrics):
+            self.simulation_metrics = update  # Published alone, see simulation
+            return
+        if update.metrics is not None:
+            self.simulation_metrics = update.metrics
+        self.pubsub.publish(update, keyframe)
+
+    async def handler(self, websocket):
+        """Handle connections. Outgoing game state is pushed by
+        `broadcast_loop`, here we only register the connection and consume
+        incoming messages."""
+        self.broadcaster.add(websocket)
+        try:
+            await self.consumer_handler(websocket)
+        except websockets.ConnectionClosed as exc:
+            # Clients leave without a proper close all the time
+            logger.debug("Connection closed: %s", exc)
+        finally:
+            self.broadcaster.remove(websocket)
+
+    async def consumer_handler(self, websocket):
+        """Handle incoming messages from the client. Users commands are parsed
+        and validated here and queued for the game tick, keyframe requests are
+        answered directly."""
+        async for message in websocket:
+            logger.debug("Received: %s", message)
+            try:
+                command = parse_message(message, self.state.resolution)
+            except CommandError as exc:
+                logger.debug("Received wrong message: %s", exc)
+                continue
+            if command is None:
+                self.broadcaster.resync(websocket)
+            else:
+                self.executor.submit(command)
+
+    async def broadcast_loop(self):
+        """Send every published game state update to all connections. Updates
+        are encoded once per wire format and written to every connection from
+        this single task. If this loop ever falls behind it skips to the
+        newest keyframe, rather than replaying stale updates. Should there be
+        none to skip to, it waits for the next one."""
+        resyncing = False
+        while True:
+            try:
+                async for update in self.pubsub.subscribe(conflate=True):
+                    if resyncing and not update.keyframe:
+                        continue
+                    resyncing = False
+                    self.state.apply(update)
+                    self.broadcaster.broadcast(update)
+                    self.encode_seconds.observe(update.encode_seconds)
+            except SlowConsumer as exc:
+                logger.warning("Broadcast of %s fell behind, waiting for a keyframe: %s", self.name, exc)
+                resyncing = True
+
+    def samples(self):
+        """Metrics of the room, see metrics.render."""
+        labels = {"game": self.name}
+        if self.simulation_metrics is not None:
+            yield from self.simulation_metrics.samples(labels)
+        broadcaster = self.broadcaster
+        yield "canvas_encode_seconds", labels, self.encode_seconds
+        yield "canvas_subscribers", labels, len(broadcaster)
+        yield "canvas_messages_sent_total", labels, broadcaster.messages_sent
+        yield "canvas_bytes_sent_total", labels, broadcaster.bytes_sent
+        yield "canvas_updates_dropped_total", labels, broadcaster.dropped_updates
+        yield "canvas_connections_dropped_total", labels, broadcaster.dropped_connections
+
+    async def run(self):
+        await asyncio.gather(self.broadcast_loop(), self.executor.run())
+
+
+# Rooms by path, the first game is also served at "/"
+ROOMS = {}
+
+
+def route(path: str) -> GameRoom | None:
+    """Room serving a websocket path like "/place", None if there's none."""
+    name = path.split("?")[0].strip("/")
+    if not name:
+        return next(iter(ROOMS.values()), None)
+    return ROOMS.get(name)
+
+
+async def process_request(path, _request_headers):
+    """Reject connections to unknown games before the websocket handshake."""
+    if route(path) is None:
+        return HTTPStatus.NOT_FOUND, [], b"Unknown game\n"
+    return None
 
 
 async def handler(websocket):
-    """Handle connections in a producer/consumer fashion."""
-    consumer_task = asyncio.create_task(consumer_handler(websocket))
-    producer_task = asyncio.create_task(producer_handler(websocket))
-    _done, pending = await asyncio.wait(
-        [consumer_task, producer_task],
-        return_when=asyncio.FIRST_COMPLETED,
-    )
-    for task in pending:
-        task.cancel()
-
-
-async def consumer_handler(websocket):
-    """Handle incoming messages from the client. It queues users commands"""
-    async for message in websocket:
-        logger.debug("Received: %s", message)
-        await COMMANDS.put(message)
-
-
-async def producer_handler(websocket):
-    """Handle outgoing messages to the client. It sends the game state"""
-    global CURRENT_GAME_STATE, LAST_FULL_STATE
-    # Send last full state immediately to new clients, fallback to current state
-    if LAST_FULL_STATE:
-        await websocket.send(LAST_FULL_STATE)
-    elif CURRENT_GAME_STATE:
-        await websocket.send(CURRENT_GAME_STATE)
-    # Then subscribe to future updates
-    async for value in PUBSUB.subscribe():
-        await websocket.send(value)
+    """Hand the connection to the room of the requested game."""
+    await route(websocket.path).handler(websocket)
 
 
 class GameManager:
-    def __init__(self, game: CanvasApp) -> None:
+    def __init__(
+        self,
+        game: CanvasApp,
+        commands: deque,
+        publish: Callable,
+        full_state_interval: int = 60,
+        ring: FrameRing | None = None,
+        clicks_per_user: int | None = None,
+        log: commandlog.CommandLog | None = None,
+    ) -> None:
         self.game = game
-        self.last_broadcast_state = None
-        self.first_broadcast = True
-        self.frame_count = 0
-        self.full_state_interval = 60  # Send full state every 60 frames
-
-    def read_user_commands(self) -> dict | None:
-        try:
-            command = COMMANDS.get_nowait()
-        except asyncio.QueueEmpty:
-            return None
-
-        try:
-            command = json.loads(command)
-            if isinstance(command, dict) and command.keys() >= {
-                "x",
-                "y",
-                "user",
-            }:
-                return command
-            logger.debug("Received wrong message %s", command)
-        except json.decoder.JSONDecodeError as exc:
-            raise InternalError(f"Received wrong message {command}") from exc
-        return None
-
-    def execute_user_command(self, command: dict):
-        self.game.click_at(
-            x=command["x"], y=command["y"], owner=command["user"]
+        self.commands = commands
+        self.clicks_per_user = clicks_per_user  # Coalesce clicks, see read_user_commands
+        self.applied_commands = 0
+        self.dropped_commands = 0
+        self.publish = publish
+        self.ring = ring  # Every broadcast frame is also written there
+        # Games sharing a ring carry on from the previous one's seqs (the
+        # first frame is sequence 1)
+        self.ring_offset = 0 if ring is None or ring.latest is None else ring.latest
+        self.log = log  # Every tick's applied commands are also written there
+        self.sequence = 0
+        self.full_state_interval = full_state_interval  # Keyframe every N frames
+        self.last_frame = None
+        self.last_owners = None
+        self.owner_pixels = None  # Pixels of each owner id in last_owners, see new_names
+        self._keyframe_requested = True
+        self._keyframe = None  # Cached Update for the current sequence
+
+    def read_user_commands(self, limit: int | None = None) -> list[Command]:
+        """Drain the commands queued since the last tick, at most `limit` of
+        them. The rest stay queued, in order, for the next ticks.
+
+        With `clicks_per_user`, all queued commands are drained and coalesced
+        instead (see commands.coalesce): repeated clicks on a pixel and clicks
+        over a user's share are dropped, so a crowd can't get ahead of the
+        game. Those past `limit` go back to the front of the queue, users
+        still taking turns, for the next tick."""
+        if self.clicks_per_user is not None:
+            queued = [self.commands.popleft() for _ in range(len(self.commands))]
+            commands = coalesce(queued, self.clicks_per_user)
+            self.dropped_commands += len(queued) - len(commands)
+            if limit is not None:
+                self.commands.extendleft(reversed(commands[limit:]))
+                commands = commands[:limit]
+            return commands
+        count = len(self.commands)
+        if limit is not None:
+            count = min(limit, count)
+        return [self.commands.popleft() for _ in range(count)]
+
+    def execute_user_commands(self, commands: list[Command]):
+        """Hand the commands of a tick to the game as one batch."""
+        if not commands:
+            return
+        count = len(commands)
+        users = {}  # Name: index in the batch's names
+        self.game.click_batch(
+            np.fromiter((command.x for command in commands), np.intp, count),
+            np.fromiter((command.y for command in commands), np.intp, count),
+            np.fromiter((users.setdefault(command.user, len(users)) for command in commands), np.intp, count),
+            list(users),
         )
 
     def update_game_state(self):
         self.game.update()
 
+    def tick(self, max_commands: int | None = None):
+        """Apply queued commands, advance the game and broadcast it."""
+        commands = self.read_user_commands(max_commands)
+        if self.log is not None:
+            self.log.write(commands)
+        self.applied_commands += len(commands)
+        self.execute_user_commands(commands)
+        self.update_game_state()
+        self.broadcast_game_state()
+
     def game_over(self) -> bool:
         return self.game.finished
 
     def game_frame(self) -> np.ndarray:
-        return np.array(self.game.frame.convert("P")).flatten().tolist()
-
-    def owners(self) -> dict:
-        x_max = self.game.resolution[0]
-        owners_dict = {}
-        owners = self.game.owners_map
-        for (y, x), owner in owners.items():
-            owners_dict[y * x_max + x] = owner
-        return owners_dict
-
-    def get_pixel_updates(self) -> dict:
-        """Get only the pixels that have changed since last broadcast"""
-        # Check if game has changed_pixels tracking
-        if hasattr(self.game, 'get_changed_pixels'):
-            changed_indices = self.game.get_changed_pixels()
-            updates = {}
-            for idx in changed_indices:
-                updates[str(idx)] = self.game.pixels[idx].value
-            return updates
-        else:
-            # Fallback to full state if game doesn't support tracking
-            return None
+        """Flat palette indices, see CanvasApp.palette_frame."""
+        return self.game.palette_frame.ravel()
+
+    def owners(self) -> np.ndarray:
+        """Flat owner ids, see CanvasApp.owners_grid."""
+        return self.game.owners_grid.ravel()
+
+    def owner_dict(self, indices: np.ndarray, owners: np.ndarray) -> dict:
+        """Owner ids of the pixels at `indices`, None for no owner."""
+        return {
+            index: None if owner_id == NO_OWNER else owner_id
+            for index, owner_id in zip(indices.tolist(), owners[indices].tolist())
+        }
+
+    def new_names(self, lost: np.ndarray, gained: np.ndarray) -> dict:
+        """Names of the owners in `gained` owning no pixel of the last frame,
+        by id, counting the pixels of each owner: `lost` and `gained` are
+        the old and new owners of the pixels that changed owner. As every
+        owner new to the frame is named, clients can name all the owners of
+        the frame, whichever keyframe they started from."""
+        pixels = self.owner_pixels
+        owner_ids = np.unique(gained)
+        owner_ids = owner_ids[(pixels[owner_ids] == 0) & (owner_ids != NO_OWNER)]
+        np.subtract.at(pixels, lost, 1)
+        np.add.at(pixels, gained, 1)
+        names = self.game.owner_names
+        return {owner_id: names[owner_id] for owner_id in owner_ids.tolist()}
+
+    def get_pixel_updates(self, frame: np.ndarray) -> np.ndarray:
+        """Get indices of the pixels that have changed since last broadcast,
+        as tracked by the game if it does"""
+        changed = self.game.get_changed_pixels()
+        if changed is None:
+            changed = np.flatnonzero(frame != self.last_frame)
+        return changed
+
+    def get_owner_updates(self, owners: np.ndarray) -> tuple[dict, dict]:
+        """Get owners that changed since last broadcast, pixels that lost
+        their owner are mapped to None, and the names of the owners new to
+        the frame (see new_names)."""
+        changed = np.flatnonzero(owners != self.last_owners)
+        return self.owner_dict(changed, owners), self.new_names(self.last_owners[changed], owners[changed])
+
+    def request_keyframe(self):
+        """Make the next broadcast a full state instead of a delta."""
+        self._keyframe_requested = True
+
+    def keyframe(self) -> Update:
+        """Full state of the last broadcast frame. It's built (and encoded) at
+        most once per frame, no matter how many clients ask for it."""
+        if self._keyframe is None or self._keyframe.seq != self.sequence:
+            self._keyframe = Update(
+                FULL,
+                self.sequence,
+                self.game.resolution,
+                self.last_frame,
+                self.owner_dict(np.flatnonzero(self.last_owners != NO_OWNER), self.last_owners),
+                # Only the current owners, not everyone who ever owned a pixel
+                names={
+                    owner_id: self.game.owner_names[owner_id]
+                    for owner_id in np.flatnonzero(self.owner_pixels[:NO_OWNER]).tolist()
+                },
+            )
+        return self._keyframe
+
+    def record(self, frame: np.ndarray, owners: np.ndarray):
+        if self.ring is not None:
+            self.ring.write(self.ring_offset + self.sequence, frame, owners, self.game.owner_names)
 
     def broadcast_game_state(self):
-        # Always send full state for now
-        global CURRENT_GAME_STATE
-        
-        self.frame_count += 1
-        
-        # Always send full state
-        message_dict = {
-            "type": "full",
-            "pixels": self.game_frame(),
-            "owners": self.owners(),
-            "meta": {
-                "width": self.game.resolution[0],
-                "height": self.game.resolution[1]
-            }
-        }
-        self.first_broadcast = False
-        
-        message = json.dumps(message_dict)
-        CURRENT_GAME_STATE = message  # Store for new clients
-        if message_dict["type"] == "full":
-            LAST_FULL_STATE = message  # Store last full state
-        PUBSUB.publish(message)
-
-
-async def game_producer(game_class, game_name, framerate: float = 1):
-    """Starts the game and broadcasts it to the clients."""
-    logger.info("Broadcasting game...")
+        """Publish the current frame. A full state is sent every
+        `full_state_interval` messages (or when requested), otherwise only the
+        pixels and owners that changed since the previous frame. Frames
+        without changes are not broadcast at all."""
+        frame = self.game_frame()
+        owners = self.owners()
+        keyframe = (
+            self._keyframe_requested
+            or self.last_frame is None
+            or frame.shape != self.last_frame.shape
+            or self.sequence % self.full_state_interval == 0
+        )
+        if keyframe:
+            self.game.get_changed_pixels()  # Only reset the game's tracking
+            self.sequence += 1
+            self.last_frame, self.last_owners = frame, owners
+            self._keyframe_requested = False
+            self.owner_pixels = np.bincount(owners, minlength=NO_OWNER + 1)
+            self.record(frame, owners)
+            self.publish(self.keyframe(), keyframe=True)
+            return
+
+        changed = self.get_pixel_updates(frame)
+        owner_updates, names = self.get_owner_updates(owners)
+        self.last_frame, self.last_owners = frame, owners
+        if not len(changed) and not owner_updates:
+            return
+        self.sequence += 1
+        self.record(frame, owners)
+        self.publish(
+            Update(
+                DELTA,
+                self.sequence,
+                self.game.resolution,
+                frame[changed],
+                owner_updates,
+                indices=changed,
+                names=names,
+            ),
+            keyframe=False,
+        )
+
+
+def simulation(
+    commands: deque,
+    publish: Callable,
+    game_name: str,
+    framerate: float = 1,
+    keyframe_interval: int = 60,
+    max_commands: int | None = None,
+    tick_policy: str = TickScheduler.SKIP,
+    ring_size: int = 0,
+    clicks_per_user: int | None = None,
+    profile_dir: str = "profiles",
+    profile_ticks: int = 300,
+    profile_mode: str = profiler.SAMPLE,
+    snapshot_dir: str | None = None,
+    snapshot_interval: float = 60,
+    restore: bool = False,
+    seed: int | None = None,
+    log_dir: str | None = None,
+):
+    """Plays games one after the other, forever. Ticks run on a fixed schedule,
+    each applying at most `max_commands` queued commands (and `clicks_per_user`
+    commands per user, see GameManager.read_user_commands). Yields the delay
+    until the next tick is due, it's up to the caller to wait it out (see
+    executors). With `ring_size`, the last frames are also kept in shared
+    memory (see framering). Published updates carry the tick telemetry (see
+    metrics), published alone while the frame doesn't change. Ticks can be
+    profiled on demand, see profiler. With `snapshot_dir`, games are saved
+    every `snapshot_interval` seconds, and with `restore` the first game
+    continues from the latest snapshot (see snapshots). With `seed` or `log_dir` games are deterministic, the n-th
+    one seeded with `seed + n` (a random seed without), and with `log_dir`
+    the commands of each game are logged there to replay it (see
+    commandlog)."""
+    logger.info("Broadcasting %s...", game_name)
+    game_class = get_game_class(game_name)
     config = get_game_config(game_name)
-    while True:
-        logger.info("Game start")
-        game_instance = game_class(
-            width=config["width"],
-            height=config["height"],
-            framerate=framerate
+    scheduler = TickScheduler(framerate, policy=tick_policy)
+    report = TimedCall(lambda: logger.info("Ticks: %s", scheduler.stats()), 60)
+    telemetry = metrics.SimulationMetrics()
+    tick_profiler = profiler.TickProfiler(
+        game_name, profile_dir, capture_ticks=profile_ticks, mode=profile_mode
+    )
+    profiler.PROFILERS.append(tick_profiler)
+    profiler.install_signal_handlers()
+    logger.info("Send SIGUSR1 or SIGUSR2 to process %s to profile %s", os.getpid(), game_name)
+    snapshotter = None
+    if snapshot_dir:
+        snapshot_dir = os.path.join(snapshot_dir, game_name)
+        if snapshot_interval:
+            snapshotter = snapshots.Snapshotter(snapshot_dir, snapshot_interval)
+
+    metrics_published = time.monotonic()
+
+    def publish_with_metrics(update, keyframe):
+        nonlocal metrics_published
+        update.metrics = telemetry.snapshot()
+        metrics_published = time.monotonic()
+        publish(update, keyframe)
+    ring = None
+    if ring_size:
+        ring = FrameRing.create(
+            config["width"], config["height"], ring_size, name=f"canvas_{game_name}_{os.getpid()}"
         )
-        game_manager = GameManager(game_instance)
-        while not game_manager.game_over():
-            try:
-                while (command := game_manager.read_user_commands()) is not None:
-                    game_manager.execute_user_command(command)
-            except InternalError as exc:
-                logger.error(exc)
-            await asyncio.sleep(max(0.01, 1 / framerate - 0.03))
-            game_manager.update_game_state()
-            game_manager.broadcast_game_state()
+        logger.info("Frames of %s in shared memory %s", game_name, ring.name)
+    deterministic = seed is not None or bool(log_dir)
+    if deterministic:
+        commandlog.disable_clock()
+    if log_dir:
+        log_dir = os.path.join(log_dir, game_name)
+    log = None
+    try:
+        for game_number in itertools.count():
+            logger.info("Game start: %s", game_name)
+            seeded = contextlib.nullcontext()
+            if deterministic:
+                game_seed = random.getrandbits(32) if seed is None else seed + game_number
+                seeded = commandlog.SeededRandom(game_seed)
+            with seeded:
+                game_instance = game_class(
+                    width=config["width"],
+                    height=config["height"],
+                    framerate=framerate
+                )
+                restored = None
+                if restore:
+                    restore = False
+                    restored = restore_latest(game_instance, snapshot_dir)
+            if log_dir:
+                log_path = os.path.join(log_dir, f"{time.time_ns()}.log")
+                if restored:
+                    # Next to the log, the snapshotter prunes the original
+                    restored = snapshots.copy(restored, log_path[: -len(".log")] + ".snapshot")
+                log = commandlog.CommandLog(
+                    log_path,
+                    {
+                        "game": game_name,
+                        "resolution": [config["width"], config["height"]],
+                        "framerate": framerate,
+                        "seed": game_seed,
+                        "keyframe_interval": keyframe_interval,
+                        "snapshot": restored and os.path.basename(restored),  # Relative to the log
+                    },
+                )
+                logger.info("Logging the commands of %s to %s", game_name, log.path)
+            game_manager = GameManager(
+                game_instance,
+                commands,
+                publish_with_metrics,
+                full_state_interval=keyframe_interval,
+                ring=ring,
+                clicks_per_user=clicks_per_user,
+                log=log,
+            )
+            while not game_manager.game_over():
+                yield max(0.0, scheduler.next_delay())
+                scheduler.start_tick()
+                applied, dropped = game_manager.applied_commands, game_manager.dropped_commands
+                telemetry.queued = len(commands)
+                start = time.perf_counter()
+                with seeded:
+                    if tick_profiler.active:
+                        tick_profiler.tick(functools.partial(game_manager.tick, max_commands), game_manager)
+                    else:
+                        game_manager.tick(max_commands)
+                telemetry.tick_seconds.observe(time.perf_counter() - start)
+                telemetry.applied += game_manager.applied_commands - applied
+                telemetry.dropped += game_manager.dropped_commands - dropped
+                telemetry.overruns, telemetry.skipped = scheduler.overruns, scheduler.skipped
+                if time.monotonic() - metrics_published >= metrics.PUBLISH_INTERVAL:
+                    # Nothing published lately, metrics mustn't look stalled
+                    metrics_published = time.monotonic()
+                    publish(telemetry.snapshot(), False)
+                if snapshotter is not None:
+                    snapshotter.update(
+                        game_instance, game_manager.sequence, game_manager.last_frame, game_manager.last_owners
+                    )
+                report.update()
+            if log is not None:
+                log.close(game_manager.sequence, game_manager.last_frame)
+    finally:
+        if log is not None:
+            log.close(game_manager.sequence, game_manager.last_frame)
+        profiler.PROFILERS.remove(tick_profiler)
+        if snapshotter is not None:
+            snapshotter.close()
+        if ring is not None:
+            ring.close()
+
+
+def restore_latest(game: CanvasApp, directory: str | None) -> str | None:
+    """Continue the latest snapshot in `directory` on `game`, if possible.
+    Returns the snapshot restored."""
+    paths = snapshots.saved(directory) if directory else []
+    if not paths:
+        logger.warning("No snapshot to restore in %s", directory)
+        return None
+    start = time.perf_counter()
+    try:
+        snapshots.restore(game, snapshots.load(paths[-1]))
+    except (InterfaceError, ValueError, OSError, KeyError) as exc:
+        logger.error("Can't restore %s: %s", paths[-1], exc)
+        return None
+    logger.info("Restored %s in %.1f ms", paths[-1], (time.perf_counter() - start) * 1e3)
+    return paths[-1]
+
+
+def choose_executor(game_names, executor: str) -> str:
+    """`executor`, unless it would run several games drawing on the pygame
+    display in this process: they'd share it, so they get a process each."""
+    display_games = [name for name in game_names if GAME_CONFIG[name].get("pygame_display")]
+    if len(display_games) > 1 and executor != ProcessExecutor.name:
+        logger.warning("%s share the pygame display, running them with --executor process", ", ".join(display_games))
+        return ProcessExecutor.name
+    return executor
+
+
+def local_executor(executor: str, game_name: str, **options) -> Callable:
+    """Executor factory for a game simulated by this server, see GameRoom."""
+    simulation_ = functools.partial(simulation, game_name=game_name, **options)
+    return functools.partial(EXECUTORS[executor], simulation_)
+
+
+def make_ssl_context(certificates: tuple[str, str] | None):
+    """TLS context from (certificate, key) paths, None for unsecure sockets."""
+    if certificates is None:
+        return None
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(certificates[0], keyfile=certificates[1])
+    return ssl_context
+
+
+def serve(ws_address: str, ws_port: int, certificates=None, **kwargs):
+    """Websocket server for all ROOMS."""
+    # Updates are framed once for all connections, which rules out per-connection compression
+    return websockets.serve(  # type: ignore
+        handler,
+        ws_address,
+        ws_port,
+        ssl=make_ssl_context(certificates),
+        subprotocols=SUBPROTOCOLS,
+        compression=None,
+        process_request=process_request,
+        **kwargs,
+    )
+
 
+async def main(game_names, framerate: float, ws_port: int, ws_address: str, certificates=None, keyframe_interval: int = 60, max_lag: int = 100, max_commands: int | None = None, tick_policy: str = TickScheduler.SKIP, executor: str = InlineExecutor.name, workers: int = 0, ring_size: int = 0, clicks_per_user: int | None = None, metrics_port: int = 0, profile_dir: str = "profiles", profile_ticks: int = 300, profile_mode: str = profiler.SAMPLE, snapshot_dir: str | None = None, snapshot_interval: float = 60, restore: bool = False, seed: int | None = None, log_dir: str | None = None):
+    """Main function. Starts the websocket server and a room for every game. Serves continuously.
+    With `workers`, websockets are served by that many worker processes instead. With
+    `metrics_port`, metrics are served on that port of the loopback interface."""
+    executor = choose_executor(game_names, executor)
+    options = {
+        "framerate": framerate,
+        "keyframe_interval": keyframe_interval,
+        "max_commands": max_commands,
+        "tick_policy": tick_policy,
+        "ring_size": ring_size,
+        "clicks_per_user": clicks_per_user,
+        "profile_dir": profile_dir,
+        "profile_ticks": profile_ticks,
+        "profile_mode": profile_mode,
+        "snapshot_dir": snapshot_dir,
+        "snapshot_interval": snapshot_interval,
+        "restore": restore,
+        "seed": seed,
+        "log_dir": log_dir,
+    }
+    # For simulations in threads of this process, see profiler
+    profiler.install_signal_handlers()
+    if workers:
+        await simulate_for_workers(
+            game_names,
+            workers,
+            executor,
+            options,
+            (ws_address, ws_port, certificates, max_lag, keyframe_interval),
+            metrics_port,
+        )
+        return
+    for game_name in game_names:
+        ROOMS[game_name] = GameRoom(
+            game_name,
+            local_executor(executor, game_name, **options),
+            max_lag=max_lag,
+            keyframe_interval=keyframe_interval,
+        )
+    if metrics_port:
+        _metrics_server = await metrics.serve(
+            lambda: (sample for room in ROOMS.values() for sample in room.samples()),
+            "127.0.0.1",
+            metrics_port,
+        )
+    async with serve(ws_address, ws_port, certificates):
+        await asyncio.gather(*(room.run() for room in ROOMS.values()))
+
+
+async def simulate_for_workers(game_names, workers: int, executor: str, options: dict, worker_args: tuple, metrics_port: int = 0):
+    """Simulates the games in this process and serves them from `workers`
+    websocket worker processes sharing the listening port. Every update is
+    encoded and pickled once, then sent to all workers, which forward their
+    clients commands back through a shared queue. Only the simulation
+    metrics are served with `metrics_port`, connections are the workers'."""
+    context = multiprocessing.get_context("spawn")
+    commands = context.Queue()
+    connections = []
+    for index in range(workers):
+        receiver, sender = context.Pipe(duplex=False)
+        context.Process(
+            target=run_worker,
+            args=(receiver, commands, game_names, *worker_args),
+            name=f"worker-{index}",
+            daemon=True,
+        ).start()
+        receiver.close()
+        connections.append(sender)
+
+    simulation_metrics = {}
+
+    def publisher(game_name):
+        def publish(update, keyframe):
+            if isinstance(update, metrics.SimulationMetrics):
+                simulation_metrics[game_name] = update
+                return
+            simulation_metrics[game_name] = update.metrics
+            data = pickle.dumps((game_name, update.prepare(), keyframe))
+            for connection in list(connections):
+                try:
+                    connection.send_bytes(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    logger.error("Websocket worker exited")
+                    connections.remove(connection)
+
+        return publish
+
+    executors = {
+        game_name: local_executor(executor, game_name, **options)(publisher(game_name))
+        for game_name in game_names
+    }
 
+    def forward_commands():
+        # Submitting is thread safe for all executors
+        while True:
+            game_name, command = commands.get()
+            executors[game_name].submit(command)
+
+    threading.Thread(target=forward_commands, name="commands", daemon=True).start()
+    if metrics_port:
+        _metrics_server = await metrics.serve(
+            lambda: (
+                sample
+                for game_name, game_metrics in simulation_metrics.items()
+                if game_metrics is not None
+                for sample in game_metrics.samples({"game": game_name})
+            ),
+            "127.0.0.1",
+            metrics_port,
+        )
+    await asyncio.gather(*(executor.run() for executor in executors.values()))
 
-async def main(game_name, game_class, framerate: float, ws_port: int, ws_address: str, ssl_context=None):
-    """Main function. Starts the websocket server and the game producer. Serves continuously."""
-    async with websockets.serve(handler, ws_address, ws_port, ssl=ssl_context):  # type: ignore
-        await game_producer(game_class, game_name, framerate=framerate)
+
+def run_worker(updates, commands, game_names, ws_address, ws_port, certificates, max_lag, keyframe_interval):
+    """Websocket worker process entry point, see `simulate_for_workers`."""
+    asyncio.run(
+        serve_worker(updates, commands, game_names, ws_address, ws_port, certificates, max_lag, keyframe_interval)
+    )
+
+
+async def serve_worker(updates, commands, game_names, ws_address, ws_port, certificates, max_lag, keyframe_interval):
+    for game_name in game_names:
+        ROOMS[game_name] = GameRoom(
+            game_name,
+            functools.partial(RelayExecutor, game_name, commands),
+            max_lag=max_lag,
+            keyframe_interval=keyframe_interval,
+        )
+
+    async def receive_updates():
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                data = await loop.run_in_executor(None, updates.recv_bytes)
+            except EOFError:
+                logger.error("Simulation process exited")
+                return
+            game_name, update, keyframe = pickle.loads(data)
+            ROOMS[game_name].publish(update, keyframe)
+
+    async with serve(ws_address, ws_port, certificates, reuse_port=True):
+        await asyncio.wait(
+            [
+                asyncio.create_task(receive_updates()),
+                *(asyncio.create_task(room.run()) for room in ROOMS.values()),
+            ],
+            return_when=asyncio.FIRST_COMPLETED,
+        )
 
 
 def parse_args():
@@ -238,33 +768,160 @@ def parse_args():
     parser.add_argument(
         "-g",
         "--game",
-        type=str,
-        help="Game to run (invaders, place)",
-        default="invaders",
+        nargs="+",
+        choices=GAME_CONFIG,
+        help="Games to run, each served at /<game>. The first one is also served at /",
+        default=["invaders"],
+    )
+    parser.add_argument(
+        "-k",
+        "--keyframe-interval",
+        type=int,
+        help="Send a full state every N messages, deltas in between",
+        default=60,
+    )
+    parser.add_argument(
+        "-l",
+        "--max-lag",
+        type=int,
+        help="Drop clients that can't keep up for more than N updates in a row",
+        default=100,
+    )
+    parser.add_argument(
+        "-m",
+        "--max-commands",
+        type=int,
+        help="Commands applied per tick, the rest wait for the next ticks (or are dropped, see -c)",
+        default=1000,
+    )
+    parser.add_argument(
+        "-c",
+        "--clicks-per-user",
+        type=int,
+        help="Coalesce each tick's clicks: one per pixel, at most N per user (the rest are dropped), users taking turns. 0 to apply them all in order",
+        default=5,
+    )
+    parser.add_argument(
+        "-t",
+        "--tick-policy",
+        choices=TickScheduler.POLICIES,
+        help="Skip late ticks or run them back to back to catch up",
+        default=TickScheduler.SKIP,
+    )
+    parser.add_argument(
+        "-e",
+        "--executor",
+        choices=EXECUTORS,
+        help="Run the simulation on the event loop, or in a worker thread or process",
+        default=InlineExecutor.name,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Serve websockets from N worker processes sharing the port, the games run in the main process",
+        default=0,
+    )
+    parser.add_argument(
+        "-r",
+        "--ring-size",
+        type=int,
+        help="Keep the last N frames of each game in shared memory, for other processes to read",
+        default=0,
+    )
+    parser.add_argument(
+        "-M",
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics at http://127.0.0.1:N/metrics",
+        default=0,
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Where tick profiles are written, see profiler",
+        default="profiles",
+    )
+    parser.add_argument(
+        "--profile-ticks",
+        type=int,
+        help="Ticks captured on SIGUSR2",
+        default=300,
+    )
+    parser.add_argument(
+        "--profile-mode",
+        choices=profiler.MODES,
+        help="Capture stack samples (folded, for flamegraphs) or a cProfile dump",
+        default=profiler.SAMPLE,
+    )
+    parser.add_argument(
+        "--snapshot-dir",
+        help="Where games are snapshotted, see snapshots",
+        default="snapshots",
+    )
+    parser.add_argument(
+        "--snapshot-interval",
+        type=float,
+        help="Seconds between snapshots of each game, 0 to disable them",
+        default=60,
+    )
+    parser.add_argument(
+        "--restore",
+        action="store_true",
+        help="Continue each game from its latest snapshot",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Play deterministic games, the n-th one of each room seeded with SEED + n",
+    )
+    parser.add_argument(
+        "--command-log",
+        help="Play deterministic games and log their commands in this directory, see benchmarks.replay",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="Log messages of this level and above",
+        default="INFO",
     )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
+    os.environ["CANVAS_LOG_LEVEL"] = args.log_level
+    logger.setLevel(args.log_level)
     if not args.unsecure:
         # HTTPS/SSL setup
-        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        import os
-        SSL_CERT = os.environ.get("SSL_CERT_PATH", "cert.pem")
-        SSL_KEY = os.environ.get("SSL_KEY_PATH", "key.pem")
-        ssl_context.load_cert_chain(SSL_CERT, keyfile=SSL_KEY)
+        certificates = (
+            os.environ.get("SSL_CERT_PATH", "cert.pem"),
+            os.environ.get("SSL_KEY_PATH", "key.pem"),
+        )
     else:
-        ssl_context = None
-    # Dynamically get the game class
-    game_class = get_game_class(args.game)
+        certificates = None
     asyncio.run(
         main(
-            game_name=args.game,
-            game_class=game_class,
+            game_names=args.game,
             framerate=args.framerate,
             ws_port=args.port,
             ws_address=args.address,
-            ssl_context=ssl_context,
+            certificates=certificates,
+            keyframe_interval=args.keyframe_interval,
+            max_lag=args.max_lag,
+            max_commands=args.max_commands,
+            tick_policy=args.tick_policy,
+            executor=args.executor,
+            workers=args.workers,
+            ring_size=args.ring_size,
+            clicks_per_user=args.clicks_per_user or None,
+            metrics_port=args.metrics_port,
+            profile_dir=args.profile_dir,
+            profile_ticks=args.profile_ticks,
+            profile_mode=args.profile_mode,
+            snapshot_dir=args.snapshot_dir,
+            snapshot_interval=args.snapshot_interval,
+            restore=args.restore,
+            seed=args.seed,
+            log_dir=args.command_log,
         )
     )
@@ -1,6 +1,6 @@
 import './App.css';
 import { firebaseApp } from './Firebase';
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import Grid from './components/Grid';
 // import LogIn from './components/LogIn';
 import { getAuth, onAuthStateChanged } from 'firebase/auth';
@@ -14,6 +14,9 @@ function App() {
   const [gridSize, setGridSize] = useState({ width: 64, height: 64 });
   const [grid, setGrid] = useState(Array(64 * 64).fill(0));
   const [owners, setOwners] = useState(Array(64 * 64).fill(''));
+  const lastSeq = useRef(null);
+  // Owner names by id, each name is only sent once
+  const ownerNames = useRef({});
   const { sendMessage, readyState, getWebSocket } = useWebSocket(WS_URL, {
     onOpen: () => {
       console.log('WebSocket connection established!');
@@ -21,6 +24,30 @@ function App() {
     onMessage: (e) => {
       let msg = JSON.parse(e.data);
 
+      // Deltas only apply on top of the previous message, ask for a full
+      // state if one went missing and drop deltas until it arrives. Deltas
+      // already included in the last full state are ignored
+      if (
+        msg.type === 'delta' &&
+        lastSeq.current !== null &&
+        msg.seq <= lastSeq.current
+      ) {
+        return;
+      }
+      if (msg.type === 'delta' && msg.seq !== lastSeq.current + 1) {
+        if (lastSeq.current !== null) {
+          sendMessage(JSON.stringify({ type: 'keyframe' }));
+        }
+        lastSeq.current = null;
+        return;
+      }
+      lastSeq.current = msg.seq;
+      if (msg.type === 'full') {
+        ownerNames.current = {};
+      }
+      Object.assign(ownerNames.current, msg.names);
+      const ownerName = (id) => (id === null ? '' : ownerNames.current[id]);
+
       // Handle full messages (includes metadata on connection)
       if (msg.type === 'full') {
         // Update canvas size if metadata present
@@ -37,7 +64,7 @@ function App() {
           // Convert owners object to array by index
           const ownersArray = new Array(msg.pixels.length).fill('');
           Object.entries(msg.owners).forEach(([idx, owner]) => {
-            ownersArray[parseInt(idx)] = owner;
+            ownersArray[parseInt(idx)] = ownerName(owner);
           });
           setOwners(ownersArray);
         } else {
@@ -61,7 +88,7 @@ function App() {
           const newOwners = [...prevOwners];
           if (msg.owners) {
             Object.entries(msg.owners).forEach(([idx, owner]) => {
-              newOwners[parseInt(idx)] = owner;
+              newOwners[parseInt(idx)] = ownerName(owner);
             });
           }
           return newOwners;
@@ -1,3 +1,4 @@
+// Generated by `python -m games.palette` in backend/, don't edit
 const webSafeColors = [
     [0,0,0,255],
     [0,0,0,255],
@@ -104,7 +105,7 @@ const webSafeColors = [
     [102,153,102,255],
     [153,153,102,255],
     [204,153,102,255],
-    [255, 153, 102, 255],
+    [255,153,102,255],
     [0,204,102,255],
     [51,204,102,255],
     [102,204,102,255],
@@ -224,37 +225,37 @@ const webSafeColors = [
     [102,255,255,255],
     [153,255,255,255],
     [204,255,255,255],
-    [255, 255, 255, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-    [0, 0, 0, 255],
-]
+    [255,255,255,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+    [0,0,0,255],
+];
 
-export default webSafeColors;
\ No newline at end of file
+export default webSafeColors;
@@ -1,82 +1,448 @@
+"""Load and latency benchmark for the Canvas WebSocket server.
+
+Clients are spread over several processes, each running thousands of
+connections on its own event loop. Every second the processes report what
+their clients received, and the totals are printed. At the end a summary
+with percentiles is printed, and saved as JSON with --output:
+
+- click-to-visible latency: clicking clients stamp each click, and match it
+  against the first update that gives them ownership of the clicked pixel
+  (or, for games where a click owns something else, of any pixel: then all
+  the clicks pending are resolved).
+  Clicks not seen within --click-timeout seconds are counted as unseen
+- frames per second received by each client, and bytes per second overall
+- server stalls: the longest gap between two frames, per second, at the
+  median client. Ticks running late on the server show up there, and the
+  summary gives its correlation with the per-second latency p99. With
+  --metrics-url, the server's own tick overruns are scraped every second and
+  correlated with the latency p99 as well
+
+Only clicking clients decode messages, spectators just count them.
+"""
+import argparse
 import asyncio
-import websockets
 import json
+import multiprocessing
+import os
 import random
-import argparse
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from protocol import BINARY_SUBPROTOCOL, decode_binary  # noqa: E402 pylint:disable=wrong-import-position
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentiles(values) -> dict:
+    """p50/p95/p99 (and count, max) of `values`, None if there are none."""
+    if not len(values):
+        return None
+    values = np.asarray(values, dtype=float)
+    summary = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary["max"] = float(values.max())
+    summary["count"] = len(values)
+    return summary
+
+
+def scrape_overruns(url: str):
+    """Total tick overruns of all games served, from the server metrics."""
+    try:
+        with urllib.request.urlopen(url, timeout=0.5) as response:
+            text = response.read().decode()
+    except OSError:
+        return None
+    return sum(
+        float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines()
+        if line.startswith("canvas_tick_overruns_total")
+    )
+
+
+def correlation(first, second):
+    """Pearson correlation of two series, skipping seconds where either is
+    missing, None if it can't be told."""
+    first, second = np.array(first, dtype=float), np.array(second, dtype=float)
+    both = ~(np.isnan(first) | np.isnan(second))
+    if both.sum() <= 2 or not first[both].std() or not second[both].std():
+        return None
+    return float(np.corrcoef(first[both], second[both])[0, 1])
+
 
-async def connect_client(client_id, ops_per_second, canvas_width=64):
-    """Simulate a single WebSocket client connection that clicks random pixels"""
-    uri = "ws://localhost:8765/"
+def decode(message) -> dict:
+    """JSON or binary update, with integer keys as in decode_binary."""
+    if isinstance(message, bytes):
+        return decode_binary(message)
+    data = json.loads(message)
+    data["owners"] = {int(index): owner for index, owner in data["owners"].items()}
+    data["names"] = {int(owner_id): name for owner_id, name in (data.get("names") or {}).items()}
+    return data
+
+
+class Client:
+    """One connection and what it received in the current second."""
+
+    def __init__(self, client_id: int, clicking: bool) -> None:
+        self.user = f"LoadTestUser{client_id}"
+        self.clicking = clicking
+        self.frames = 0
+        self.bytes = 0
+        self.max_gap = 0.0
+        self.last_frame = None
+        # Clicking clients only
+        self.resolution = None
+        self.names = {}
+        self.owner_id = None
+        self.pending = {}  # Pixel index -> time the click was sent
+        self.latencies = []
+        self.unseen = 0
+
+    def receive(self, message, now: float) -> None:
+        self.frames += 1
+        self.bytes += len(message)
+        if self.last_frame is not None:
+            self.max_gap = max(self.max_gap, now - self.last_frame)
+        self.last_frame = now
+        if self.clicking:
+            self.match_clicks(decode(message), now)
+
+    def match_clicks(self, update: dict, now: float) -> None:
+        """Resolve the clicks this update shows the effect of."""
+        if update["type"] == "full":
+            meta = update["meta"]
+            self.resolution = meta["width"], meta["height"]
+            self.names = {}
+            self.owner_id = None
+        for owner_id, name in update["names"].items():
+            self.names[owner_id] = name
+            if name == self.user:
+                self.owner_id = owner_id
+        if update["type"] == "full" or self.owner_id is None or not self.pending:
+            return
+        owned = [index for index, owner_id in update["owners"].items() if owner_id == self.owner_id]
+        if not owned:
+            return
+        matched = [index for index in owned if index in self.pending]
+        if not matched:
+            # Clicks take effect elsewhere (e.g. on the Tetris piece), the ones
+            # sent so far were applied
+            matched = list(self.pending)
+        for index in matched:
+            self.latencies.append((now - self.pending.pop(index)) * 1e3)
+
+    def click(self, now: float):
+        """Message for a random click, None until the canvas size is known."""
+        if self.resolution is None:
+            return None
+        width, height = self.resolution
+        x, y = random.randrange(width), random.randrange(height)
+        self.pending[y * width + x] = now
+        return json.dumps({"x": x, "y": y, "user": self.user})
+
+    def expire(self, now: float, timeout: float) -> None:
+        for index, sent in list(self.pending.items()):
+            if now - sent > timeout:
+                del self.pending[index]
+                self.unseen += 1
+
+    def report(self) -> tuple:
+        """What was received since the last report, and reset."""
+        report = self.frames, self.bytes, self.max_gap, self.latencies, self.unseen
+        self.frames, self.bytes, self.max_gap, self.latencies, self.unseen = 0, 0, 0.0, [], 0
+        return report
+
+
+async def connect_client(client, ops_per_second, uri, subprotocols, stats, verbose):
+    """Keep a client connected, clicking if it does, until cancelled."""
     try:
-        async with websockets.connect(uri) as websocket:
-            print(f"Client {client_id} connected")
-            
-            # Send clicks at the specified rate
-            click_task = asyncio.create_task(send_random_clicks(websocket, client_id, ops_per_second, canvas_width))
-            
-            # Listen for messages
+        async with websockets.connect(
+            uri, subprotocols=subprotocols, max_size=None, compression=None, open_timeout=60
+        ) as websocket:
+            stats["connected"] += 1
+            click_task = None
+            if client.clicking:
+                click_task = asyncio.create_task(send_clicks(websocket, client, ops_per_second))
             try:
                 async for message in websocket:
-                    data = json.loads(message)
-                    # Silently receive updates, only log occasionally to avoid spam
-                    if client_id == 0:  # Only log from first client
-                        print(f"Received: pixels={len(data.get('pixels', []))}, owners={len(data.get('owners', {}))}")
-            except asyncio.CancelledError:
-                click_task.cancel()
-                raise
-    except Exception as e:
-        print(f"Client {client_id} error: {e}")
-
-async def send_random_clicks(websocket, client_id, ops_per_second, canvas_width):
-    """Send random clicks at the specified rate"""
-    interval = 1.0 / ops_per_second
+                    client.receive(message, time.perf_counter())
+            finally:
+                stats["connected"] -= 1
+                if click_task is not None:
+                    click_task.cancel()
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:  # pylint:disable=broad-except
+        stats["errors"] += 1
+        if verbose:
+            print(f"{client.user} error: {exc!r}")
+
+
+async def send_clicks(websocket, client, ops_per_second):
+    """Click at random, `ops_per_second` times a second on average."""
     while True:
-        try:
-            await asyncio.sleep(interval)
-            # Random pixel within canvas
-            x = random.randint(0, canvas_width - 1)
-            y = random.randint(0, canvas_width - 1)
-            user = f"LoadTestUser{client_id}"
-            
-            message = json.dumps({"x": x, "y": y, "user": user})
+        await asyncio.sleep(random.expovariate(ops_per_second))
+        message = client.click(time.perf_counter())
+        if message is not None:
             await websocket.send(message)
-            if client_id == 0:  # Only log from first client
-                print(f"Client {client_id} clicked: ({x}, {y})")
-        except Exception as e:
-            print(f"Client {client_id} click error: {e}")
-            break
-
-async def main(num_clients, ops_per_second, canvas_width):
-    """Create concurrent client connections"""
-    print(f"Starting {num_clients} load test clients, {ops_per_second} operations per second each...")
-    tasks = [connect_client(i, ops_per_second, canvas_width) for i in range(num_clients)]
+
+
+async def run_clients(first_id, num_clients, clickers, ops_per_second, uri, subprotocols, ramp, click_timeout, reports, verbose):
+    """Connect clients (over `ramp` seconds) and report every second."""
+    stats = {"connected": 0, "errors": 0}
+    clients = [
+        Client(client_id, clicking=client_id < clickers and ops_per_second > 0)
+        for client_id in range(first_id, first_id + num_clients)
+    ]
+    tasks = []
+    for client in clients:
+        tasks.append(asyncio.create_task(
+            connect_client(client, ops_per_second, uri, subprotocols, stats, verbose)
+        ))
+        if ramp:
+            await asyncio.sleep(ramp / num_clients)
+    while True:
+        await asyncio.sleep(1)
+        now = time.perf_counter()
+        frames, sizes, gaps, latencies, unseen = [], 0, [], [], 0
+        for client in clients:
+            client.expire(now, click_timeout)
+            client_frames, client_bytes, max_gap, client_latencies, client_unseen = client.report()
+            frames.append(client_frames)
+            sizes += client_bytes
+            if client.last_frame is not None:
+                # A client waiting for its next frame is stalled as well
+                gaps.append(max(max_gap, now - client.last_frame) * 1e3)
+            latencies.extend(client_latencies)
+            unseen += client_unseen
+        reports.put({
+            "first_id": first_id,
+            "frames": frames,
+            "bytes": sizes,
+            "gaps": gaps,
+            "latencies": latencies,
+            "unseen": unseen,
+            **stats,
+        })
+        stats["errors"] = 0
+
+
+def client_process(*args):
+    try:
+        import resource  # pylint:disable=import-outside-toplevel
+        _soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+    try:
+        asyncio.run(run_clients(*args))
+    except KeyboardInterrupt:
+        pass
+
+
+def summarize(options, seconds, timeline, frames, connected_seconds, latencies, unseen) -> dict:
+    """Machine readable results of the run."""
+    live = connected_seconds > 0
+    fps = frames[live] / connected_seconds[live]
+    total_bytes = sum(second["bytes"] for second in timeline)
+    total_frames = int(frames.sum())
+    gaps = [second["gap_ms"] for second in timeline]
+    p99 = [np.nan if second["latency_p99_ms"] is None else second["latency_p99_ms"] for second in timeline]
+    overruns = [np.nan if second.get("overruns") is None else second["overruns"] for second in timeline]
+    return {
+        "options": options,
+        "seconds": seconds,
+        "connected": max((second["connected"] for second in timeline), default=0),
+        "errors": sum(second["errors"] for second in timeline),
+        "messages_per_s": total_frames / seconds,
+        "bytes_per_s": total_bytes / seconds,
+        "client_fps": percentiles(fps),
+        "latency_ms": percentiles(latencies),
+        "clicks_unseen": unseen,
+        "stall_ms": percentiles(gaps),
+        "stall_latency_correlation": correlation(gaps, p99),
+        "overruns": int(np.nansum(overruns)) if not np.isnan(overruns).all() else None,
+        "overrun_latency_correlation": correlation(overruns, p99),
+        "timeline": timeline,
+    }
+
+
+def print_summary(summary: dict) -> None:
+    def line(name, values, unit):
+        if values is None:
+            return f"{name}: none"
+        return f"{name}: " + ", ".join(f"p{p} {values[f'p{p}']:.1f}" for p in PERCENTILES) + f" {unit} (max {values['max']:.1f})"
+
+    print(
+        f"{summary['connected']} clients over {summary['seconds']:.0f} s, {summary['errors']} errors: "
+        f"{summary['messages_per_s']:.0f} msg/s, {summary['bytes_per_s'] / 1e6:.2f} MB/s"
+    )
+    print(line("Frames per second per client", summary["client_fps"], "fps"))
+    print(line("Click to visible", summary["latency_ms"], "ms") + f", {summary['clicks_unseen']} unseen")
+    print(line("Longest frame gap per second", summary["stall_ms"], "ms"))
+    if summary["stall_latency_correlation"] is not None:
+        print(f"Correlation of frame gaps with latency p99: {summary['stall_latency_correlation']:.2f}")
+    if summary["overruns"] is not None:
+        print(f"Server tick overruns: {summary['overruns']}", end="")
+        if summary["overrun_latency_correlation"] is not None:
+            print(f", correlation with latency p99: {summary['overrun_latency_correlation']:.2f}", end="")
+        print()
+
+
+def main(num_clients, clickers, ops_per_second, uri, binary, processes, duration, ramp, click_timeout, output, verbose, metrics_url=None):
+    """Spread clients over several processes (a single one can't saturate a multi-worker server), print aggregate
+    throughput every second and a summary at the end"""
+    clickers = num_clients if clickers is None else min(clickers, num_clients)
+    print(
+        f"Starting {num_clients} load test clients ({clickers} clicking {ops_per_second} times per second) "
+        f"in {processes} processes..."
+    )
+    subprotocols = [BINARY_SUBPROTOCOL] if binary else None
+    reports = multiprocessing.Queue()
+    workers = []
+    for index in range(processes):
+        first_id = index * num_clients // processes
+        count = (index + 1) * num_clients // processes - first_id
+        worker = multiprocessing.Process(
+            target=client_process,
+            args=(first_id, count, clickers, ops_per_second, uri, subprotocols, ramp, click_timeout, reports, verbose),
+            daemon=True,
+        )
+        worker.start()
+        workers.append(worker)
+
+    frames = np.zeros(num_clients, dtype=np.int64)
+    connected_seconds = np.zeros(num_clients, dtype=np.int64)
+    latencies, timeline, unseen = [], [], 0
+    overruns = scrape_overruns(metrics_url) if metrics_url else None
+    start = time.time()
     try:
-        await asyncio.gather(*tasks)
+        while not duration or time.time() - start < duration:
+            second = {"connected": 0, "errors": 0, "bytes": 0, "frames": 0}
+            gaps, second_latencies = [], []
+            for _ in range(processes):
+                report = reports.get()
+                counts = np.array(report["frames"], dtype=np.int64)
+                first_id = report["first_id"]
+                frames[first_id : first_id + len(counts)] += counts
+                # Seconds since their first frame
+                connected_seconds[first_id : first_id + len(counts)] += frames[first_id : first_id + len(counts)] > 0
+                for key in ("connected", "errors", "bytes"):
+                    second[key] += report[key]
+                second["frames"] += int(counts.sum())
+                gaps.extend(report["gaps"])
+                second_latencies.extend(report["latencies"])
+                unseen += report["unseen"]
+            latencies.extend(second_latencies)
+            second["gap_ms"] = float(np.median(gaps)) if gaps else 0.0
+            second["latency_p99_ms"] = float(np.percentile(second_latencies, 99)) if second_latencies else None
+            if metrics_url:
+                previous, overruns = overruns, scrape_overruns(metrics_url)
+                second["overruns"] = None if None in (previous, overruns) else overruns - previous
+            timeline.append(second)
+            print(
+                f"{second['connected']} connected, {second['frames']} msg/s, {second['bytes'] / 1e6:.2f} MB/s, "
+                f"gap {second['gap_ms']:.0f} ms, latency p99 "
+                + (f"{second['latency_p99_ms']:.0f} ms" if second_latencies else "-")
+                + f", {second['errors']} errors"
+                + (f", {second['overruns']:.0f} overruns" if second.get("overruns") is not None else "")
+            )
     except KeyboardInterrupt:
         print("\nShutting down clients...")
-        for task in tasks:
-            task.cancel()
+    seconds = max(time.time() - start, 1e-9)
+    for worker in workers:
+        worker.terminate()
+
+    options = {
+        "clients": num_clients, "clickers": clickers, "ops_per_second": ops_per_second,
+        "url": uri, "binary": binary, "processes": processes,
+    }
+    summary = summarize(options, seconds, timeline, frames, connected_seconds, latencies, unseen)
+    print_summary(summary)
+    if output:
+        with open(output, "w", encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+    return summary
+
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Load test for Canvas WebSocket server")
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for Canvas WebSocket server")
     parser.add_argument(
         "-c", "--clients",
         type=int,
         default=100,
         help="Number of concurrent clients (default: 100)"
     )
+    parser.add_argument(
+        "-k", "--clickers",
+        type=int,
+        default=None,
+        help="How many of the clients click, the others only watch (default: all)"
+    )
     parser.add_argument(
         "-o", "--ops-per-second",
         type=float,
         default=1,
-        help="Operations (clicks) per second per client (default: 1)"
+        help="Operations (clicks) per second per clicking client, 0 for spectators only (default: 1)"
+    )
+    parser.add_argument(
+        "-u", "--url",
+        type=str,
+        default="ws://localhost:8765/",
+        help="Server URL, including the game path (default: ws://localhost:8765/)"
+    )
+    parser.add_argument(
+        "-b", "--binary",
+        action="store_true",
+        help=f"Ask for the binary protocol ({BINARY_SUBPROTOCOL}) instead of JSON"
     )
     parser.add_argument(
-        "-w", "--canvas-width",
+        "-p", "--processes",
         type=int,
-        default=64,
-        help="Canvas width/height (assumes square canvas) (default: 64)"
+        default=1,
+        help="Client processes to spread the clients over (default: 1)"
+    )
+    parser.add_argument(
+        "-d", "--duration",
+        type=float,
+        default=0,
+        help="Seconds to run for, 0 to run until interrupted (default: 0)"
     )
-    
+    parser.add_argument(
+        "-r", "--ramp",
+        type=float,
+        default=0,
+        help="Seconds over which each process opens its connections (default: 0, all at once)"
+    )
+    parser.add_argument(
+        "-t", "--click-timeout",
+        type=float,
+        default=5,
+        help="Seconds after which a click not visible yet is counted as unseen (default: 5)"
+    )
+    parser.add_argument(
+        "-s", "--output",
+        type=str,
+        default=None,
+        help="Save the summary, with the per second timeline, to this JSON file"
+    )
+    parser.add_argument(
+        "-m", "--metrics-url",
+        type=str,
+        default=None,
+        help="Server metrics to scrape tick overruns from, e.g. http://localhost:9100/metrics"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Log connection errors"
+    )
+
     args = parser.parse_args()
-    asyncio.run(main(args.clients, args.ops_per_second, args.canvas_width))
+    main(
+        args.clients, args.clickers, args.ops_per_second, args.url, args.binary, args.processes,
+        args.duration, args.ramp, args.click_timeout, args.output, args.verbose, args.metrics_url,
+    )